@@ -0,0 +1,80 @@
+"""
+Deterministic stand-ins for the LLM and TTS services used by the benchmarks.
+fake_llm answers the outline, storyboard and code prompts from a fixture file;
+FakeTTSGenerator writes a sine tone whose length follows the word count of each line.
+Both are module-level so render worker processes can unpickle them.
+"""
+
+import os
+import re
+import json
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from tts_audio import TTSGenerator
+
+# Set by run_e2e.py; an environment variable so spawned worker processes see it too
+FIXTURE_ENV = "CODE2VIDEO_BENCH_FIXTURE"
+WORDS_PER_SECOND = 2.5
+
+_TITLE_RE = re.compile(r"^- Title: (.+)$", re.MULTILINE)
+_FIXTURES: Dict[str, Dict[str, Any]] = {}
+
+
+def load_fixture(path: Optional[str] = None) -> Dict[str, Any]:
+    path = path or os.environ[FIXTURE_ENV]
+    if path not in _FIXTURES:
+        with open(path, "r", encoding="utf-8") as f:
+            _FIXTURES[path] = json.load(f)
+    return _FIXTURES[path]
+
+
+def _usage(prompt: str, answer: str) -> Dict[str, int]:
+    # Roughly four characters per token, stable across runs
+    prompt_tokens, completion_tokens = len(prompt) // 4, len(answer) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def fake_llm(prompt: str, max_tokens: int = 10000, **kwargs):
+    """Same (response, usage) contract as the request_*_token functions; the response is plain text"""
+    fixture = load_fixture()
+    if "storyboard script" in prompt:
+        answer = "```json\n" + json.dumps(fixture["storyboard"], ensure_ascii=False, indent=2) + "\n```"
+    elif "teaching outline" in prompt:
+        answer = "```json\n" + json.dumps(fixture["outline"], ensure_ascii=False, indent=2) + "\n```"
+    else:
+        match = _TITLE_RE.search(prompt)
+        sections = {s["title"]: s["id"] for s in fixture["storyboard"]["sections"]}
+        if not match or match.group(1).strip() not in sections:
+            raise ValueError("fake_llm: prompt matches no fixture section (fix loops need a real model)")
+        answer = "```python\n" + fixture["code"][sections[match.group(1).strip()]] + "\n```"
+    return answer, _usage(prompt, answer)
+
+
+class FakeTTSGenerator(TTSGenerator):
+    """TTSGenerator whose per-line synthesis is a local ffmpeg sine tone instead of an API call"""
+
+    def __init__(self, voice: str = "bench", speed: float = 1.0):
+        self.model = "fake-tts"
+        self.voice = voice
+        self.speed = speed
+        self.use_async = False
+        self.async_client = None
+        self._init_concurrency()
+
+    def generate_audio(self, text: str, output_path: str, voice: Optional[str] = None, speed: Optional[float] = None) -> str:
+        seconds = max(1.0, len(text.split()) / WORDS_PER_SECOND)
+        subprocess.run(
+            [
+                "ffmpeg", "-y", "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds:.2f}",
+                "-ac", "1", "-b:a", "64k", "-map_metadata", "-1", str(output_path),
+            ],
+            capture_output=True,
+            check=True,
+        )
+        return str(Path(output_path))
@@ -0,0 +1,278 @@
+"""
+Micro-benchmarks for the pure-Python helpers on the per-response / per-fix-loop path
+Each helper runs over realistic inputs at several sizes (LLM code responses up to ~40k
+tokens, long manim tracebacks) next to the implementation it replaced. Outputs must
+match exactly; timings show how per-call cost grows with the response size.
+
+    python benchmarks/micro_helpers.py                 # table of µs/call per size
+    python benchmarks/micro_helpers.py --json out.json
+"""
+
+import re
+import sys
+import json
+import timeit
+import argparse
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path[:0] = [str(BENCH_DIR.parent / "src"), str(BENCH_DIR.parent)]
+
+from prompts import base_class
+from utils import extract_json_from_markdown, fix_png_path, replace_base_class, topic_to_safe_name
+from scope_refine import GridPosition, GridPositionExtractor, ManimCodeErrorAnalyzer, ScopeRefineFixer
+
+# Approximate LLM response sizes in tokens (~4 characters per token)
+SIZES = (1_000, 10_000, 40_000)
+ASSETS_DIR = BENCH_DIR / "fixtures"
+
+
+# ---------------------------------------------------------------- inputs
+
+
+def make_code(tokens: int) -> str:
+    """A generated section scene of roughly the given size: grid placements, assets, lecture markers"""
+    blocks = []
+    i = 0
+    while sum(len(b) for b in blocks) < tokens * 4:
+        i += 1
+        blocks.append(
+            f"        # === Animation for Lecture Line {i} ===\n"
+            f"        self.play(self.lecture[{i % 6}].animate.set_color(\"#FFD580\"))\n"
+            f"        shape_{i} = Circle(radius=0.5, color=\"#9AD1FF\")\n"
+            f"        self.place_at_grid(shape_{i}, 'B{1 + i % 6}', scale_factor=0.8)\n"
+            f"        icon_{i} = ImageMobject(\"assets/icon/item_{i}.png\")\n"
+            f"        self.place_in_area(icon_{i}, 'C1', 'D{1 + i % 6}', scale_factor=0.6)\n"
+            f"        label_{i} = Text(\"step {i}: {{a, b}}\", font_size=24)\n"
+            f"        self.play(Create(shape_{i}), FadeIn(icon_{i}), Write(label_{i}))\n"
+            f"\n\n\n"
+            f"        self.wait(0.5)\n"
+        )
+    return (
+        "from manim import *\n\n"
+        "class TeachingScene(Scene):\n    pass\n\n"
+        "class Section1Scene(TeachingScene):\n    def construct(self):\n"
+        '        self.setup_layout("Title", ["line"])\n' + "".join(blocks)
+    )
+
+
+def make_code_response(tokens: int) -> str:
+    return "Here is the fixed code:\n\n```python\n" + make_code(tokens) + "```\n\nThe scene now places every object."
+
+
+def make_json_response(tokens: int) -> str:
+    """Storyboard JSON in a fence, preceded by prose and a non-JSON fence (braces everywhere)"""
+    sections = []
+    i = 0
+    while len(json.dumps(sections)) < tokens * 4:
+        i += 1
+        sections.append(
+            {
+                "id": f"section_{i}",
+                "title": f"Step {i}",
+                "lecture_lines": [f"Set {{x | x > {i}}} contains the values", "Compare them"],
+                "animations": [f"Draw braces {{ }} around item {i}", "[Asset: icons/arrow.png]"],
+            }
+        )
+    return (
+        "Sure! First, the shape of the data:\n```\nsections: list\n```\n"
+        "Here is the storyboard:\n```json\n" + json.dumps({"sections": sections}, indent=2) + "\n```\nDone."
+    )
+
+
+def make_traceback(tokens: int) -> str:
+    frames = []
+    i = 0
+    while sum(len(f) for f in frames) < tokens * 4:
+        i += 1
+        frames.append(
+            f'  File "/usr/lib/python3.11/site-packages/manim/mobject/module_{i}.py", line {100 + i}, in method_{i}\n'
+            f"    result = self.apply_function(lambda p: p + shift_{i}, about_point=ORIGIN)\n"
+        )
+    return (
+        "Traceback (most recent call last):\n"
+        '  File "/work/section_1.py", line 42, in construct\n'
+        "    self.play(Create(shape_4), FadeIn(icon_4))\n" + "".join(frames) + "AttributeError: 'Circle' object has no attribute 'get_grid'\n"
+    )
+
+
+# ---------------------------------------------------------------- reference implementations (before optimization)
+
+
+def reference_extract_json_from_markdown(text):
+    match = re.search(r"```(?:json)?\s*(\{.*?\})\s*```", text, re.DOTALL)
+    if match:
+        return match.group(1)
+    return text
+
+
+def reference_fix_png_path(code_str: str, assets_dir: Path) -> str:
+    assets_dir = Path(assets_dir).resolve()
+
+    def replacer(match):
+        original_path = match.group(1)
+        path_obj = Path(original_path)
+        if not path_obj.is_absolute():
+            return f'"{assets_dir / path_obj.name}"'
+        try:
+            if assets_dir not in path_obj.parents:
+                return f'"{assets_dir / path_obj.name}"'
+        except RuntimeError:
+            return f'"{assets_dir / path_obj.name}"'
+        return match.group(0)
+
+    return re.sub(r'["\']([^"\']+\.png)["\']', replacer, code_str)
+
+
+def reference_replace_base_class(code: str, new_class_def: str) -> str:
+    lines = code.splitlines(keepends=True)
+    class_start = None
+    for i, line in enumerate(lines):
+        if re.match(r"^\s*class\s+TeachingScene\s*\(Scene\)\s*:", line):
+            class_start = i
+            break
+    if class_start is not None:
+        base_indent = len(lines[class_start]) - len(lines[class_start].lstrip())
+        class_end = class_start + 1
+        while class_end < len(lines):
+            line = lines[class_end]
+            if line.strip() != "" and (len(line) - len(line.lstrip()) <= base_indent):
+                break
+            class_end += 1
+        return "".join(lines[:class_start]) + new_class_def.strip() + "\n\n" + "".join(lines[class_end:])
+    for i, line in enumerate(lines):
+        if re.match(r"^\s*class\s+\w+", line):
+            insert_pos = i
+            break
+    else:
+        insert_pos = 0
+    return "".join(lines[:insert_pos]) + new_class_def.strip() + "\n\n" + "".join(lines[insert_pos:])
+
+
+def reference_topic_to_safe_name(knowledge_point):
+    safe_name = re.sub(r"[^A-Za-z0-9 _\-\{\}\[\]\+&=π]", "", knowledge_point)
+    return re.sub(r"\s+", "_", safe_name.strip())
+
+
+def reference_clean_code_format(code: str):
+    if not code:
+        return None
+    if "```python" in code:
+        code = code.split("```python")[1].split("```")[0].strip()
+    elif "```" in code:
+        code = code.split("```")[1].strip()
+    cleaned_lines = []
+    prev_empty = False
+    for line in code.split("\n"):
+        if line.strip():
+            cleaned_lines.append(line)
+            prev_empty = False
+        elif not prev_empty:
+            cleaned_lines.append(line)
+            prev_empty = True
+    return "\n".join(cleaned_lines)
+
+
+class ReferenceErrorAnalyzer(ManimCodeErrorAnalyzer):
+    def _parse_error_message(self, error_msg: str) -> Dict:
+        result = {}
+        error_type_match = re.search(r"(\w+Error|\w+Exception)", error_msg)
+        if error_type_match:
+            result["error_type"] = error_type_match.group(1)
+        line_match = re.search(r"line (\d+)", error_msg)
+        if line_match:
+            result["line_number"] = int(line_match.group(1))
+        column_match = re.search(r"column (\d+)", error_msg)
+        if column_match:
+            result["column"] = int(column_match.group(1))
+        code_match = re.search(r'File ".*?", line \d+.*?\n\s*(.*)', error_msg)
+        if code_match:
+            result["problematic_code"] = code_match.group(1).strip()
+        return result
+
+    def _analyze_attribute_error(self, code: str, error_msg: str, error_info: Dict) -> Dict:
+        attr_match = re.search(r"'(\w+)' object has no attribute '(\w+)'", error_msg)
+        if attr_match:
+            obj_type, attr_name = attr_match.groups()
+            suggestion = self._get_attribute_suggestion(obj_type, attr_name)
+            if suggestion:
+                return {"fix_scope": "single_line", "suggested_fix": suggestion, "object_type": obj_type, "attribute_name": attr_name}
+        return {"fix_scope": "single_line"}
+
+
+class ReferenceGridExtractor(GridPositionExtractor):
+    def __init__(self):
+        self.grid_patterns = [p.pattern for p in GridPositionExtractor().grid_patterns]
+
+    def extract_grid_positions(self, code: str) -> List[GridPosition]:
+        positions = []
+        for line_num, line in enumerate(code.split("\n"), 1):
+            match = re.search(self.grid_patterns[0], line)
+            if match:
+                scale = float(match.group(3)) if match.group(3) else None
+                positions.append(
+                    GridPosition(match.group(1).strip(), "place_at_grid", match.group(2), scale, line_num, line.strip())
+                )
+            match = re.search(self.grid_patterns[1], line)
+            if match:
+                scale = float(match.group(4)) if match.group(4) else None
+                position = f"{match.group(2)}-{match.group(3)}"
+                positions.append(GridPosition(match.group(1).strip(), "place_in_area", position, scale, line_num, line.strip()))
+        return positions
+
+
+# ---------------------------------------------------------------- suite
+
+
+def cases(size: int) -> List[Tuple[str, Callable[[], object], Callable[[], object], Callable[[object, object], bool]]]:
+    """(name, current call, reference call, outputs-equal check)"""
+    code, response, storyboard, traceback = make_code(size), make_code_response(size), make_json_response(size), make_traceback(size)
+    fixer = ScopeRefineFixer(None, 10000)
+    analyzer, reference_analyzer = ManimCodeErrorAnalyzer(), ReferenceErrorAnalyzer()
+    extractor, reference_extractor = GridPositionExtractor(), ReferenceGridExtractor()
+    topic = ("Fourier  transform — π & {signals} [part 2]: ∑ " * max(1, size // 1000)).strip()
+    same = lambda a, b: a == b
+    return [
+        ("extract_json_from_markdown", lambda: extract_json_from_markdown(storyboard), lambda: reference_extract_json_from_markdown(storyboard), same),
+        ("replace_base_class", lambda: replace_base_class(code, base_class), lambda: reference_replace_base_class(code, base_class), same),
+        ("fix_png_path", lambda: fix_png_path(code, ASSETS_DIR), lambda: reference_fix_png_path(code, ASSETS_DIR), same),
+        ("_clean_code_format", lambda: fixer._clean_code_format(response), lambda: reference_clean_code_format(response), same),
+        ("analyze_error", lambda: analyzer.analyze_error(code, traceback), lambda: reference_analyzer.analyze_error(code, traceback), same),
+        ("extract_grid_positions", lambda: extractor.extract_grid_positions(code), lambda: reference_extractor.extract_grid_positions(code), same),
+        ("topic_to_safe_name", lambda: topic_to_safe_name(topic), lambda: reference_topic_to_safe_name(topic), same),
+    ]
+
+
+def best_us(func: Callable, number: int, repeat: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for per-response helper functions")
+    parser.add_argument("--number", type=int, default=20, help="calls per timing sample")
+    parser.add_argument("--repeat", type=int, default=5, help="timing samples; the best is reported")
+    parser.add_argument("--json", type=str, default="", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results, mismatches = [], []
+    print(f"{'helper':<28}{'tokens':>8}{'before µs':>14}{'after µs':>12}{'speedup':>10}")
+    for size in SIZES:
+        for name, current, reference, equal in cases(size):
+            if not equal(current(), reference()):
+                mismatches.append(f"{name} @ {size} tokens")
+            after = best_us(current, args.number, args.repeat)
+            before = best_us(reference, args.number, args.repeat)
+            results.append({"helper": name, "tokens": size, "before_us": round(before, 2), "after_us": round(after, 2)})
+            print(f"{name:<28}{size:>8,}{before:>14,.1f}{after:>12,.1f}{before / after:>9.1f}x")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    if mismatches:
+        print(f"\n❌ Output differs from the reference implementation: {', '.join(mismatches)}")
+        sys.exit(1)
+    print("\n✅ All helpers match their reference implementations")
+
+
+if __name__ == "__main__":
+    main()
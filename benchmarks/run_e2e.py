@@ -0,0 +1,225 @@
+"""
+End-to-end benchmark for TeachingVideoAgent
+Runs the full pipeline over the fixture topics in benchmarks/fixtures with the LLM and
+TTS replaced by deterministic local stand-ins (fake_services.py) and real Manim renders
+at one fixed quality, then records per-stage wall time, CPU seconds, peak RSS of the
+process tree (sampled per run), renders per minute and bytes written. Results are saved
+as JSON and compared against a baseline.
+
+    python benchmarks/run_e2e.py --save_baseline          # record a baseline on this machine
+    python benchmarks/run_e2e.py --repeat 3               # later: compare against it
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import statistics
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent
+sys.path[:0] = [str(REPO_ROOT / "src"), str(REPO_ROOT), str(BENCH_DIR)]
+
+FIXTURES_DIR = BENCH_DIR / "fixtures"
+RESULTS_DIR = BENCH_DIR / "results"
+# Scratch workdirs; each gets the CASES/, json_files/ and assets/ layout the agent expects
+RUNS_DIR = BENCH_DIR / ".runs"
+
+# Metrics compared against the baseline and whether a larger value is better
+COMPARED_METRICS = {
+    "wall_seconds": False,
+    "cpu_seconds": False,
+    "peak_rss_mb": False,
+    "bytes_written": False,
+    "renders_per_minute": True,
+}
+
+
+def _cpu_seconds() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _dir_bytes(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file() and not f.is_symlink())
+
+
+def _prepare_workdir(name: str) -> Path:
+    root = RUNS_DIR / name
+    shutil.rmtree(root, ignore_errors=True)
+    (root / "json_files").mkdir(parents=True)
+    (root / "json_files" / "long_video_ref_mapping.json").write_text("{}", encoding="utf-8")
+    (root / "assets" / "icon").mkdir(parents=True)
+    (root / "CASES").mkdir()
+    return root / "CASES"
+
+
+def run_fixture(fixture_path: Path, quality: str, use_tts: bool) -> Dict[str, Any]:
+    """One cold run of the whole pipeline for one fixture topic"""
+    from agent import RunConfig, TeachingVideoAgent, reset_render_pool
+    from capacity_planner import PeakRssSampler
+    from fake_services import FIXTURE_ENV, FakeTTSGenerator, fake_llm, load_fixture
+    from metrics import REGISTRY, RENDERS
+    from progress_events import STAGE_END
+    from render_scheduler import start_scheduler
+
+    os.environ[FIXTURE_ENV] = str(fixture_path)
+    fixture = load_fixture(str(fixture_path))
+    folder = _prepare_workdir(fixture_path.stem)
+
+    cfg = RunConfig(
+        api=fake_llm,
+        use_feedback=False,
+        use_assets=False,
+        use_tts=use_tts,
+        max_fix_bug_tries=1,
+        max_regenerate_tries=1,
+        draft_quality=quality,
+        final_quality=quality,
+        use_render_cache=False,
+    )
+    start_scheduler(cfg.scheduler_config())
+    stages: Dict[str, float] = {}
+
+    def on_event(event):
+        if event.kind == STAGE_END:
+            stages[event.stage] = stages.get(event.stage, 0.0) + event.duration_seconds
+
+    REGISTRY.drain()
+    cpu_start = _cpu_seconds()
+    wall_start = time.perf_counter()
+    # ru_maxrss is a lifetime high-water mark, so the peak is sampled per run: this process plus
+    # its render workers and their manim children, summed
+    with PeakRssSampler(os.getpid()) as sampler:
+        agent = TeachingVideoAgent(idx=0, knowledge_point=fixture["topic"], folder=folder, cfg=cfg, progress_callback=on_event)
+        if use_tts:
+            agent.tts_generator = FakeTTSGenerator()
+        video = agent.GENERATE_VIDEO()
+        # Shut the render pool down so its workers (and their manim children) are reaped into RUSAGE_CHILDREN
+        reset_render_pool(wait=True)
+    wall_seconds = time.perf_counter() - wall_start
+    cpu_end = _cpu_seconds()
+    peak_rss_mb = sampler.peak_bytes / (1024 * 1024)
+
+    renders = sum(value for name, values in REGISTRY.drain().items() if name == RENDERS.name for _, value in values)
+    render_seconds = stages.get("render", 0.0) + stages.get("finalize", 0.0)
+    return {
+        "success": bool(video),
+        "wall_seconds": round(wall_seconds, 3),
+        "cpu_seconds": round(cpu_end - cpu_start, 3),
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "renders": renders,
+        "renders_per_minute": round(renders / (render_seconds / 60), 2) if render_seconds else 0.0,
+        "bytes_written": _dir_bytes(agent.output_dir),
+        "tokens": agent.token_usage["total_tokens"],
+        "stages": {stage: round(seconds, 3) for stage, seconds in stages.items()},
+    }
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Median of every numeric metric across repeats"""
+    summary = {"success": all(r["success"] for r in runs), "runs": runs}
+    for key in ("wall_seconds", "cpu_seconds", "peak_rss_mb", "renders", "renders_per_minute", "bytes_written", "tokens"):
+        summary[key] = statistics.median(r[key] for r in runs)
+    stage_names = sorted({stage for r in runs for stage in r["stages"]})
+    summary["stages"] = {s: statistics.median(r["stages"].get(s, 0.0) for r in runs) for s in stage_names}
+    return summary
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Print a comparison table; returns the regressions beyond threshold (a fraction)"""
+    regressions = []
+    print(f"\n{'fixture':<22}{'metric':<26}{'baseline':>14}{'current':>14}{'change':>10}")
+    for name, result in current["fixtures"].items():
+        base = baseline.get("fixtures", {}).get(name)
+        if base is None:
+            print(f"{name:<22}(not in baseline)")
+            continue
+        rows = [(metric, base.get(metric), result.get(metric), higher) for metric, higher in COMPARED_METRICS.items()]
+        rows += [(f"stage:{s}", base["stages"].get(s), v, False) for s, v in result["stages"].items()]
+        for metric, old, new, higher_is_better in rows:
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > threshold:
+                flag = " ⚠️"
+                regressions.append(f"{name} {metric}: {old} -> {new} ({change:+.1%})")
+            print(f"{name:<22}{metric:<26}{old:>14,.2f}{new:>14,.2f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end Code2Video benchmark with fake LLM/TTS and real Manim")
+    parser.add_argument("--fixtures", nargs="*", default=None, help="fixture names (default: all in benchmarks/fixtures)")
+    parser.add_argument("--quality", type=str, default="low", help="render quality tier for every render")
+    parser.add_argument("--repeat", type=int, default=1, help="cold runs per fixture; medians are reported")
+    parser.add_argument("--no_tts", action="store_false", dest="use_tts", default=True)
+    parser.add_argument("--output", type=str, default=str(RESULTS_DIR / "latest.json"))
+    parser.add_argument("--baseline", type=str, default=str(RESULTS_DIR / "baseline.json"))
+    parser.add_argument("--save_baseline", action="store_true", help="also write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change reported as a regression")
+    parser.add_argument("--fail_on_regression", action="store_true", help="exit with status 1 on a regression")
+    args = parser.parse_args()
+
+    if not (REPO_ROOT / "src" / "api_config.json").exists():
+        # gpt_request reads it at import time; the benchmark never uses the keys
+        sys.exit("src/api_config.json is missing: copy src/api_config.json.template (placeholder keys are fine)")
+
+    names = args.fixtures or sorted(p.stem for p in FIXTURES_DIR.glob("*.json"))
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "quality": args.quality,
+        "use_tts": args.use_tts,
+        "repeat": args.repeat,
+        "fixtures": {},
+    }
+    for name in names:
+        runs = []
+        for i in range(args.repeat):
+            print(f"\n⏱️ {name} run {i + 1}/{args.repeat}")
+            runs.append(run_fixture(FIXTURES_DIR / f"{name}.json", args.quality, args.use_tts))
+        results["fixtures"][name] = summarize(runs)
+        summary = results["fixtures"][name]
+        print(
+            f"📊 {name}: {summary['wall_seconds']:.1f}s wall, {summary['cpu_seconds']:.1f}s CPU, "
+            f"{summary['peak_rss_mb']:.0f} MB peak, {summary['renders_per_minute']:.1f} renders/min"
+        )
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    Path(args.output).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"\n💾 Results written to {args.output}")
+    if args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"💾 Baseline saved to {args.baseline}")
+        return
+
+    if Path(args.baseline).exists():
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        if baseline.get("quality") != args.quality or baseline.get("use_tts") != args.use_tts:
+            print("⚠️ Baseline was recorded with different quality/TTS settings")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n⚠️ {len(regressions)} regressions beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"   {line}")
+            if args.fail_on_regression:
+                sys.exit(1)
+        else:
+            print(f"\n✅ No regressions beyond {args.threshold:.0%}")
+    else:
+        print(f"ℹ️ No baseline at {args.baseline}; run with --save_baseline to create one")
+
+
+if __name__ == "__main__":
+    main()
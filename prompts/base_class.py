@@ -28,6 +28,17 @@ class TeachingScene(Scene):
         mobject.move_to(self.grid[grid_pos])
         return mobject
 
+    def sync_to_line(self, line_number):
+        # Wait until the narration of lecture line N (and the pause after it) has ended.
+        # LINE_DURATIONS is written into the scene file from the measured TTS audio; without it this does nothing
+        durations = globals().get("LINE_DURATIONS")
+        elapsed = getattr(self.renderer, "time", None)
+        if not durations or elapsed is None:
+            return
+        remaining = sum(durations[:line_number]) - elapsed
+        if remaining > 1 / config.frame_rate:
+            self.wait(remaining)
+
     def place_in_area(self, mobject, top_left, bottom_right, scale_factor=1.0):
         tl_pos = self.grid[top_left]
         br_pos = self.grid[bottom_right]
@@ -1,7 +1,13 @@
 import os
 
 
-def get_prompt3_code(regenerate_note, section, base_class):
+def get_prompt3_code(regenerate_note, section, base_class, line_durations=None):
+    narration_timing = ""
+    if line_durations:
+        timing = "; ".join(f"Line {i}: {seconds:.1f}s" for i, seconds in enumerate(line_durations, 1))
+        narration_timing = f"""
+- Narration Timing: {timing}
+  Each lecture line is narrated for the time given. Keep the total run_time of a line's animations within it, and end the block of line N with self.sync_to_line(N), which pads with a wait until that line's narration ends. Do not add self.wait() calls for timing."""
     return f"""
 You are an expert Manim animator using Manim Community Edition v0.19.0. 
 Please generate a high-quality Manim class based on the following teaching script.
@@ -34,7 +40,7 @@ lecture |  A1  A2  A3  A4  A5  A6
 4. TEACHING CONTENT:
 - Title: {section.title}
 - Lecture Lines: {section.lecture_lines}
-- Animation Description: {'; '.join(section.animations)}
+- Animation Description: {'; '.join(section.animations)}{narration_timing}
 
 5. STRUCTURE FOR CODE:
 Use the following comment format to indicate which block corresponds to which line:
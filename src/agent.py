@@ -4,18 +4,51 @@ import argparse
 import json
 import time
 import random
+import threading
 import subprocess
 from typing import List, Dict, Any, Optional, Tuple, Callable
 from dataclasses import dataclass, field
 from pathlib import Path
-from concurrent.futures import ProcessPoolExecutor, as_completed, ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures import wait as wait_futures
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 
 from gpt_request import *
 from prompts import *
 from utils import *
 from scope_refine import *
 from external_assets import process_storyboard_with_assets
-from tts_audio import TTSGenerator, merge_video_audio, get_audio_duration, get_video_duration
+from tts_audio import (
+    LINE_PAUSE_SECONDS,
+    SECTION_AUDIO_SUFFIX,
+    TTSGenerator,
+    merge_video_audio,
+    get_audio_duration,
+    get_video_duration,
+)
+from media_probe import media_durations
+from incremental_render import IncrementalRenderer, QUALITY_TIERS, get_render_quality
+from content_cache import ContentCache, DEFAULT_CACHE_ROOT, hash_parts
+from run_manifest import RunManifest, atomic_write_json, atomic_write_text
+from render_scheduler import SchedulerConfig, start_scheduler
+from render_farm import RemoteRenderer
+from hls_stream import HlsPlaylist, HLS_DIRNAME
+from cancellation import CANCEL_MARKER, CancellationToken, TaskCancelled
+from metrics import REGISTRY, RENDERS, STAGE_SECONDS, TTS_SECONDS_SAVED, MetricsFileExporter, reset_worker_metrics
+import tracing
+from tracing import Trace, TRACE_FILENAME, span
+from progress_events import (
+    ProgressBus,
+    ProgressCallback,
+    ProgressEvent,
+    SECTION_READY,
+    SECTION_RENDERED,
+    STAGE_END,
+    STAGE_START,
+    STREAM_UPDATED,
+    TOKENS_USED,
+)
 
 
 @dataclass
@@ -24,6 +57,8 @@ class Section:
     title: str
     lecture_lines: List[str]
     animations: List[str]
+    # Seconds from the start of each line's narration to the start of the next (measured TTS audio)
+    line_durations: List[float] = field(default_factory=list)
 
 
 @dataclass
@@ -54,11 +89,100 @@ class RunConfig:
     tts_voice: str = "nova"  # alloy, echo, fable, onyx, nova, shimmer
     tts_model: str = "tts-1"  # tts-1 or tts-1-hd
     tts_speed: float = 1.0  # 0.25 to 4.0
+    # TTS requests in flight across all sections of a topic, request starts per minute (0 = unlimited),
+    # and whether lines are synthesized with the asyncio client instead of a thread pool
+    tts_concurrency: int = 4
+    tts_requests_per_minute: float = 0
+    tts_async: bool = False
+    # Cross-run cache of line audio keyed by text, voice, model and speed (empty dir -> CACHE/tts next to agent.py)
+    use_tts_cache: bool = True
+    tts_cache_dir: str = ""
+    tts_cache_max_mb: int = 1024
     max_code_token_length: int = 10000
     max_fix_bug_tries: int = 10
     max_regenerate_tries: int = 10
     max_feedback_gen_code_tries: int = 3
     max_mllm_fix_bugs_tries: int = 3
+    # Render quality tiers: fix loops and feedback iterate on draft_quality,
+    # accepted code is re-rendered once at final_quality (skipped when both are equal)
+    draft_quality: str = "draft"
+    final_quality: str = "low"
+    # Cross-run render cache shared by all topics (empty dir -> CACHE/renders next to agent.py)
+    use_render_cache: bool = True
+    render_cache_dir: str = ""
+    render_cache_max_mb: int = 5120
+    # Render on a render_farm.py coordinator instead of locally (empty -> local)
+    render_farm_url: str = ""
+    render_farm_token: str = ""
+    # Node-wide render scheduler shared by all topics (0 slots -> capacity plan for draft_quality)
+    render_slots: int = 0
+    render_max_cpu_percent: float = 85.0
+    render_min_free_mb: int = 1024
+    # Finalize, narrate and mux each section as soon as its draft render is accepted,
+    # instead of waiting for every section (delivery_workers sections at a time)
+    progressive_delivery: bool = True
+    delivery_workers: int = 2
+    # Also publish section clips as an HLS/fMP4 EVENT playlist in <output_dir>/hls
+    hls_output: bool = False
+    # Per-topic budgets (0 = unlimited): the run is cancelled once either is exceeded
+    max_wall_seconds: float = 0
+    max_total_tokens: int = 0
+    # Write a Chrome trace of LLM calls, renders, ffmpeg/TTS calls and file writes to <output_dir>/trace.json
+    trace: bool = False
+
+    def result_inputs(self) -> str:
+        """Hash of the settings that shape the final video, stored on the manifest's merge record"""
+        narration = (self.tts_voice, self.tts_model, self.tts_speed) if self.use_tts else ()
+        return hash_parts(
+            "result",
+            getattr(self.api, "__name__", ""),
+            self.use_feedback,
+            self.feedback_rounds,
+            self.use_assets,
+            self.use_tts,
+            *narration,
+            self.draft_quality,
+            self.final_quality,
+        )
+
+    def scheduler_config(self) -> SchedulerConfig:
+        return SchedulerConfig(
+            max_slots=self.render_slots,
+            quality=self.draft_quality,
+            max_cpu_percent=self.render_max_cpu_percent,
+            min_free_mb=self.render_min_free_mb,
+        )
+
+
+@dataclass
+class SectionRenderJob:
+    """Everything a render worker needs for one section, cheap to pickle (no agent instance)"""
+
+    section: Section
+    code: str
+    learning_topic: str
+    output_dir: str
+    cfg: RunConfig
+    manim_path: str
+    grid_img_path: str
+    # The topic's cancellation marker and this section's share of the remaining token budget (0 = unlimited)
+    cancel_marker: str = ""
+    max_tokens: int = 0
+    # Span the worker's spans are parented to (None = tracing off)
+    trace_parent: Optional[Tuple[str, int, int]] = None
+
+
+@dataclass
+class SectionRenderResult:
+    section_id: str
+    success: bool
+    video_path: Optional[str] = None
+    code: Optional[str] = None
+    setup_seconds: float = 0.0
+    token_usage: Dict[str, int] = field(default_factory=dict)
+    # Counters and histograms recorded in the worker process, merged into the parent's registry
+    metrics: Dict[str, Any] = field(default_factory=dict)
+    trace_events: List[Dict[str, Any]] = field(default_factory=list)
 
 
 class TeachingVideoAgent:
@@ -69,29 +193,14 @@ class TeachingVideoAgent:
         folder="CASES",
         cfg: Optional[RunConfig] = None,
         manim_path: Optional[str] = None,
+        progress_callback: Optional[ProgressCallback] = None,
+        cancel_token: Optional[CancellationToken] = None,
     ):
+        construction_start = time.perf_counter()
         """1. Global parameter"""
         self.learning_topic = knowledge_point
         self.idx = idx
-        self.cfg = cfg
-
-        self.use_feedback = cfg.use_feedback
-        self.use_assets = cfg.use_assets
-        self.use_tts = cfg.use_tts
-        self.API = cfg.api
-        self.feedback_rounds = cfg.feedback_rounds
-        self.iconfinder_api_key = cfg.iconfinder_api_key
-        self.max_code_token_length = cfg.max_code_token_length
-        self.max_fix_bug_tries = cfg.max_fix_bug_tries
-        self.max_regenerate_tries = cfg.max_regenerate_tries
-        self.max_feedback_gen_code_tries = cfg.max_feedback_gen_code_tries
-        self.max_mllm_fix_bugs_tries = cfg.max_mllm_fix_bugs_tries
-        
-        # TTS configuration
-        self.tts_voice = cfg.tts_voice
-        self.tts_model = cfg.tts_model
-        self.tts_speed = cfg.tts_speed
-        self.tts_generator = None  # Lazy initialization
+        self._apply_config(cfg)
 
         # Manim path - use provided path or calculate from current Python executable
         # This is important for ProcessPoolExecutor where sys.executable may differ
@@ -106,6 +215,13 @@ class TeachingVideoAgent:
         self.folder = folder
         self.output_dir = get_output_dir(idx=idx, knowledge_point=self.learning_topic, base_dir=folder)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest = RunManifest(self.output_dir)
+        # Checked between steps; also visible to render workers through a marker file in output_dir
+        self.cancel_token = cancel_token or CancellationToken()
+        self.cancel_token.attach_marker(self.output_dir / CANCEL_MARKER)
+        self.cancel_token.start_budget(self.cfg.max_wall_seconds, self.cfg.max_total_tokens)
+        self.hls = HlsPlaylist(self.output_dir / HLS_DIRNAME) if self.cfg.hls_output else None
+        self.trace = Trace(self.output_dir / TRACE_FILENAME) if self.cfg.trace else None
 
         self.assets_dir = Path(*self.output_dir.parts[: self.output_dir.parts.index("CASES")]) / "assets" / "icon"
         self.assets_dir.mkdir(exist_ok=True)
@@ -113,6 +229,8 @@ class TeachingVideoAgent:
         """3. ScopeRefine & Anchor Visual"""
         self.scope_refine_fixer = ScopeRefineFixer(self.API, self.max_code_token_length)
         self.extractor = GridPositionExtractor()
+        self.render_cache = build_render_cache(cfg)
+        self.incremental_renderer = self._make_renderer(self.draft_quality)
 
         """4. External Database"""
         knowledge_ref_mapping_path = (
@@ -125,6 +243,35 @@ class TeachingVideoAgent:
         )
         self.GRID_IMG_PATH = self.knowledge_ref_img_folder / "GRID.png"
 
+        self._init_run_state()
+        if progress_callback is not None:
+            self.events.subscribe(progress_callback)
+        # What every render worker paid per section before jobs rebuilt only a minimal agent
+        self.construction_seconds = time.perf_counter() - construction_start
+
+    def _apply_config(self, cfg: RunConfig):
+        self.cfg = cfg
+        self.use_feedback = cfg.use_feedback
+        self.use_assets = cfg.use_assets
+        self.use_tts = cfg.use_tts
+        self.API = cfg.api
+        self.feedback_rounds = cfg.feedback_rounds
+        self.iconfinder_api_key = cfg.iconfinder_api_key
+        self.max_code_token_length = cfg.max_code_token_length
+        self.max_fix_bug_tries = cfg.max_fix_bug_tries
+        self.max_regenerate_tries = cfg.max_regenerate_tries
+        self.max_feedback_gen_code_tries = cfg.max_feedback_gen_code_tries
+        self.max_mllm_fix_bugs_tries = cfg.max_mllm_fix_bugs_tries
+        self.draft_quality = cfg.draft_quality
+        self.final_quality = cfg.final_quality
+
+        # TTS configuration
+        self.tts_voice = cfg.tts_voice
+        self.tts_model = cfg.tts_model
+        self.tts_speed = cfg.tts_speed
+        self.tts_generator = None  # Lazy initialization
+
+    def _init_run_state(self):
         """5. Data structure"""
         self.outline = None
         self.enhanced_storyboard = None
@@ -132,38 +279,131 @@ class TeachingVideoAgent:
         self.section_codes = {}
         self.section_videos = {}
         self.section_audios = {}  # TTS audio files for each section
+        self.section_clips = {}  # Deliverable clip (final quality + narration) for each section
         self.video_feedbacks = {}
+        self._delivery_pool = None
+        self._deliveries = []
+        self._final_renderer = None
 
         """6. For Efficiency"""
         self.token_usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
 
+        """7. Progress events (stage start/end, section rendered, tokens used)"""
+        self.events = ProgressBus()
+
+    @contextmanager
+    def _stage(self, stage: str):
+        self.cancel_token.check()
+        start = time.time()
+        self.events.emit(ProgressEvent(STAGE_START, stage=stage))
+        ok = False
+        try:
+            with span(stage):
+                yield
+            ok = True
+        finally:
+            duration = time.time() - start
+            STAGE_SECONDS.observe(duration, stage=stage)
+            self.events.emit(ProgressEvent(STAGE_END, stage=stage, ok=ok, duration_seconds=duration))
+
+    def _count_render(self, quality: str, outcome):
+        """Render outcome metric; failures are labelled with ScopeRefineFixer's error category"""
+        if outcome.returncode == 0 and outcome.video_path:
+            RENDERS.inc(quality=quality, result="success", category="")
+        else:
+            if outcome.infrastructure_error:
+                category = "infrastructure"
+            else:
+                category = self.scope_refine_fixer.classify_error(outcome.stderr or "")[1]
+            RENDERS.inc(quality=quality, result="failure", category=category)
+
+    def _add_token_usage(self, usage: Dict[str, int]):
+        self.token_usage["prompt_tokens"] += usage.get("prompt_tokens", 0)
+        self.token_usage["completion_tokens"] += usage.get("completion_tokens", 0)
+        self.token_usage["total_tokens"] += usage.get("total_tokens", 0)
+        self.events.emit(ProgressEvent(TOKENS_USED, tokens=dict(self.token_usage)))
+        self.cancel_token.charge_tokens(self.token_usage["total_tokens"])
+
+    def _make_renderer(self, quality: str):
+        """Local incremental renderer, or the render farm (falling back to local) when one is configured"""
+        local = IncrementalRenderer(
+            self.manim_path,
+            self.output_dir,
+            get_render_quality(quality),
+            render_cache=self.render_cache,
+            cancel_token=self.cancel_token,
+        )
+        if self.cfg.render_farm_url:
+            return RemoteRenderer(
+                self.cfg.render_farm_url,
+                self.output_dir,
+                quality,
+                token=self.cfg.render_farm_token,
+                cancel_token=self.cancel_token,
+                fallback=local,
+            )
+        return local
+
+    @classmethod
+    def from_render_job(cls, job: SectionRenderJob, shared: Dict[str, Any]) -> "TeachingVideoAgent":
+        """Minimal agent for one section inside a render worker: no directory setup, JSON reads or fixer rebuilds"""
+        agent = cls.__new__(cls)
+        agent.learning_topic = job.learning_topic
+        agent._apply_config(job.cfg)
+        agent.manim_path = job.manim_path
+        agent.output_dir = Path(job.output_dir)
+        agent.GRID_IMG_PATH = Path(job.grid_img_path)
+        agent.manifest = None  # only the topic's parent process writes the manifest
+        agent.hls = None
+        agent.trace = None
+        agent.cancel_token = CancellationToken(job.cancel_marker or None, max_tokens=job.max_tokens)
+        agent.scope_refine_fixer = shared["scope_refine_fixer"]
+        agent.extractor = shared["extractor"]
+        agent.render_cache = shared["render_cache"]
+        agent.incremental_renderer = agent._make_renderer(agent.draft_quality)
+        agent._init_run_state()
+        if job.code:
+            agent.section_codes[job.section.id] = job.code
+        return agent
+
     def _request_api_and_track_tokens(self, prompt, max_tokens=10000):
         """packages API requests and automatically accumulates token usage"""
+        self.cancel_token.check()
         response, usage = self.API(prompt, max_tokens=max_tokens)
         if usage:
-            self.token_usage["prompt_tokens"] += usage.get("prompt_tokens", 0)
-            self.token_usage["completion_tokens"] += usage.get("completion_tokens", 0)
-            self.token_usage["total_tokens"] += usage.get("total_tokens", 0)
+            self._add_token_usage(usage)
         return response
 
     def _request_video_api_and_track_tokens(self, prompt, video_path):
         """Wraps video API requests and accumulates token usage automatically"""
+        self.cancel_token.check()
         response, usage = request_gemini_video_img(prompt=prompt, video_path=video_path, image_path=self.GRID_IMG_PATH)
 
         if usage:
-            self.token_usage["prompt_tokens"] += usage.get("prompt_tokens", 0)
-            self.token_usage["completion_tokens"] += usage.get("completion_tokens", 0)
-            self.token_usage["total_tokens"] += usage.get("total_tokens", 0)
+            self._add_token_usage(usage)
         return response
 
-    def get_serializable_state(self):
-        """Returns serializable Agent state for saving"""
-        return {"idx": self.idx, "knowledge_point": self.learning_topic, "folder": self.folder, "cfg": self.cfg, "manim_path": self.manim_path}
+    def _stage_fresh(self, stage: str, inputs_hash: str, *legacy_files: Path) -> bool:
+        """Manifest freshness check; folders created before manifests existed fall back to file existence"""
+        if self.manifest.is_fresh(stage, inputs_hash):
+            return True
+        return self.manifest.legacy and bool(legacy_files) and all(Path(p).exists() for p in legacy_files)
+
+    def _section_inputs(self, section: Section) -> str:
+        # Untimed sections hash as before line_durations existed, so earlier runs stay fresh
+        data = {k: v for k, v in section.__dict__.items() if k != "line_durations" or v}
+        return hash_parts("section", json.dumps(data, ensure_ascii=False, sort_keys=True))
+
+    def _render_inputs(self, section: Section) -> str:
+        return hash_parts(
+            "render", self._section_inputs(section), self.draft_quality, self.use_feedback, self.feedback_rounds
+        )
 
     def generate_outline(self) -> TeachingOutline:
         outline_file = self.output_dir / "outline.json"
+        outline_inputs = hash_parts("outline", self.learning_topic)
 
-        if outline_file.exists():
+        if self._stage_fresh("outline", outline_inputs, outline_file):
             print("📂 ...")
             with open(outline_file, "r", encoding="utf-8") as f:
                 outline_data = json.load(f)
@@ -196,8 +436,8 @@ class TeachingVideoAgent:
                 content = extract_json_from_markdown(content)
                 try:
                     outline_data = json.loads(content)
-                    with open(self.output_dir / "outline.json", "w", encoding="utf-8") as f:
-                        json.dump(outline_data, f, ensure_ascii=False, indent=2)
+                    atomic_write_json(outline_file, outline_data)
+                    self.manifest.record("outline", outline_inputs, {"outline": outline_file})
                     break
                 except json.JSONDecodeError:
                     print(f"⚠️ Outline format invalid on attempt {attempt}, retrying...")
@@ -220,18 +460,12 @@ class TeachingVideoAgent:
         storyboard_file = self.output_dir / "storyboard.json"
         enhanced_storyboard_file = self.output_dir / "storyboard_with_assets.json"
 
-        if enhanced_storyboard_file.exists():
-            print("📂 Found enhanced storyboard, loading...")
-            with open(enhanced_storyboard_file, "r", encoding="utf-8") as f:
-                self.enhanced_storyboard = json.load(f)
-        elif storyboard_file.exists():
+        storyboard_inputs = hash_parts("storyboard", self.manifest.fingerprint(self.output_dir / "outline.json"))
+
+        if self._stage_fresh("storyboard", storyboard_inputs, storyboard_file):
             print("📂 Found storyboard, loading...")
             with open(storyboard_file, "r", encoding="utf-8") as f:
                 storyboard_data = json.load(f)
-            if self.use_assets:
-                self.enhanced_storyboard = self._enhance_storyboard_with_assets(storyboard_data)
-            else:
-                self.enhanced_storyboard = storyboard_data
         else:
             print("🎬 Generating storyboard...")
             refer_img_path = (
@@ -267,14 +501,8 @@ class TeachingVideoAgent:
                     storyboard_data = json.loads(json_str)
 
                     # Save original storyboard
-                    with open(storyboard_file, "w", encoding="utf-8") as f:
-                        json.dump(storyboard_data, f, ensure_ascii=False, indent=2)
-
-                    # Enhance storyboard (add assets)
-                    if self.use_assets:
-                        self.enhanced_storyboard = self._enhance_storyboard_with_assets(storyboard_data)
-                    else:
-                        self.enhanced_storyboard = storyboard_data
+                    atomic_write_json(storyboard_file, storyboard_data)
+                    self.manifest.record("storyboard", storyboard_inputs, {"storyboard": storyboard_file})
                     break
 
                 except json.JSONDecodeError:
@@ -282,6 +510,19 @@ class TeachingVideoAgent:
                     if attempt == self.max_regenerate_tries:
                         raise ValueError("Storyboard format invalid multiple times, check prompt or API response")
 
+        # Enhance storyboard (add assets)
+        assets_inputs = hash_parts("storyboard_assets", self.manifest.fingerprint(storyboard_file))
+        if not self.use_assets:
+            self.enhanced_storyboard = storyboard_data
+        elif self._stage_fresh("storyboard_assets", assets_inputs, enhanced_storyboard_file):
+            print("📂 Found enhanced storyboard, loading...")
+            with open(enhanced_storyboard_file, "r", encoding="utf-8") as f:
+                self.enhanced_storyboard = json.load(f)
+        else:
+            self.enhanced_storyboard = self._enhance_storyboard_with_assets(storyboard_data)
+            if self.enhanced_storyboard is not storyboard_data:
+                self.manifest.record("storyboard_assets", assets_inputs, {"storyboard": enhanced_storyboard_file})
+
         # Parse into Section objects (using enhanced storyboard)
         self.sections = []
         for section_data in self.enhanced_storyboard["sections"]:
@@ -307,9 +548,7 @@ class TeachingVideoAgent:
                 assets_dir=str(self.assets_dir),
                 iconfinder_api_key=self.iconfinder_api_key,
             )
-            enhanced_storyboard_file = self.output_dir / "storyboard_with_assets.json"
-            with open(enhanced_storyboard_file, "w", encoding="utf-8") as f:
-                json.dump(enhanced_storyboard, f, ensure_ascii=False, indent=2)
+            atomic_write_json(self.output_dir / "storyboard_with_assets.json", enhanced_storyboard)
             print("✅ Storyboard enhanced with assets")
             return enhanced_storyboard
 
@@ -320,8 +559,16 @@ class TeachingVideoAgent:
     def generate_section_code(self, section: Section, attempt: int = 1, feedback_improvements=None) -> str:
         """Generate Manim code for a single section"""
         code_file = self.output_dir / f"{section.id}.py"
-
-        if attempt == 1 and code_file.exists() and not feedback_improvements:
+        code_inputs = self._section_inputs(section)
+
+        if (
+            attempt == 1
+            and not feedback_improvements
+            and (
+                self._stage_fresh(f"code:{section.id}", code_inputs, code_file)
+                or self.manifest.is_fresh(f"render:{section.id}", self._render_inputs(section))
+            )
+        ):
             print(f"📂 Found existing code for {section.id}, reading...")
             with open(code_file, "r", encoding="utf-8") as f:
                 code = f.read()
@@ -338,8 +585,7 @@ class TeachingVideoAgent:
             try:
                 modifier = GridCodeModifier(current_code)
                 modified_code = modifier.parse_feedback_and_modify(feedback_improvements)
-                with open(code_file, "w", encoding="utf-8") as f:
-                    f.write(modified_code)
+                atomic_write_text(code_file, modified_code)
 
                 self.section_codes[section.id] = modified_code
                 return modified_code
@@ -350,7 +596,12 @@ class TeachingVideoAgent:
                 )
 
         else:
-            code_gen_prompt = get_prompt3_code(regenerate_note=regenerate_note, section=section, base_class=base_class)
+            code_gen_prompt = get_prompt3_code(
+                regenerate_note=regenerate_note,
+                section=section,
+                base_class=base_class,
+                line_durations=section.line_durations,
+            )
 
         response = self._request_api_and_track_tokens(code_gen_prompt, max_tokens=self.max_code_token_length)
         if response is None:
@@ -369,11 +620,13 @@ class TeachingVideoAgent:
         elif "```" in code:
             code = code.split("```")[1].strip()
 
-        # Replace base class
+        # Replace base class, pin the narration timing read by sync_to_line
         code = replace_base_class(code, base_class)
+        code = apply_line_timing(code, section.line_durations)
 
-        with open(code_file, "w", encoding="utf-8") as f:
-            f.write(code)
+        atomic_write_text(code_file, code)
+        if self.manifest is not None:
+            self.manifest.record(f"code:{section.id}", code_inputs, {"code": code_file})
 
         self.section_codes[section.id] = code
         return code
@@ -398,37 +651,40 @@ class TeachingVideoAgent:
                     manim_in_path = shutil.which("manim")
                     if manim_in_path:
                         self.manim_path = manim_in_path
+                        self.incremental_renderer.manim_path = manim_in_path
                         print(f"📍 Using manim from PATH: {self.manim_path}")
                     else:
                         print(f"❌ manim not found in PATH either")
-                
-                cmd = [self.manim_path, "-ql", str(code_file), scene_name]
 
-                result = subprocess.run(cmd, capture_output=True, text=True, cwd=self.output_dir, timeout=180)
-
-                if result.returncode == 0:
-                    video_patterns = [
-                        self.output_dir / "media" / "videos" / f"{code_file.replace('.py', '')}" / "480p15" / f"{scene_name}.mp4",
-                        self.output_dir / "media" / "videos" / "480p15" / f"{scene_name}.mp4",
-                    ]
-
-                    for video_path in video_patterns:
-                        if video_path.exists():
-                            self.section_videos[section_id] = str(video_path)
-                            print(f"✅ {self.learning_topic} {section_id} finished")
-                            return True
+                # Only blocks from the first changed "Lecture Line" marker onward are re-encoded
+                result = self.incremental_renderer.render(section_id, self.section_codes[section_id], scene_name)
+                self._count_render(self.draft_quality, result)
+
+                if result.returncode == 0 and result.video_path and Path(result.video_path).exists():
+                    self.section_videos[section_id] = result.video_path
+                    print(f"✅ {self.learning_topic} {section_id} finished")
+                    return True
+                if result.infrastructure_error:
+                    # Nothing wrong with the scene code: do not spend tokens "fixing" it
+                    print(f"❌ {self.learning_topic} {section_id} could not be rendered: {result.stderr}")
+                    break
 
                 current_code = self.section_codes[section_id]
-                fixed_code = self.scope_refine_fixer.fix_code_smart(section_id, current_code, result.stderr, self.output_dir)
+                with STAGE_SECONDS.time(stage="fix"):
+                    fixed_code = self.scope_refine_fixer.fix_code_smart(
+                        section_id, current_code, result.stderr, self.output_dir, self._request_api_and_track_tokens
+                    )
 
                 if fixed_code:
+                    # Fixes are requested on the code body; keep the section's narration timing
+                    fixed_code = apply_line_timing(fixed_code, read_line_timing(current_code))
                     self.section_codes[section_id] = fixed_code
-                    with open(self.output_dir / code_file, "w", encoding="utf-8") as f:
-                        f.write(fixed_code)
+                    atomic_write_text(self.output_dir / code_file, fixed_code)
                 else:
                     break
 
             except subprocess.TimeoutExpired:
+                RENDERS.inc(quality=self.draft_quality, result="failure", category="timeout")
                 print(f"❌ {self.learning_topic} {section_id} timed out")
                 break
             except Exception as e:
@@ -554,7 +810,7 @@ class TeachingVideoAgent:
                 return section.id, e
 
         with ThreadPoolExecutor(max_workers=6) as executor:
-            futures = {executor.submit(task, section): section for section in self.sections}
+            futures = {executor.submit(tracing.propagate(task), section): section for section in self.sections}
             for future in as_completed(futures):
                 section_id, err = future.result()
                 if err:
@@ -593,9 +849,9 @@ class TeachingVideoAgent:
                             print(f"❌ {self.learning_topic} {section_id} no video available for MLLM feedback")
                             return success
                         try:
-                            feedback = self.get_mllm_feedback(section, current_video, round_number=round + 1)
-
-                            optimization_success = self.optimize_with_feedback(section, feedback)
+                            with STAGE_SECONDS.time(stage="feedback"):
+                                feedback = self.get_mllm_feedback(section, current_video, round_number=round + 1)
+                                optimization_success = self.optimize_with_feedback(section, feedback)
                             if optimization_success:
                                 pass
                             else:
@@ -617,74 +873,184 @@ class TeachingVideoAgent:
             print(f"❌ {self.learning_topic} {section_id} render process exception: {str(e)}")
             return False
 
-    def render_section_worker(self, section_data) -> Tuple[str, bool, Optional[str]]:
-        section_id = "unknown"
-        try:
-            section, agent_class, kwargs = section_data
-            section_id = section.id
-            agent = agent_class(**kwargs)
-            success = agent.render_section(section)
-            video_path = agent.section_videos.get(section.id) if success else None
-            return section_id, success, video_path
+    def build_render_job(self, section: Section, concurrent_jobs: int = 1) -> SectionRenderJob:
+        """concurrent_jobs sections render at once and split what is left of the token budget"""
+        max_tokens = 0
+        if self.cfg.max_total_tokens:
+            remaining = self.cfg.max_total_tokens - self.token_usage["total_tokens"]
+            max_tokens = max(1, remaining // max(1, concurrent_jobs))
+        return SectionRenderJob(
+            section=section,
+            code=self.section_codes.get(section.id, ""),
+            learning_topic=self.learning_topic,
+            output_dir=str(self.output_dir),
+            cfg=self.cfg,
+            manim_path=self.manim_path,
+            grid_img_path=str(self.GRID_IMG_PATH),
+            cancel_marker=str(self.cancel_token.marker_path),
+            max_tokens=max_tokens,
+            trace_parent=tracing.remote_parent(),
+        )
 
-        except Exception as e:
-            print(f"❌ {self.learning_topic} {section_id} render process exception: {str(e)}")
-            return section_id, False, None
+    def render_all_sections(self, max_workers: Optional[int] = None) -> Dict[str, str]:
+        """Render sections on the shared pool, keeping at most max_workers of this topic's jobs in it (None = pool size)"""
+        sections_by_id = {section.id: section for section in self.sections}
+        to_render = []
+        for section in self.sections:
+            stage = f"render:{section.id}"
+            if self.manifest.is_fresh(stage, self._render_inputs(section)):
+                self.section_videos[section.id] = self.manifest.outputs(stage)["video"]
+                print(f"📂 {section.id} already rendered, reusing video")
+                self._schedule_delivery(section)
+                continue
+            to_render.append(section)
+
+        if not to_render:
+            if self.section_videos:
+                print("📂 All sections already rendered")
+            else:
+                print("❌ No valid tasks to execute")
+            return {}
 
-    def render_all_sections(self, max_workers: int = 6) -> Dict[str, str]:
-        print(f"🎥 Start parallel rendering of all section videos (up to {max_workers} processes)...")
+        # No-op when run_Code2Video (or an earlier topic) already started it; must precede the pool
+        start_scheduler(self.cfg.scheduler_config())
+        executor, pool_size = get_render_pool(self.cfg)
+        in_flight_limit = min(max_workers or pool_size, pool_size)
+        print(f"🎥 Start parallel rendering of all section videos (up to {in_flight_limit} processes)...")
 
         tasks = []
-        for section in self.sections:
+        for section in to_render:
             try:
-                task_data = (section, self.__class__, self.get_serializable_state())
-                tasks.append(task_data)
+                tasks.append(self.build_render_job(section, concurrent_jobs=min(len(to_render), in_flight_limit)))
             except Exception as e:
                 print(f"⚠️ Error preparing task data for {section.id}: {str(e)}")
                 continue
 
-        if not tasks:
-            print("❌ No valid tasks to execute")
-            return {}
-
         results = {}
         successful_count = 0
         failed_count = 0
+        setup_times = []
+        pool_broken = False
 
         try:
-            with ProcessPoolExecutor(max_workers=max_workers) as executor:
-                future_to_section = {}
-                for task in tasks:
+            waiting = list(tasks)
+            future_to_section = {}
+
+            def submit_next(in_flight) -> set:
+                """Top up this topic's share of the pool; the pool itself is never resized"""
+                nonlocal failed_count
+                submitted = set()
+                while waiting and len(in_flight) + len(submitted) < in_flight_limit:
+                    task = waiting.pop(0)
                     try:
-                        future = executor.submit(self.render_section_worker, task)
-                        future_to_section[future] = task[0].id
+                        future = executor.submit(render_section_job, task)
                     except Exception as e:
-                        section_id = task[0].id if task and len(task) > 0 else "unknown"
-                        print(f"⚠️ Error submitting task for {section_id}: {str(e)}")
+                        print(f"⚠️ Error submitting task for {task.section.id}: {str(e)}")
                         failed_count += 1
-
-                for future in as_completed(future_to_section):
+                        continue
+                    future_to_section[future] = task.section.id
+                    submitted.add(future)
+                return submitted
+
+            render_start = time.time()
+            remaining = submit_next(set())
+            done = 0
+            while remaining:
+                finished, remaining = wait_futures(remaining, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    done += 1
                     section_id = future_to_section[future]
                     try:
-                        sid, success, video_path = future.result(timeout=300)
+                        job_result = future.result()
+                        sid, success, video_path = job_result.section_id, job_result.success, job_result.video_path
+                        section = sections_by_id[sid]
+                        setup_times.append(job_result.setup_seconds)
+                        if job_result.token_usage.get("total_tokens"):
+                            self._add_token_usage(job_result.token_usage)
+                        REGISTRY.merge(job_result.metrics)
+                        tracing.merge(job_result.trace_events)
+                        if job_result.code:
+                            self.section_codes[sid] = job_result.code
+                        code_file = self.output_dir / f"{sid}.py"
 
                         if success and video_path:
                             results[sid] = video_path
                             successful_count += 1
+                            # Accepted (possibly fixed) code supersedes the originally generated one
+                            self.manifest.record(f"code:{sid}", self._section_inputs(section), {"code": code_file})
+                            self.manifest.record(
+                                f"render:{sid}",
+                                self._render_inputs(section),
+                                {"code": code_file, "video": video_path},
+                                quality=self.draft_quality,
+                                feedback_rounds=self.feedback_rounds if self.use_feedback else 0,
+                            )
                             print(f"✅ {sid} video rendered successfully: {video_path}")
+                            self.section_videos[sid] = video_path
+                            self._schedule_delivery(section)
                         else:
                             failed_count += 1
+                            self.manifest.record(f"render:{sid}", self._render_inputs(section), status="failed")
                             print(f"⚠️ {sid} video rendering failed")
 
+                    except TaskCancelled:
+                        # Queued sections never start; running ones see the marker and kill their manim
+                        waiting.clear()
+                        for pending_future in future_to_section:
+                            pending_future.cancel()
+                        raise
+                    except BrokenProcessPool as e:
+                        failed_count += 1
+                        pool_broken = True
+                        print(f"❌ {section_id} render worker died: {str(e)}")
                     except Exception as e:
                         failed_count += 1
                         print(f"❌ {section_id} video rendering process error: {str(e)}")
 
+                    elapsed = time.time() - render_start
+                    self.events.emit(
+                        ProgressEvent(
+                            SECTION_RENDERED,
+                            stage="render",
+                            section_id=section_id,
+                            ok=section_id in results,
+                            done=done,
+                            total=len(tasks),
+                            eta_seconds=elapsed / done * (len(tasks) - done),
+                        )
+                    )
+                if pool_broken:
+                    # The broken executor rejects new work; whatever is still waiting fails with it
+                    failed_count += len(waiting)
+                    waiting.clear()
+                remaining |= submit_next(remaining)
+
+        except BrokenProcessPool as e:
+            pool_broken = True
+            print(f"❌ Render worker pool broke: {str(e)}")
         except Exception as e:
             print(f"❌ Critical error in parallel rendering process: {str(e)}")
 
+        if self.hls is not None:
+            # Sections without a video never reach the playlist; do not hold later ones back
+            for section in self.sections:
+                if section.id not in self.section_videos:
+                    self.hls.skip(self._playback_index(section.id))
+
+        if pool_broken:
+            # Dead workers poison the whole executor; the next call starts a fresh one
+            reset_render_pool(executor)
+
         # Update results and output statistics
         self.section_videos.update(results)
+        if setup_times:
+            avg_setup = sum(setup_times) / len(setup_times)
+            saved = max(0.0, self.construction_seconds - avg_setup) * len(setup_times)
+            print(
+                f"⏱️ Worker setup per section: avg {avg_setup * 1000:.1f} ms, max {max(setup_times) * 1000:.1f} ms, "
+                f"vs {self.construction_seconds * 1000:.1f} ms for a full agent construction "
+                f"({saved * 1000:.1f} ms saved over {len(setup_times)} sections)"
+            )
 
         total_sections = len(self.sections)
         print(f"\n📊 Rendering Statistics:")
@@ -702,65 +1068,252 @@ class TeachingVideoAgent:
 
         return results
 
-    def generate_audios(self) -> Dict[str, str]:
-        """Generate TTS audio for all sections from lecture_lines"""
-        if not self.use_tts:
-            print("🔇 TTS disabled, skipping audio generation")
-            return {}
-        
-        if not self.sections:
-            raise ValueError("No sections available for audio generation")
-        
-        print(f"🎙️ Generating TTS audio for {len(self.sections)} sections...")
-        
-        # Initialize TTS generator (lazy loading)
+    def _final_inputs(self, section_id: str) -> str:
+        return hash_parts("final", self.manifest.fingerprint(self.output_dir / f"{section_id}.py"), self.final_quality)
+
+    def _finalize_section(self, section_id: str) -> str:
+        """Re-render one accepted section at delivery quality; keeps the draft video on failure"""
+        if self.final_quality == self.draft_quality:
+            return self.section_videos[section_id]
+        stage = f"final:{section_id}"
+        if self.manifest.is_fresh(stage, self._final_inputs(section_id)):
+            self.section_videos[section_id] = self.manifest.outputs(stage)["video"]
+            return self.section_videos[section_id]
+
+        # No-op when render_all_sections (or run_Code2Video) already started it
+        start_scheduler(self.cfg.scheduler_config())
+        if self._final_renderer is None:
+            self._final_renderer = self._make_renderer(self.final_quality)
+        scene_name = f"{section_id.title().replace('_', '')}Scene"
+        try:
+            with open(self.output_dir / f"{section_id}.py", "r", encoding="utf-8") as f:
+                code = f.read()
+            outcome = self._final_renderer.render(section_id, code, scene_name)
+            self._count_render(self.final_quality, outcome)
+        except Exception as e:
+            print(f"⚠️ {section_id} final render raised exception, keeping draft video: {e}")
+            return self.section_videos[section_id]
+        if outcome.returncode == 0 and outcome.video_path:
+            self.section_videos[section_id] = outcome.video_path
+            self.manifest.record(stage, self._final_inputs(section_id), {"video": outcome.video_path}, quality=self.final_quality)
+            print(f"✅ {section_id} final render finished")
+        else:
+            print(f"⚠️ {section_id} final render failed, keeping draft video: {outcome.stderr[-500:]}")
+        return self.section_videos[section_id]
+
+    def finalize_renders(self, max_workers: int = 6) -> Dict[str, str]:
+        """Re-render the accepted code of every successful section once at delivery quality"""
+        self._wait_for_deliveries()
+        pending = [section_id for section_id in self.section_videos if section_id not in self.section_clips]
+        if self.final_quality == self.draft_quality or not pending:
+            return self.section_videos
+
+        print(f"🎞️ Rendering {len(pending)} accepted sections at {self.final_quality} quality...")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(tracing.propagate(self._finalize_section), pending))
+
+        return self.section_videos
+
+    def _ensure_tts_generator(self) -> bool:
+        """Initialize TTS generator (lazy loading)"""
         if self.tts_generator is None:
             try:
                 self.tts_generator = TTSGenerator(
                     model=self.tts_model,
                     voice=self.tts_voice,
                     speed=self.tts_speed,
+                    max_concurrency=self.cfg.tts_concurrency,
+                    requests_per_minute=self.cfg.tts_requests_per_minute,
+                    use_async=self.cfg.tts_async,
+                    audio_cache=build_tts_cache(self.cfg),
                 )
             except Exception as e:
                 print(f"❌ Failed to initialize TTS generator: {e}")
-                return {}
+                return False
+        return True
+
+    def _generate_section_audio(self, section: Section, time_lines: bool = True) -> Optional[str]:
+        """
+        Narration of one section. With time_lines, section.line_durations is set from the audio
+        stage's record, so it always matches the timing the scene code was generated with; sections
+        whose code already exists (audio_retry) keep theirs.
+        """
+        section_id = section.id
+        lecture_lines = section.lecture_lines
         
-        audio_dir = self.output_dir / "audio"
-        audio_dir.mkdir(exist_ok=True)
+        if not lecture_lines:
+            print(f"⚠️ {section_id} has no lecture_lines, skipping audio")
+            return None
         
-        for section in self.sections:
-            section_id = section.id
-            lecture_lines = section.lecture_lines
-            
-            if not lecture_lines:
-                print(f"⚠️ {section_id} has no lecture_lines, skipping audio")
-                continue
-            
-            # Check if audio already exists
-            section_audio_path = audio_dir / f"{section_id}_audio.mp3"
-            if section_audio_path.exists():
-                print(f"📂 Found existing audio: {section_audio_path.name}")
-                self.section_audios[section_id] = str(section_audio_path)
-                continue
-            
-            try:
+        self.cancel_token.check()
+        # Check if audio already exists for exactly these lines and voice settings
+        section_audio_path = self.output_dir / "audio" / f"{section_id}_audio{SECTION_AUDIO_SUFFIX}"
+        audio_inputs = hash_parts("audio", lecture_lines, self.tts_voice, self.tts_model, self.tts_speed)
+        if self._stage_fresh(f"audio:{section_id}", audio_inputs, section_audio_path):
+            print(f"📂 Found existing audio: {section_audio_path.name}")
+            self.section_audios[section_id] = str(section_audio_path)
+            if time_lines:
+                recorded = (self.manifest.latest(f"audio:{section_id}") or {}).get("meta", {}).get("line_durations")
+                # Records written before durations were stored: measure once from the line audio
+                section.line_durations = recorded if recorded is not None else self._measure_line_durations(section)
+            return self.section_audios[section_id]
+        
+        try:
+            with STAGE_SECONDS.time(stage="tts"):
                 audio_path = self.tts_generator.generate_section_audio(
                     section_id=section_id,
                     lecture_lines=lecture_lines,
                     output_dir=self.output_dir,
                     voice=self.tts_voice,
                 )
+            
+            if audio_path:
+                self.section_audios[section_id] = audio_path
+                line_durations = self._measure_line_durations(section)
+                self.manifest.record(f"audio:{section_id}", audio_inputs, {"audio": audio_path}, line_durations=line_durations)
+                if time_lines:
+                    section.line_durations = line_durations
+                print(f"✅ {section_id} audio generated")
+                return audio_path
                 
-                if audio_path:
-                    self.section_audios[section_id] = audio_path
-                    print(f"✅ {section_id} audio generated")
-                    
-            except Exception as e:
-                print(f"❌ Failed to generate audio for {section_id}: {e}")
+        except Exception as e:
+            print(f"❌ Failed to generate audio for {section_id}: {e}")
+        return None
+
+    def _measure_line_durations(self, section: Section) -> List[float]:
+        """Per-line narration slots from the line audio headers: each line plus the pause after it (empty if unknown)"""
+        audio_dir = self.output_dir / "audio"
+        line_files = [str(audio_dir / f"{section.id}_line_{i + 1}.mp3") for i in range(len(section.lecture_lines))]
+        durations = media_durations(line_files)
+        seconds = [durations[path] for path in line_files]
+        if not seconds or not all(seconds):
+            return []
+        slots = [d + LINE_PAUSE_SECONDS for d in seconds[:-1]] + [seconds[-1]]
+        return [round(d, 2) for d in slots]
+
+    def generate_audios(self, time_lines: bool = True) -> Dict[str, str]:
+        """Generate TTS audio for all sections from lecture_lines (time_lines: see _generate_section_audio)"""
+        if not self.use_tts:
+            print("🔇 TTS disabled, skipping audio generation")
+            return {}
+        
+        if not self.sections:
+            raise ValueError("No sections available for audio generation")
+        
+        self._wait_for_deliveries()
+        pending = [section for section in self.sections if section.id not in self.section_clips]
+        if pending:
+            print(f"🎙️ Generating TTS audio for {len(pending)} sections...")
+            if not self._ensure_tts_generator():
+                return {}
+            (self.output_dir / "audio").mkdir(exist_ok=True)
+            # Sections fan out here; their lines share the generator's bounded, rate-limited pool
+            synthesis_before = self.tts_generator.synthesis_seconds
+            start = time.perf_counter()
+            with ThreadPoolExecutor(
+                max_workers=min(len(pending), max(1, self.cfg.tts_concurrency)), thread_name_prefix="section-tts"
+            ) as executor:
+                generate = tracing.propagate(self._generate_section_audio)
+                list(executor.map(lambda section: generate(section, time_lines), pending))
+            wall_seconds = time.perf_counter() - start
+            synthesis_seconds = self.tts_generator.synthesis_seconds - synthesis_before
+            if synthesis_seconds > 0:
+                saved = max(0.0, synthesis_seconds - wall_seconds)
+                TTS_SECONDS_SAVED.inc(saved)
+                print(f"⏱️ TTS: {synthesis_seconds:.1f}s of requests in {wall_seconds:.1f}s wall ({saved:.1f}s saved)")
         
         print(f"🎵 Audio generation complete: {len(self.section_audios)}/{len(self.sections)} sections")
         return self.section_audios
 
+    def _mux_section(self, section_id: str) -> str:
+        """The section's video with its narration muxed in, or the bare video when there is none"""
+        video_path = self.section_videos[section_id]
+        audio_path = self.section_audios.get(section_id)
+        if not self.use_tts:
+            return video_path
+        if not audio_path or not Path(audio_path).exists():
+            print(f"⚠️ No audio for {section_id}, using video without audio")
+            return video_path
+
+        merged_dir = self.output_dir / "merged"
+        merged_dir.mkdir(exist_ok=True)
+        merged_video_path = merged_dir / f"{section_id}_with_audio.mp4"
+        mux_inputs = hash_parts("mux", self.manifest.fingerprint(video_path), self.manifest.fingerprint(audio_path))
+        
+        if self._stage_fresh(f"mux:{section_id}", mux_inputs, merged_video_path):
+            print(f"📂 Found existing merged video: {merged_video_path.name}")
+            return str(merged_video_path)
+        result = merge_video_audio(
+            video_path=video_path,
+            audio_path=audio_path,
+            output_path=str(merged_video_path),
+        )
+        if result:
+            self.manifest.record(f"mux:{section_id}", mux_inputs, {"video": result})
+            return result
+        print(f"⚠️ Failed to merge audio for {section_id}, using video without audio")
+        return video_path
+
+    def _playback_index(self, section_id: str) -> int:
+        """Position of a section in the merged video (sections are concatenated in id order)"""
+        return sorted({section.id for section in self.sections} | set(self.section_videos)).index(section_id)
+
+    def _publish_clip(self, section_id: str, clip_path: str):
+        self.section_clips[section_id] = clip_path
+        index = self._playback_index(section_id)
+        self.events.emit(
+            ProgressEvent(
+                SECTION_READY,
+                section_id=section_id,
+                done=len(self.section_clips),
+                total=len(self.sections),
+                index=index,
+                path=str(clip_path),
+            )
+        )
+        if self.hls is not None and self.hls.add_clip(index, section_id, clip_path):
+            self.events.emit(ProgressEvent(STREAM_UPDATED, section_id=section_id, index=index))
+
+    def deliver_section(self, section: Section) -> Optional[str]:
+        """Finalize one rendered section, mux in its narration from the audio stage, then publish its clip"""
+        section_id = section.id
+        try:
+            self._finalize_section(section_id)
+            # Narration comes from the audio stage only: re-synthesizing here could change the line
+            # timing the code was generated with
+            if self.use_tts and section_id not in self.section_audios:
+                # Not published silently: audio_retry and merge_videos only handle sections without a clip
+                print(f"⚠️ {section_id} has no narration yet, delivering it with the merge")
+                return None
+            clip_path = self._mux_section(section_id)
+        except Exception as e:
+            # The regular finalize/audio/merge stages pick the section up again
+            print(f"⚠️ {section_id} early delivery failed: {e}")
+            return None
+        self._publish_clip(section_id, clip_path)
+        print(f"📦 {section_id} clip ready: {clip_path}")
+        return clip_path
+
+    def _schedule_delivery(self, section: Section):
+        if not self.cfg.progressive_delivery:
+            return
+        if self._delivery_pool is None:
+            self._delivery_pool = ThreadPoolExecutor(
+                max_workers=max(1, self.cfg.delivery_workers), thread_name_prefix="section-delivery"
+            )
+        self._deliveries.append(self._delivery_pool.submit(tracing.propagate(self.deliver_section), section))
+
+    def _wait_for_deliveries(self):
+        if self._delivery_pool is None:
+            return
+        cancelled = self.cancel_token.cancelled
+        if not cancelled and any(not future.done() for future in self._deliveries):
+            print(f"⏳ Waiting for {sum(not f.done() for f in self._deliveries)} section deliveries...")
+        self._delivery_pool.shutdown(wait=True, cancel_futures=cancelled)
+        self._delivery_pool = None
+        self._deliveries = []
+        self.cancel_token.check()
+
     def merge_videos(self, output_filename: str = None) -> str:
         """Step 5: Merge all section videos (with optional audio)"""
         if not self.section_videos:
@@ -772,36 +1325,27 @@ class TeachingVideoAgent:
 
         output_path = self.output_dir / output_filename
 
-        # Step 5a: If TTS is enabled, merge audio with each section video first
-        videos_to_merge = self.section_videos.copy()
-        
-        if self.use_tts and self.section_audios:
-            print(f"🎵 Merging audio with section videos...")
-            merged_dir = self.output_dir / "merged"
-            merged_dir.mkdir(exist_ok=True)
-            
-            for section_id, video_path in sorted(self.section_videos.items()):
-                audio_path = self.section_audios.get(section_id)
-                
-                if audio_path and Path(audio_path).exists():
-                    # Merge this section's video with its audio
-                    merged_video_path = merged_dir / f"{section_id}_with_audio.mp4"
-                    
-                    if merged_video_path.exists():
-                        print(f"📂 Found existing merged video: {merged_video_path.name}")
-                        videos_to_merge[section_id] = str(merged_video_path)
-                    else:
-                        result = merge_video_audio(
-                            video_path=video_path,
-                            audio_path=audio_path,
-                            output_path=str(merged_video_path),
-                        )
-                        if result:
-                            videos_to_merge[section_id] = result
-                        else:
-                            print(f"⚠️ Failed to merge audio for {section_id}, using video without audio")
-                else:
-                    print(f"⚠️ No audio for {section_id}, using video without audio")
+        # Step 5a: Sections not delivered early get their narration muxed in now
+        self._wait_for_deliveries()
+        pending = [section_id for section_id in sorted(self.section_videos) if section_id not in self.section_clips]
+        if self.use_tts and pending:
+            print(f"🎵 Merging audio with {len(pending)} section videos...")
+        for section_id in pending:
+            self._publish_clip(section_id, self._mux_section(section_id))
+        videos_to_merge = {section_id: self.section_clips[section_id] for section_id in sorted(self.section_videos)}
+        if self.hls is not None:
+            self.hls.finish()
+            print(f"📡 HLS playlist complete: {self.hls.playlist_path}")
+
+        clips = hash_parts("merge", *(self.manifest.fingerprint(videos_to_merge[sid]) for sid in sorted(videos_to_merge)))
+        merge_record = self.manifest.latest("merge") or {}
+        if (
+            self.manifest.is_fresh("merge", self.cfg.result_inputs())
+            and merge_record.get("meta", {}).get("clips") == clips
+            and output_path.exists()
+        ):
+            print(f"📂 Found existing merged video: {output_path.name}")
+            return str(output_path)
 
         print(f"🔗 Start merging section videos...")
 
@@ -816,13 +1360,23 @@ class TeachingVideoAgent:
 
         # ffmpeg concat
         try:
-            result = subprocess.run(
-                ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", str(video_list_file), "-c", "copy", str(output_path)],
-                capture_output=True,
-                text=True,
-            )
+            with span("ffmpeg:concat", inputs=len(videos_to_merge)):
+                result = subprocess.run(
+                    [
+                        "ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", str(video_list_file),
+                        "-c", "copy",
+                        # moov atom up front: playback starts before the whole file is downloaded
+                        "-movflags", "+faststart",
+                        str(output_path),
+                    ],
+                    capture_output=True,
+                    text=True,
+                )
 
             if result.returncode == 0:
+                self.manifest.record(
+                    "merge", self.cfg.result_inputs(), {"video": output_path}, sections=sorted(videos_to_merge), clips=clips
+                )
                 return str(output_path)
             else:
                 print(f"❌ Failed to merge section videos: {result.stderr}")
@@ -834,16 +1388,43 @@ class TeachingVideoAgent:
     def GENERATE_VIDEO(self) -> str:
         """Generate complete video with MLLM feedback optimization and optional TTS audio"""
         try:
-            self.generate_outline()
-            self.generate_storyboard()
-            self.generate_codes()
-            self.render_all_sections()
-            
-            # Generate TTS audio if enabled
+            with tracing.activate(self.trace), span("topic", topic=self.learning_topic):
+                return self._generate_video()
+        finally:
+            if self.trace is not None:
+                self.trace.write()
+                print(f"🧭 Trace written to {self.trace.path}")
+
+    def _generate_video(self) -> str:
+        try:
+            if self.manifest.is_complete(self.cfg.result_inputs()):
+                final_video = self.manifest.outputs("merge")["video"]
+                print(f"📂 {self.learning_topic} already complete according to manifest: {final_video}")
+                return final_video
+
+            with self._stage("outline"):
+                self.generate_outline()
+            with self._stage("storyboard"):
+                self.generate_storyboard()
+            # Narration first: its measured line durations time the generated animations
             if self.use_tts:
-                self.generate_audios()
+                with self._stage("audio"):
+                    self.generate_audios()
+            with self._stage("code"):
+                self.generate_codes()
+            with self._stage("render"):
+                self.render_all_sections()
+            with self._stage("finalize"):
+                self.finalize_renders()
+            
+            # Retry narration for sections whose TTS failed before code generation
+            if self.use_tts and len(self.section_audios) < len(self.sections):
+                with self._stage("audio_retry"):
+                    # Their code is already generated and rendered: keep the timing it was built with
+                    self.generate_audios(time_lines=False)
             
-            final_video = self.merge_videos()
+            with self._stage("merge"):
+                final_video = self.merge_videos()
             if final_video:
                 print(f"🎉 Video generated success: {final_video}")
                 return final_video
@@ -853,6 +1434,125 @@ class TeachingVideoAgent:
         except Exception as e:
             print(f"❌ Video generation failed: {e}")
             return None
+        except TaskCancelled:
+            # Do not leave section deliveries running for an abandoned topic
+            self.cancel_token.cancel()
+            try:
+                self._wait_for_deliveries()
+            except TaskCancelled:
+                pass
+            raise
+        finally:
+            self.cancel_token.close()
+
+
+def build_render_cache(cfg: RunConfig) -> Optional[ContentCache]:
+    if not cfg.use_render_cache:
+        return None
+    return ContentCache(
+        Path(cfg.render_cache_dir) if cfg.render_cache_dir else DEFAULT_CACHE_ROOT / "renders",
+        max_bytes=cfg.render_cache_max_mb * 1024 * 1024,
+        suffix=".mp4",
+    )
+
+
+def build_tts_cache(cfg: RunConfig) -> Optional[ContentCache]:
+    if not cfg.use_tts_cache:
+        return None
+    return ContentCache(
+        Path(cfg.tts_cache_dir) if cfg.tts_cache_dir else DEFAULT_CACHE_ROOT / "tts",
+        max_bytes=cfg.tts_cache_max_mb * 1024 * 1024,
+        suffix=".mp3",
+    )
+
+
+# Per-process state of render workers, built by the first job a process runs and reused afterwards
+_WORKER_SHARED: Dict[Tuple, Dict[str, Any]] = {}
+
+# Long-lived render pool of this process, reused across sections and topics
+_RENDER_POOL: Optional[ProcessPoolExecutor] = None
+_RENDER_POOL_SIZE = 0
+# API job threads share the pool: creation and replacement happen under this lock
+_RENDER_POOL_LOCK = threading.Lock()
+
+
+def get_render_pool(cfg: RunConfig) -> Tuple[ProcessPoolExecutor, int]:
+    """
+    The process-wide render pool and its size. The size (--render_slots, else the capacity
+    plan) is fixed when the pool is created; later calls never resize it, so callers limit
+    how many jobs they submit instead.
+    """
+    global _RENDER_POOL, _RENDER_POOL_SIZE
+    with _RENDER_POOL_LOCK:
+        if _RENDER_POOL is None:
+            _RENDER_POOL_SIZE = cfg.scheduler_config().resolved_slots()
+            _RENDER_POOL = ProcessPoolExecutor(max_workers=_RENDER_POOL_SIZE, initializer=reset_worker_metrics)
+        return _RENDER_POOL, _RENDER_POOL_SIZE
+
+
+def reset_render_pool(pool: Optional[ProcessPoolExecutor] = None, wait: bool = False):
+    """
+    Drop the shared pool so the next get_render_pool starts a fresh one. With pool given, only
+    when that instance is still current (another caller may have replaced it already). Queued
+    futures are left alone: they may belong to other topics.
+    """
+    global _RENDER_POOL
+    with _RENDER_POOL_LOCK:
+        if _RENDER_POOL is None or (pool is not None and _RENDER_POOL is not pool):
+            return
+        old, _RENDER_POOL = _RENDER_POOL, None
+    old.shutdown(wait=wait)
+
+
+def _worker_shared(cfg: RunConfig) -> Dict[str, Any]:
+    """Immutable helpers shared by all jobs with the same API/cache settings in this worker process"""
+    key = (
+        getattr(cfg.api, "__qualname__", repr(cfg.api)),
+        cfg.max_code_token_length,
+        cfg.use_render_cache,
+        cfg.render_cache_dir,
+        cfg.render_cache_max_mb,
+    )
+    shared = _WORKER_SHARED.get(key)
+    if shared is None:
+        shared = _WORKER_SHARED[key] = {
+            "scope_refine_fixer": ScopeRefineFixer(cfg.api, cfg.max_code_token_length),
+            "extractor": GridPositionExtractor(),
+            "render_cache": build_render_cache(cfg),
+        }
+    return shared
+
+
+def render_section_job(job: SectionRenderJob) -> SectionRenderResult:
+    """Render-worker entry point: render one section (with fix loops and MLLM feedback)"""
+    with tracing.collect(job.trace_parent) as trace:
+        with span("section", section=job.section.id):
+            result = _render_section(job)
+    # Metrics and spans recorded in this process travel back with the result
+    result.metrics = REGISTRY.drain()
+    result.trace_events = trace.events if trace is not None else []
+    return result
+
+
+def _render_section(job: SectionRenderJob) -> SectionRenderResult:
+    section_id = job.section.id
+    try:
+        setup_start = time.perf_counter()
+        agent = TeachingVideoAgent.from_render_job(job, _worker_shared(job.cfg))
+        setup_seconds = time.perf_counter() - setup_start
+
+        success = agent.render_section(job.section)
+        return SectionRenderResult(
+            section_id=section_id,
+            success=success,
+            video_path=agent.section_videos.get(section_id) if success else None,
+            code=agent.section_codes.get(section_id),
+            setup_seconds=setup_seconds,
+            token_usage=agent.token_usage,
+        )
+    except Exception as e:
+        print(f"❌ {job.learning_topic} {section_id} render process exception: {str(e)}")
+        return SectionRenderResult(section_id=section_id, success=False)
 
 
 def process_knowledge_point(idx, kp, folder_path: Path, cfg: RunConfig):
@@ -865,7 +1565,11 @@ def process_knowledge_point(idx, kp, folder_path: Path, cfg: RunConfig):
         folder=folder_path,
         cfg=cfg,
     )
-    video_path = agent.GENERATE_VIDEO()
+    try:
+        video_path = agent.GENERATE_VIDEO()
+    except TaskCancelled as e:
+        print(f"🛑 Knowledge topic '{kp}' stopped: {e.reason}")
+        video_path = None
 
     duration_minutes = (time.time() - start_time) / 60
     total_tokens = agent.token_usage["total_tokens"]
@@ -882,7 +1586,9 @@ def process_batch(batch_data, cfg: RunConfig):
 
     for local_idx, (idx, kp) in enumerate(kp_batch):
         try:
-            if local_idx > 0:
+            # Topics already complete per their manifest make no API calls, so need no spacing
+            topic_dir = get_output_dir(idx=idx, knowledge_point=kp, base_dir=folder_path)
+            if local_idx > 0 and not RunManifest(topic_dir).is_complete(cfg.result_inputs()):
                 delay = random.uniform(3, 6)
                 print(f"⏳ Batch {batch_idx + 1} waits {delay:.1f}s before processing {kp}...")
                 time.sleep(delay)
@@ -890,13 +1596,16 @@ def process_batch(batch_data, cfg: RunConfig):
         except Exception as e:
             print(f"❌ Batch {batch_idx + 1} processing {kp} failed: {e}")
             results.append((kp, None, 0, 0))
-    return batch_idx, results
+    # The batch ran in its own process: hand its metrics to run_Code2Video
+    return batch_idx, results, REGISTRY.drain()
 
 
 def run_Code2Video(
     knowledge_points: List[str], folder_path: Path, parallel=True, batch_size=3, max_workers=8, cfg: RunConfig = RunConfig()
 ):
     all_results = []
+    # One scheduler for every batch process and render worker spawned below
+    start_scheduler(cfg.scheduler_config())
 
     if parallel:
         batches = []
@@ -907,11 +1616,12 @@ def run_Code2Video(
         print(
             f"🔄 Parallel batch processing mode: {len(batches)} batches, each with {batch_size} knowledge points, {max_workers} concurrent batches"
         )
-        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=reset_worker_metrics) as executor:
             futures = {executor.submit(process_batch, batch, cfg): batch for batch in batches}
             for future in as_completed(futures):
                 try:
-                    batch_idx, batch_results = future.result()
+                    batch_idx, batch_results, batch_metrics = future.result()
+                    REGISTRY.merge(batch_metrics)
                     all_results.extend(batch_results)
                     print(f"✅ Batch {batch_idx + 1} completed")
                 except Exception as e:
@@ -987,6 +1697,35 @@ def build_and_parse_args():
     parser.add_argument("--max_feedback_gen_code_tries", type=int, help="max # tries for Critic", default=3)
     parser.add_argument("--max_mllm_fix_bugs_tries", type=int, help="max # tries for Critic to fix bug", default=3)
     parser.add_argument("--feedback_rounds", type=int, default=2)
+    parser.add_argument(
+        "--draft_quality", type=str, choices=list(QUALITY_TIERS), help="quality for fix/feedback iterations", default="draft"
+    )
+    parser.add_argument(
+        "--final_quality", type=str, choices=list(QUALITY_TIERS), help="quality of the delivered video", default="low"
+    )
+
+    parser.add_argument("--no_render_cache", action="store_false", dest="use_render_cache", default=True)
+    parser.add_argument("--render_cache_dir", type=str, help="shared render cache, default src/CACHE/renders", default="")
+    parser.add_argument("--render_cache_max_mb", type=int, default=5120)
+    parser.add_argument("--render_farm_url", type=str, help="render on a render_farm.py coordinator", default="")
+    parser.add_argument("--render_farm_token", type=str, default=os.getenv("CODE2VIDEO_FARM_TOKEN", ""))
+    parser.add_argument("--render_slots", type=int, help="max concurrent manim renders on this node, 0 = capacity plan", default=0)
+    parser.add_argument("--render_max_cpu_percent", type=float, help="admit new renders only below this CPU load", default=85.0)
+    parser.add_argument("--render_min_free_mb", type=int, help="admit new renders only above this free memory", default=1024)
+    parser.add_argument("--no_progressive_delivery", action="store_false", dest="progressive_delivery", default=True)
+    parser.add_argument("--max_wall_seconds", type=float, help="per-topic wall-clock budget, 0 = unlimited", default=0)
+    parser.add_argument("--max_total_tokens", type=int, help="per-topic LLM token budget, 0 = unlimited", default=0)
+    parser.add_argument("--trace", action="store_true", help="write a Chrome trace per topic to <topic>/trace.json", default=False)
+    parser.add_argument("--tts_concurrency", type=int, help="TTS requests in flight per topic", default=4)
+    parser.add_argument("--tts_requests_per_minute", type=float, help="TTS request rate limit, 0 = unlimited", default=0)
+    parser.add_argument("--tts_async", action="store_true", help="synthesize lines with the asyncio OpenAI client", default=False)
+    parser.add_argument("--no_tts_cache", action="store_false", dest="use_tts_cache", default=True)
+    parser.add_argument("--tts_cache_dir", type=str, help="shared TTS line cache, default src/CACHE/tts", default="")
+    parser.add_argument("--tts_cache_max_mb", type=int, default=1024)
+    parser.add_argument(
+        "--metrics_file", type=str, default="", help="Write Prometheus metrics to this file during and after the run"
+    )
+    parser.add_argument("--hls_output", action="store_true", help="also write an HLS/fMP4 playlist per topic", default=False)
 
     parser.add_argument("--parallel", action="store_true", default=False)
     parser.add_argument("--no_parallel", action="store_false", dest="parallel")
@@ -1036,13 +1775,40 @@ if __name__ == "__main__":
         max_feedback_gen_code_tries=args.max_feedback_gen_code_tries,
         max_mllm_fix_bugs_tries=args.max_mllm_fix_bugs_tries,
         feedback_rounds=args.feedback_rounds,
+        draft_quality=args.draft_quality,
+        final_quality=args.final_quality,
+        use_render_cache=args.use_render_cache,
+        render_cache_dir=args.render_cache_dir,
+        render_cache_max_mb=args.render_cache_max_mb,
+        render_farm_url=args.render_farm_url,
+        render_farm_token=args.render_farm_token,
+        render_slots=args.render_slots,
+        render_max_cpu_percent=args.render_max_cpu_percent,
+        render_min_free_mb=args.render_min_free_mb,
+        progressive_delivery=args.progressive_delivery,
+        hls_output=args.hls_output,
+        trace=args.trace,
+        tts_concurrency=args.tts_concurrency,
+        tts_requests_per_minute=args.tts_requests_per_minute,
+        tts_async=args.tts_async,
+        use_tts_cache=args.use_tts_cache,
+        tts_cache_dir=args.tts_cache_dir,
+        tts_cache_max_mb=args.tts_cache_max_mb,
+        max_wall_seconds=args.max_wall_seconds,
+        max_total_tokens=args.max_total_tokens,
     )
 
-    run_Code2Video(
-        knowledge_points,
-        folder,
-        parallel=args.parallel,
-        batch_size=max(1, int(len(knowledge_points) / args.parallel_group_num)),
-        max_workers=get_optimal_workers(),
-        cfg=cfg,
-    )
+    exporter = MetricsFileExporter(args.metrics_file).start() if args.metrics_file else None
+    try:
+        run_Code2Video(
+            knowledge_points,
+            folder,
+            parallel=args.parallel,
+            batch_size=max(1, int(len(knowledge_points) / args.parallel_group_num)),
+            max_workers=get_optimal_workers(args.draft_quality),
+            cfg=cfg,
+        )
+    finally:
+        if exporter is not None:
+            exporter.stop()
+            print(f"📈 Metrics written to {args.metrics_file}")
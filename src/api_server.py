@@ -6,17 +6,18 @@ FastAPI backend for video generation with SSE progress streaming
 import asyncio
 import json
 import os
+import re
+import shutil
 import sys
+import threading
 import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
-import threading
-import queue
+from typing import Dict, Optional
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
@@ -24,6 +25,40 @@ from pydantic import BaseModel
 sys.path.insert(0, str(Path(__file__).parent.parent))
 os.environ["PYTHONPATH"] = str(Path(__file__).parent.parent)
 
+from job_queue import JobQueue, QueueClosed, QueueFull
+from task_store import TaskStore, ACTIVE_STATUSES, TERMINAL_STATUSES
+from result_cache import DEFAULT_RESULT_CACHE_DIR, ResultCache, request_key
+from progress_events import ProgressEvent, SECTION_READY, SECTION_RENDERED, STAGE_END, STAGE_START, STREAM_UPDATED, TOKENS_USED
+from sse_broadcast import BroadcastChannel
+from media_response import media_response
+from cancellation import BudgetExceeded, CancellationToken, TaskCancelled
+from hls_stream import HLS_DIRNAME, PLAYLIST_NAME
+from metrics import REGISTRY, record_queue_stats
+
+# Generation pipelines running at once, jobs allowed to wait, seconds to let running jobs finish on shutdown
+SERVER_SETTINGS = {
+    "workers": int(os.getenv("CODE2VIDEO_API_WORKERS", "2")),
+    "max_queue": int(os.getenv("CODE2VIDEO_API_MAX_QUEUE", "20")),
+    "drain_timeout": float(os.getenv("CODE2VIDEO_API_DRAIN_TIMEOUT", "600")),
+    "task_ttl_hours": float(os.getenv("CODE2VIDEO_API_TASK_TTL_HOURS", "72")),
+    # Finished videos reused for identical requests (0 MB disables the cache)
+    "result_cache_ttl_hours": float(os.getenv("CODE2VIDEO_API_RESULT_CACHE_TTL_HOURS", "24")),
+    "result_cache_max_mb": int(os.getenv("CODE2VIDEO_API_RESULT_CACHE_MAX_MB", "4096")),
+    # Per-task budgets (0 = unlimited): generation stops once either is used up
+    "task_max_minutes": float(os.getenv("CODE2VIDEO_API_TASK_MAX_MINUTES", "60")),
+    "task_max_tokens": int(os.getenv("CODE2VIDEO_API_TASK_MAX_TOKENS", "0")),
+    # Write a Chrome trace (trace.json) into every task's output folder
+    "trace": os.getenv("CODE2VIDEO_API_TRACE", "0") == "1",
+}
+
+CASES_DIR = Path(__file__).parent / "CASES"
+# Restarts a task may survive before it is failed instead of resumed
+MAX_TASK_ATTEMPTS = 3
+CLEANUP_INTERVAL_SECONDS = 3600
+# Files inside a task's hls/ folder that may be served (playlists, init and media segments)
+HLS_FILE_RE = re.compile(r"^[\w-]+\.(m3u8|m4s|mp4)$")
+HLS_MEDIA_TYPES = {".m3u8": "application/vnd.apple.mpegurl", ".m4s": "video/iso.segment", ".mp4": "video/mp4"}
+
 app = FastAPI(
     title="Code2Video API",
     description="Generate educational videos from knowledge points using AI",
@@ -39,41 +74,99 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Store for tracking generation tasks
-tasks = {}
+# Durable store for tracking generation tasks
+store = TaskStore(Path(os.getenv("CODE2VIDEO_API_DB", CASES_DIR / "api_tasks.db")))
 
 class VideoRequest(BaseModel):
     knowledge_point: str
     api: str = "gpt-41"
     use_tts: bool = True
     tts_voice: str = "nova"
+    hls: bool = False  # also stream sections as an HLS/fMP4 playlist
+    use_cache: bool = True  # reuse a cached or in-flight identical generation
 
 class TaskStatus(BaseModel):
     task_id: str
-    status: str  # pending, running, completed, failed
+    status: str  # pending, running, completed, failed, interrupted, cancelled
     progress: int  # 0-100
     message: str
     video_url: Optional[str] = None
+    hls_url: Optional[str] = None
     error: Optional[str] = None
+    queue_position: Optional[int] = None
+    cached: bool = False
+
+# Progress broadcast channel per task for SSE (any number of viewers per task)
+progress_channels: Dict[str, BroadcastChannel] = {}
 
-# Progress queue for SSE
-progress_queues = {}
+def open_channel(task_id: str) -> BroadcastChannel:
+    """Must be called on the event loop thread"""
+    channel = progress_channels[task_id] = BroadcastChannel(asyncio.get_running_loop())
+    return channel
 
-def run_video_generation(task_id: str, knowledge_point: str, api: str, use_tts: bool, tts_voice: str):
+# Agent stage events -> (progress %, message) shown to clients
+STAGE_START_PROGRESS = {
+    "audio": (27, "🎙️ Generating voice narration..."),
+    "code": (30, "💻 Generating animation code..."),
+    "finalize": (70, "🎞️ Rendering final quality..."),
+    "audio_retry": (75, "🎙️ Retrying voice narration..."),
+    "merge": (85, "🔗 Merging video clips..."),
+}
+STAGE_DONE_PROGRESS = {
+    "outline": (20, "📝 Outline generated"),
+    "storyboard": (25, "🎬 Storyboard generated"),
+    "merge": (95, "✅ Video generation successful!"),
+}
+
+job_queue: Optional[JobQueue] = None
+result_cache: Optional[ResultCache] = None
+# Cancellation token per queued or running task, created at submit so DELETE works before the job starts
+cancel_tokens: Dict[str, CancellationToken] = {}
+# Serializes read-modify-write of a task's clips column (sections are delivered from several threads)
+clips_lock = threading.Lock()
+
+def attach(task_id: str) -> str:
+    """Register one more client of a task; returns the attachment id that client cancels with.
+    Runs on the event loop thread, like every other read-modify-write of subscribers."""
+    attachment_id = uuid.uuid4().hex
+    subscribers = json.loads(store.get(task_id)["subscribers"])
+    store.update(task_id, subscribers=json.dumps(subscribers + [attachment_id]))
+    return attachment_id
+
+def clip_url(task_id: str, section_id: str) -> str:
+    return f"/api/clips/{task_id}/{section_id}"
+
+def record_clip(task_id: str, event: ProgressEvent) -> Dict:
+    with clips_lock:
+        clips = json.loads(store.get(task_id)["clips"])
+        clips[event.section_id] = {"index": event.index, "path": event.path}
+        store.update(task_id, clips=json.dumps(clips, ensure_ascii=False))
+    return {"section_id": event.section_id, "index": event.index, "url": clip_url(task_id, event.section_id)}
+
+def run_video_generation(task_id: str, knowledge_point: str, api: str, use_tts: bool, tts_voice: str, hls: bool = False):
     """Run video generation in background thread"""
     from agent import TeachingVideoAgent, RunConfig
     from gpt_request import request_gpt41_token, request_gpt4o_token, request_gpt5_token
     
-    q = progress_queues.get(task_id)
+    channel = progress_channels.get(task_id)
+    cancel_token = cancel_tokens.setdefault(task_id, CancellationToken())
     
-    def send_progress(progress: int, message: str):
-        tasks[task_id]["progress"] = progress if progress >= 0 else tasks[task_id]["progress"]
-        tasks[task_id]["message"] = message
-        if q:
-            q.put({"progress": progress, "message": message})
+    def send_progress(progress: int, message: str, event: Optional[ProgressEvent] = None):
+        if progress >= 0:
+            store.update(task_id, progress=progress, message=message)
+        else:
+            store.update(task_id, message=message)
+        if channel:
+            data = {"progress": progress, "message": message}
+            if event is not None:
+                data["event"] = event.to_dict()
+            channel.publish(data)
     
+    generator = None
     try:
-        tasks[task_id]["status"] = "running"
+        cancel_token.check()
+        store.update(task_id, status="running")
+        store.increment(task_id, "attempts")
         send_progress(5, "🚀 Starting video generation...")
         
         # Select API function based on request (use _token versions that return (response, usage) tuple)
@@ -84,8 +177,9 @@ def run_video_generation(task_id: str, knowledge_point: str, api: str, use_tts:
         }
         api_func = api_map.get(api, request_gpt41_token)
         
-        # Create output folder path
-        folder_path = Path(__file__).parent / "CASES" / f"API-{task_id[:8]}"
+        # Create output folder path (stable per task, so a resumed task picks up its run manifest)
+        folder_path = CASES_DIR / f"API-{task_id[:8]}"
+        store.update(task_id, folder_path=str(folder_path))
         
         # Initialize config
         config = RunConfig(
@@ -95,82 +189,218 @@ def run_video_generation(task_id: str, knowledge_point: str, api: str, use_tts:
             use_tts=use_tts,
             tts_voice=tts_voice,
             max_fix_bug_tries=3,
+            hls_output=hls,
+            max_wall_seconds=SERVER_SETTINGS["task_max_minutes"] * 60,
+            max_total_tokens=SERVER_SETTINGS["task_max_tokens"],
+            trace=SERVER_SETTINGS["trace"],
         )
         
         send_progress(10, "📝 Generating outline...")
         
+        def on_event(event: ProgressEvent):
+            """Map this task's agent events onto progress percentages (no print scraping, no cross-task leaks)"""
+            if event.kind == TOKENS_USED:
+                store.update(task_id, **event.tokens)
+            elif event.kind == SECTION_RENDERED:
+                store.update(task_id, sections_done=event.done, total_sections=event.total)
+                eta = f", ~{event.eta_seconds:.0f}s left" if event.eta_seconds else ""
+                progress = 30 + int(40 * event.done / max(1, event.total))
+                send_progress(progress, f"🎥 Rendering video {event.done}/{event.total}{eta}", event)
+            elif event.kind == SECTION_READY:
+                clip = record_clip(task_id, event)
+                if channel:
+                    channel.publish({
+                        "message": f"📦 Section {event.done}/{event.total} ready to watch",
+                        "clip": clip,
+                        "event": event.to_dict(),
+                    })
+            elif event.kind == STREAM_UPDATED:
+                hls_url = f"/api/hls/{task_id}/{PLAYLIST_NAME}"
+                store.update(task_id, hls_url=hls_url)
+                if channel:
+                    channel.publish({"hls_url": hls_url, "event": event.to_dict()})
+            elif event.kind == STAGE_END and event.ok and event.stage in STAGE_DONE_PROGRESS:
+                send_progress(*STAGE_DONE_PROGRESS[event.stage], event)
+            elif event.kind == STAGE_START and event.stage in STAGE_START_PROGRESS:
+                send_progress(*STAGE_START_PROGRESS[event.stage], event)
+        
         generator = TeachingVideoAgent(
             idx=0,
             knowledge_point=knowledge_point,
             folder=folder_path,
             cfg=config,
+            progress_callback=on_event,
+            cancel_token=cancel_token,
         )
         
-        # Override print to capture progress
-        original_print = print
-        def custom_print(*args, **kwargs):
-            msg = " ".join(str(a) for a in args)
-            original_print(*args, **kwargs)
-            
-            # Parse progress from messages
-            if "Outline generated" in msg:
-                send_progress(20, "📝 Outline generated")
-            elif "Storyboard" in msg:
-                send_progress(30, "🎬 Storyboard generated")
-            elif "section_" in msg and "finished" in msg:
-                # Extract section number
-                current = tasks[task_id].get("sections_done", 0) + 1
-                total = tasks[task_id].get("total_sections", 7)
-                tasks[task_id]["sections_done"] = current
-                progress = 30 + int(40 * current / total)
-                send_progress(progress, f"🎥 Rendering video {current}/{total}")
-            elif "audio generated" in msg.lower():
-                send_progress(75, "🎙️ Generating voice narration...")
-            elif "Merging" in msg:
-                send_progress(85, "🔗 Merging video clips...")
-            elif "success" in msg.lower():
-                send_progress(95, "✅ Video generation successful!")
+        # Run generation
+        result = generator.GENERATE_VIDEO()
         
-        import builtins
-        builtins.print = custom_print
+        if result is None:
+            raise Exception("GENERATE_VIDEO returned None - check server logs for details")
         
-        try:
-            # Run generation
-            result = generator.GENERATE_VIDEO()
-            
-            if result is None:
-                raise Exception("GENERATE_VIDEO returned None - check server logs for details")
-            
-            # Find output video
-            video_path = generator.output_dir / f"{knowledge_point.replace(' ', '_')}.mp4"
-            if not video_path.exists():
-                # Try to find any mp4 in output dir
-                mp4_files = list(generator.output_dir.glob("*.mp4"))
-                if mp4_files:
-                    video_path = mp4_files[0]
-            
-            if video_path.exists():
-                tasks[task_id]["status"] = "completed"
-                tasks[task_id]["video_path"] = str(video_path)
-                tasks[task_id]["video_url"] = f"/api/video/{task_id}"
-                send_progress(100, "🎉 Video generation complete!")
-            else:
-                raise Exception("Video file not found after generation")
-                
-        finally:
-            builtins.print = original_print
+        # Find output video
+        video_path = generator.output_dir / f"{knowledge_point.replace(' ', '_')}.mp4"
+        if not video_path.exists():
+            # Try to find any mp4 in output dir
+            mp4_files = list(generator.output_dir.glob("*.mp4"))
+            if mp4_files:
+                video_path = mp4_files[0]
+        
+        if video_path.exists():
+            store.update(
+                task_id, status="completed", video_path=str(video_path), video_url=f"/api/video/{task_id}"
+            )
+            cache_result(task_id, video_path)
+            send_progress(100, "🎉 Video generation complete!")
+        else:
+            raise Exception("Video file not found after generation")
             
+    except TaskCancelled as e:
+        if isinstance(e, BudgetExceeded) or cancel_token.budget_exceeded:
+            print(f"⏱️ Task {task_id} stopped: {e.reason}")
+            store.update(task_id, status="failed", error=f"Budget exceeded: {e.reason}")
+            send_progress(-1, f"⏱️ Generation stopped: {e.reason}")
+        else:
+            print(f"🛑 Task {task_id} cancelled: {e.reason}")
+            store.update(task_id, status="cancelled", error=e.reason)
+            send_progress(-1, "🛑 Generation cancelled")
     except Exception as e:
         import traceback
         error_detail = f"{str(e)}\n{traceback.format_exc()}"
         print(f"❌ Task {task_id} failed: {error_detail}")
-        tasks[task_id]["status"] = "failed"
-        tasks[task_id]["error"] = str(e)
+        store.update(task_id, status="failed", error=str(e))
         send_progress(-1, f"❌ Generation failed: {str(e)}")
     
+    if generator is not None:
+        store.update(task_id, **generator.token_usage)
+    cancel_tokens.pop(task_id, None)
+    
     # Signal end
-    if q:
-        q.put(None)
+    if channel:
+        channel.close()
+
+def cache_result(task_id: str, video_path: Path):
+    """Keep a finished video for identical future requests; never fails the task"""
+    task = store.get(task_id)
+    if result_cache is None or not task["request_key"]:
+        return
+    try:
+        result_cache.put(task["request_key"], video_path, knowledge_point=task["knowledge_point"], task_id=task_id)
+    except Exception as e:
+        print(f"⚠️ Could not cache result of task {task_id}: {e}")
+
+def serve_cached_result(key: str, request: VideoRequest) -> Optional[str]:
+    """Create an already completed task backed by a cached video; returns its id or None on a miss"""
+    from utils import topic_to_safe_name
+
+    if result_cache is None or result_cache.get(key) is None:
+        return None
+    task_id = str(uuid.uuid4())
+    folder_path = CASES_DIR / f"API-{task_id[:8]}"
+    # Same name the agent gives the merged video; the topic is client input, never a path
+    video_path = folder_path / f"{topic_to_safe_name(request.knowledge_point) or 'video'}.mp4"
+    if video_path.resolve().parent != folder_path.resolve():
+        return None
+    # Hard link: the task keeps its video even if the cache entry is evicted later
+    if not result_cache.link_into(key, video_path):
+        return None
+    store.create(
+        task_id=task_id,
+        status="completed",
+        progress=100,
+        message="🎉 Served from result cache",
+        knowledge_point=request.knowledge_point,
+        api=request.api,
+        use_tts=int(request.use_tts),
+        tts_voice=request.tts_voice,
+        created_at=datetime.now().isoformat(),
+        folder_path=str(folder_path),
+        video_path=str(video_path),
+        video_url=f"/api/video/{task_id}",
+        request_key=key,
+        cached=1,
+    )
+    return task_id
+
+def remove_task_folder(task: Dict):
+    folder = Path(task["folder_path"]) if task["folder_path"] else None
+    # Only ever remove the task's own API-* folder inside CASES
+    if folder and folder.name.startswith("API-") and folder.resolve().parent == CASES_DIR.resolve():
+        shutil.rmtree(folder, ignore_errors=True)
+
+def cleanup_expired_tasks() -> int:
+    """Delete finished tasks older than the TTL together with their progress queues and CASES/API-* folders"""
+    expired = store.expired(SERVER_SETTINGS["task_ttl_hours"] * 3600)
+    for task in expired:
+        progress_channels.pop(task["task_id"], None)
+        remove_task_folder(task)
+    store.delete([task["task_id"] for task in expired])
+    if expired:
+        print(f"🧹 Removed {len(expired)} expired tasks")
+    return len(expired)
+
+def recover_orphaned_tasks():
+    """Runs on the event loop thread. Tasks left pending/running/interrupted by a previous server process: resume them or fail them"""
+    for task in store.with_status("pending", "running", "interrupted"):
+        task_id = task["task_id"]
+        if task["attempts"] >= MAX_TASK_ATTEMPTS:
+            store.update(task_id, status="failed", error=f"Interrupted {task['attempts']} times, giving up")
+            continue
+        open_channel(task_id)
+        cancel_tokens[task_id] = CancellationToken()
+        try:
+            position = job_queue.submit(
+                task_id, task["knowledge_point"], task["api"], bool(task["use_tts"]), task["tts_voice"], bool(task["hls"])
+            )
+        except (QueueFull, QueueClosed):
+            store.update(task_id, status="failed", error="Server restarted and the queue had no room to resume the task")
+            progress_channels.pop(task_id, None)
+            cancel_tokens.pop(task_id, None)
+            continue
+        # Finished stages are skipped via the topic's run manifest in the same API-* folder
+        store.update(task_id, status="pending", message=f"Resumed after server restart (queue position {position})")
+        print(f"♻️ Resuming task {task_id} ({task['knowledge_point']})")
+
+async def periodic_cleanup():
+    while True:
+        await asyncio.sleep(CLEANUP_INTERVAL_SECONDS)
+        await asyncio.get_event_loop().run_in_executor(None, cleanup_expired_tasks)
+
+@app.on_event("startup")
+async def start_job_queue():
+    global job_queue, result_cache
+    if SERVER_SETTINGS["result_cache_max_mb"] > 0:
+        result_cache = ResultCache(
+            Path(os.getenv("CODE2VIDEO_RESULT_CACHE_DIR", DEFAULT_RESULT_CACHE_DIR)),
+            SERVER_SETTINGS["result_cache_max_mb"] * 1024 * 1024,
+            SERVER_SETTINGS["result_cache_ttl_hours"] * 3600,
+        )
+    job_queue = JobQueue(run_video_generation, SERVER_SETTINGS["workers"], SERVER_SETTINGS["max_queue"])
+    job_queue.start()
+    print(f"🧵 Job queue: {job_queue.workers} workers, up to {job_queue.max_queued} waiting jobs")
+    cleanup_expired_tasks()
+    recover_orphaned_tasks()
+    asyncio.get_event_loop().create_task(periodic_cleanup())
+
+@app.on_event("shutdown")
+def stop_job_queue():
+    """Let running jobs finish for up to drain_timeout; their completed stages stay checkpointed in the run manifest"""
+    if job_queue is None:
+        return
+    print(f"🛑 Draining job queue (up to {SERVER_SETTINGS['drain_timeout']:.0f}s)...")
+    dropped, unfinished = job_queue.shutdown(SERVER_SETTINGS["drain_timeout"])
+    for task_id in dropped:
+        store.update(task_id, status="interrupted", message="Server shut down before the task started")
+    for task_id in unfinished:
+        store.update(
+            task_id, status="interrupted", message="Server shut down during generation; it resumes on next start"
+        )
+    for task_id in dropped + unfinished:
+        channel = progress_channels.get(task_id)
+        if channel:
+            channel.close()
+    print(f"🛑 Job queue stopped: {len(dropped)} waiting and {len(unfinished)} running tasks interrupted")
 
 @app.get("/")
 async def root():
@@ -178,100 +408,141 @@ async def root():
         "name": "Code2Video API",
         "version": "1.0.0",
         "status": "running",
-        "docs": "/docs"
+        "docs": "/docs",
+        "queue": job_queue.stats() if job_queue else None,
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint: stage/LLM/render metrics plus queue and worker gauges"""
+    if job_queue is not None:
+        record_queue_stats(job_queue.stats())
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/api/generate")
 async def generate_video(request: VideoRequest, background_tasks: BackgroundTasks):
-    """Start video generation task"""
+    """Start video generation task, or reuse an identical one that is running or cached"""
+    key = request_key(request.knowledge_point, request.api, request.use_tts, request.tts_voice)
+    # An HLS request needs its own pipeline: attached and cached tasks never produce a stream
+    if request.use_cache and not request.hls:
+        # Single flight: the check and the create below run without yielding the event loop
+        running = store.find_by_request(key, *ACTIVE_STATUSES)
+        running_token = cancel_tokens.get(running["task_id"]) if running is not None else None
+        # A task whose last client already cancelled it is winding down; start a fresh one instead
+        if running is not None and not (running_token is not None and running_token.cancelled):
+            position = job_queue.position(running["task_id"]) if job_queue else None
+            return {
+                "task_id": running["task_id"],
+                "attachment_id": attach(running["task_id"]),
+                "message": "Attached to an identical generation in progress",
+                "queue_position": position or 0,
+                "coalesced": True,
+            }
+        cached_task_id = serve_cached_result(key, request)
+        if cached_task_id is not None:
+            return {
+                "task_id": cached_task_id,
+                "attachment_id": attach(cached_task_id),
+                "message": "Served from result cache",
+                "queue_position": 0,
+                "cached": True,
+            }
+    
     task_id = str(uuid.uuid4())
     
-    tasks[task_id] = {
-        "task_id": task_id,
-        "status": "pending",
-        "progress": 0,
-        "message": "Task created",
-        "knowledge_point": request.knowledge_point,
-        "created_at": datetime.now().isoformat(),
-        "video_url": None,
-        "error": None,
-        "sections_done": 0,
-        "total_sections": 7,
-    }
+    store.create(
+        task_id=task_id,
+        status="pending",
+        message="Task created",
+        knowledge_point=request.knowledge_point,
+        api=request.api,
+        use_tts=int(request.use_tts),
+        tts_voice=request.tts_voice,
+        hls=int(request.hls),
+        request_key=key,
+        created_at=datetime.now().isoformat(),
+    )
+    attachment_id = attach(task_id)
     
-    # Create progress queue
-    progress_queues[task_id] = queue.Queue()
+    # Create progress channel and cancellation token
+    open_channel(task_id)
+    cancel_tokens[task_id] = CancellationToken()
     
-    # Start generation in background thread
-    thread = threading.Thread(
-        target=run_video_generation,
-        args=(task_id, request.knowledge_point, request.api, request.use_tts, request.tts_voice)
-    )
-    thread.start()
+    # Hand over to the bounded worker pool
+    try:
+        position = job_queue.submit(
+            task_id, request.knowledge_point, request.api, request.use_tts, request.tts_voice, request.hls
+        )
+    except (QueueFull, QueueClosed) as e:
+        store.delete([task_id])
+        del progress_channels[task_id]
+        del cancel_tokens[task_id]
+        status_code = 429 if isinstance(e, QueueFull) else 503
+        return JSONResponse(
+            status_code=status_code,
+            content={"detail": f"Server busy: {e}", **job_queue.stats()},
+            headers={"Retry-After": "30"},
+        )
     
-    return {"task_id": task_id, "message": "Video generation started"}
+    if position:
+        store.update(task_id, message=f"Waiting in queue (position {position})")
+        return {"task_id": task_id, "attachment_id": attachment_id, "message": "Video generation queued", "queue_position": position}
+    return {"task_id": task_id, "attachment_id": attachment_id, "message": "Video generation started", "queue_position": 0}
 
 @app.get("/api/status/{task_id}")
 async def get_status(task_id: str):
     """Get task status"""
-    if task_id not in tasks:
+    task = store.get(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    task = tasks[task_id]
     return TaskStatus(
         task_id=task_id,
         status=task["status"],
         progress=task.get("progress", 0),
         message=task.get("message", ""),
         video_url=task.get("video_url"),
-        error=task.get("error")
+        hls_url=task.get("hls_url"),
+        error=task.get("error"),
+        queue_position=job_queue.position(task_id) if task["status"] == "pending" and job_queue else None,
+        cached=bool(task["cached"]),
     )
 
 @app.get("/api/progress/{task_id}")
-async def stream_progress(task_id: str):
-    """SSE endpoint for real-time progress updates"""
-    if task_id not in tasks:
+async def stream_progress(
+    task_id: str, last_event_id: Optional[int] = None, last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """SSE endpoint for real-time progress updates; reconnecting clients resume after Last-Event-ID"""
+    if store.get(task_id) is None:
         raise HTTPException(status_code=404, detail="Task not found")
+    if last_event_id is None and last_event_id_header and last_event_id_header.isdigit():
+        last_event_id = int(last_event_id_header)
+    
+    def final_event() -> str:
+        task = store.get(task_id)
+        final_data = {
+            "progress": 100 if task["status"] == "completed" else -1,
+            "message": task.get("message", ""),
+            "status": task["status"],
+            "video_url": task.get("video_url"),
+            "hls_url": task.get("hls_url"),
+            "error": task.get("error"),
+            "done": True
+        }
+        return f"data: {json.dumps(final_data, ensure_ascii=False)}\n\n"
     
     async def event_generator():
-        q = progress_queues.get(task_id)
-        if not q:
-            yield f"data: {json.dumps({'error': 'No progress queue'})}\n\n"
-            return
-        
-        while True:
-            try:
-                # Non-blocking get with timeout
-                data = await asyncio.get_event_loop().run_in_executor(
-                    None, lambda: q.get(timeout=30)
-                )
-                
-                if data is None:
-                    # End of stream
-                    task = tasks[task_id]
-                    final_data = {
-                        "progress": 100 if task["status"] == "completed" else -1,
-                        "message": task.get("message", ""),
-                        "status": task["status"],
-                        "video_url": task.get("video_url"),
-                        "error": task.get("error"),
-                        "done": True
-                    }
-                    yield f"data: {json.dumps(final_data, ensure_ascii=False)}\n\n"
-                    break
-                
-                # Update task progress
-                tasks[task_id]["progress"] = data.get("progress", 0)
-                tasks[task_id]["message"] = data.get("message", "")
-                
-                yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
-                
-            except queue.Empty:
-                # Send heartbeat
-                yield f"data: {json.dumps({'heartbeat': True})}\n\n"
-            except Exception as e:
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
-                break
+        channel = progress_channels.get(task_id)
+        if channel is not None:
+            async for item in channel.subscribe(last_event_id):
+                if item is None:
+                    # Heartbeat
+                    yield f"data: {json.dumps({'heartbeat': True})}\n\n"
+                    continue
+                event_id, data = item
+                yield f"id: {event_id}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        # End of stream (also the whole stream for tasks finished before this server process started)
+        yield final_event()
     
     return StreamingResponse(
         event_generator(),
@@ -282,13 +553,16 @@ async def stream_progress(task_id: str):
         }
     )
 
-@app.get("/api/video/{task_id}")
-async def get_video(task_id: str):
-    """Download generated video"""
-    if task_id not in tasks:
+def request_media_headers(request: Request) -> Dict[str, Optional[str]]:
+    return {name: request.headers.get(name) for name in ("range", "if-range", "if-none-match")}
+
+@app.api_route("/api/video/{task_id}", methods=["GET", "HEAD"])
+async def get_video(task_id: str, request: Request):
+    """Download or stream the generated video (Range requests, ETag revalidation)"""
+    task = store.get(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    task = tasks[task_id]
     if task["status"] != "completed":
         raise HTTPException(status_code=400, detail="Video not ready")
     
@@ -296,25 +570,146 @@ async def get_video(task_id: str):
     if not video_path or not Path(video_path).exists():
         raise HTTPException(status_code=404, detail="Video file not found")
     
-    return FileResponse(
-        video_path,
-        media_type="video/mp4",
-        filename=f"{task['knowledge_point'].replace(' ', '_')}.mp4"
+    return media_response(
+        Path(video_path),
+        "video/mp4",
+        request_media_headers(request),
+        filename=f"{task['knowledge_point'].replace(' ', '_')}.mp4",
     )
 
+@app.api_route("/api/hls/{task_id}/{filename}", methods=["GET", "HEAD"])
+async def get_hls_file(task_id: str, filename: str, request: Request):
+    """HLS playlist and fMP4 segments; available while later sections are still being produced"""
+    from utils import get_output_dir
+
+    task = store.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if not task["hls"] or not task["folder_path"]:
+        raise HTTPException(status_code=404, detail="Task has no HLS output")
+    if not HLS_FILE_RE.match(filename):
+        raise HTTPException(status_code=400, detail="Invalid file name")
+    
+    path = get_output_dir(0, task["knowledge_point"], task["folder_path"]) / HLS_DIRNAME / filename
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Not available yet")
+    
+    suffix = path.suffix
+    # The playlist grows until the task ends; segments never change once written
+    cache_control = "no-cache" if suffix == ".m3u8" else "private, max-age=86400"
+    return media_response(path, HLS_MEDIA_TYPES[suffix], request_media_headers(request), cache_control=cache_control)
+
+@app.get("/api/clips/{task_id}")
+async def get_clip_playlist(task_id: str):
+    """Section clips that are ready to watch, in playback order; grows while the task runs"""
+    task = store.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    clips = json.loads(task["clips"])
+    ordered = sorted(clips.items(), key=lambda item: item[1]["index"])
+    return {
+        "task_id": task_id,
+        "status": task["status"],
+        "total_sections": task["total_sections"],
+        "complete": task["status"] in TERMINAL_STATUSES,
+        "clips": [
+            {"section_id": section_id, "index": clip["index"], "url": clip_url(task_id, section_id)}
+            for section_id, clip in ordered
+        ],
+        "video_url": task.get("video_url"),
+    }
+
+@app.api_route("/api/clips/{task_id}/{section_id}", methods=["GET", "HEAD"])
+async def get_clip(task_id: str, section_id: str, request: Request):
+    """One section's muxed clip (video plus narration)"""
+    task = store.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    clip = json.loads(task["clips"]).get(section_id)
+    if clip is None or not Path(clip["path"]).exists():
+        raise HTTPException(status_code=404, detail="Clip not ready")
+    
+    return media_response(Path(clip["path"]), "video/mp4", request_media_headers(request))
+
 @app.get("/api/tasks")
-async def list_tasks():
-    """List all tasks"""
-    return [
-        {
-            "task_id": t["task_id"],
-            "status": t["status"],
-            "knowledge_point": t["knowledge_point"],
-            "created_at": t["created_at"],
-            "progress": t.get("progress", 0),
-        }
-        for t in tasks.values()
-    ]
+async def list_tasks(limit: int = 50, offset: int = 0, status: Optional[str] = None):
+    """List tasks, newest first, one page at a time"""
+    limit = max(1, min(limit, 200))
+    offset = max(0, offset)
+    total, page = store.list(limit=limit, offset=offset, status=status)
+    return {
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+        "items": [
+            {
+                "task_id": t["task_id"],
+                "status": t["status"],
+                "knowledge_point": t["knowledge_point"],
+                "created_at": t["created_at"],
+                "progress": t["progress"],
+                "total_tokens": t["total_tokens"],
+            }
+            for t in page
+        ],
+    }
+
+@app.delete("/api/tasks/{task_id}")
+async def cancel_task(task_id: str, attachment_id: Optional[str] = None):
+    """
+    Detach the caller from a task. The last client to leave cancels a queued or running task
+    (its renders and LLM calls stop) or deletes a finished one with its files. A task shared by
+    coalesced requests can only be left with the attachment_id returned by /api/generate.
+    """
+    task = store.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    subscribers = json.loads(task["subscribers"])
+    if attachment_id is not None and attachment_id not in subscribers:
+        raise HTTPException(status_code=403, detail="Unknown attachment for this task")
+    if attachment_id is None and len(subscribers) > 1:
+        raise HTTPException(status_code=409, detail="Task is shared by several clients: pass your attachment_id")
+    if attachment_id is not None:
+        subscribers.remove(attachment_id)
+        store.update(task_id, subscribers=json.dumps(subscribers))
+        if subscribers:
+            # Others still depend on this task: leave it running (or on disk) for them
+            return {"task_id": task_id, "status": "detached", "subscribers": len(subscribers)}
+    
+    if task["status"] in TERMINAL_STATUSES:
+        remove_task_folder(task)
+        store.delete([task_id])
+        progress_channels.pop(task_id, None)
+        return {"task_id": task_id, "status": "deleted"}
+    
+    token = cancel_tokens.get(task_id)
+    if (job_queue is not None and job_queue.cancel(task_id)) or token is None:
+        # Never started (or no worker owns it any more): nothing to stop
+        store.update(task_id, status="cancelled", message="🛑 Cancelled before it started", error="cancelled by client")
+        cancel_tokens.pop(task_id, None)
+        channel = progress_channels.get(task_id)
+        if channel:
+            channel.close()
+        return {"task_id": task_id, "status": "cancelled"}
+    
+    # Running: the worker notices at its next checkpoint, kills its renders and marks the task cancelled
+    token.cancel("cancelled by client")
+    store.update(task_id, message="🛑 Cancelling...")
+    return JSONResponse(status_code=202, content={"task_id": task_id, "status": "cancelling"})
+
+@app.get("/api/capacity")
+async def get_capacity(quality: str = "draft"):
+    """Recommended render concurrency for a quality tier and the inputs it was derived from"""
+    from capacity_planner import plan_capacity, load_footprints
+    from incremental_render import QUALITY_TIERS
+
+    if quality not in QUALITY_TIERS:
+        raise HTTPException(status_code=400, detail=f"Unknown quality tier, expected one of {list(QUALITY_TIERS)}")
+    plan = plan_capacity(quality)
+    return {**plan.to_dict(), "measured_peaks_mb": load_footprints()}
 
 def clear_port(port: int):
     """Clear a port by killing processes using it (Windows only)"""
@@ -373,7 +768,40 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--port", type=int, default=8000)
     parser.add_argument("--no-clear", action="store_true", help="Skip port clearing")
+    parser.add_argument("--workers", type=int, default=SERVER_SETTINGS["workers"], help="Concurrent generation jobs")
+    parser.add_argument("--max-queue", type=int, default=SERVER_SETTINGS["max_queue"], help="Jobs allowed to wait")
+    parser.add_argument(
+        "--drain-timeout", type=float, default=SERVER_SETTINGS["drain_timeout"], help="Seconds to finish running jobs on shutdown"
+    )
+    parser.add_argument(
+        "--task-ttl-hours", type=float, default=SERVER_SETTINGS["task_ttl_hours"], help="Delete finished tasks after this long"
+    )
+    parser.add_argument(
+        "--result-cache-ttl-hours", type=float, default=SERVER_SETTINGS["result_cache_ttl_hours"],
+        help="Reuse a finished video for identical requests this long"
+    )
+    parser.add_argument(
+        "--task-max-minutes", type=float, default=SERVER_SETTINGS["task_max_minutes"], help="Wall-clock budget per task, 0 = unlimited"
+    )
+    parser.add_argument(
+        "--task-max-tokens", type=int, default=SERVER_SETTINGS["task_max_tokens"], help="LLM token budget per task, 0 = unlimited"
+    )
+    parser.add_argument(
+        "--result-cache-max-mb", type=int, default=SERVER_SETTINGS["result_cache_max_mb"], help="Result cache size, 0 disables it"
+    )
+    parser.add_argument("--trace", action="store_true", default=SERVER_SETTINGS["trace"], help="Write a trace file per task")
     args, _ = parser.parse_known_args()
+    SERVER_SETTINGS.update(
+        workers=args.workers,
+        max_queue=args.max_queue,
+        drain_timeout=args.drain_timeout,
+        task_ttl_hours=args.task_ttl_hours,
+        result_cache_ttl_hours=args.result_cache_ttl_hours,
+        result_cache_max_mb=args.result_cache_max_mb,
+        task_max_minutes=args.task_max_minutes,
+        task_max_tokens=args.task_max_tokens,
+        trace=args.trace,
+    )
     
     print("=" * 50)
     print("  🎬 Code2Video API Server")
@@ -0,0 +1,170 @@
+"""
+Cooperative Cancellation for Code2Video
+A CancellationToken is shared by everything working on one topic: agent stages check it
+between steps, subprocess waits poll it and kill the process tree, and render workers in
+other processes see it through a marker file in the topic's output folder. Wall-clock
+and token budgets cancel the token when they run out.
+"""
+
+import json
+import time
+import threading
+import subprocess
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import psutil
+
+CANCEL_MARKER = ".cancelled"
+# How often subprocess waits look at the token
+POLL_SECONDS = 0.5
+# Time a terminated process tree gets to exit before it is killed
+TERMINATE_GRACE_SECONDS = 3.0
+
+
+class TaskCancelled(BaseException):
+    """
+    Raised at the next checkpoint once a token is cancelled. A BaseException (like
+    KeyboardInterrupt) so the pipeline's broad "except Exception" retry loops let it through.
+    """
+
+    def __init__(self, reason: str = "cancelled"):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class BudgetExceeded(TaskCancelled):
+    """The task ran out of wall-clock time or LLM tokens"""
+
+
+class CancellationToken:
+    def __init__(self, marker_path: Optional[Path] = None, max_tokens: int = 0):
+        self.marker_path = Path(marker_path) if marker_path else None
+        self.max_tokens = max_tokens
+        self.reason: Optional[str] = None
+        self.budget_exceeded = False
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def attach_marker(self, marker_path: Path):
+        """Share the token with other processes; a marker left by an earlier run is cleared"""
+        self.marker_path = Path(marker_path)
+        if self._event.is_set():
+            self._write_marker()
+        else:
+            self.marker_path.unlink(missing_ok=True)
+
+    def start_budget(self, max_seconds: float = 0, max_tokens: int = 0):
+        """Arm the wall-clock deadline (from now) and the token limit; 0 means unlimited"""
+        if max_tokens:
+            self.max_tokens = max_tokens
+        if max_seconds and self._timer is None:
+            self._timer = threading.Timer(
+                max_seconds, self.cancel, kwargs={"reason": f"wall-clock budget of {max_seconds:g}s exceeded", "budget": True}
+            )
+            self._timer.daemon = True
+            self._timer.start()
+
+    def charge_tokens(self, total_tokens: int):
+        """Report the task's running token total; cancels once it passes the limit"""
+        if self.max_tokens and total_tokens > self.max_tokens:
+            self.cancel(f"token budget of {self.max_tokens} exceeded ({total_tokens} used)", budget=True)
+
+    def cancel(self, reason: str = "cancelled", budget: bool = False):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self.budget_exceeded = budget
+            self._event.set()
+        if self._timer is not None:
+            self._timer.cancel()
+        if self.marker_path is not None:
+            self._write_marker()
+        print(f"🛑 Cancelling: {reason}")
+
+    def _write_marker(self):
+        # The budget flag travels along so every process raises BudgetExceeded, not a plain cancel
+        marker = {"reason": self.reason or "cancelled", "budget": self.budget_exceeded}
+        try:
+            self.marker_path.write_text(json.dumps(marker), encoding="utf-8")
+        except OSError:
+            pass
+
+    def _read_marker(self) -> Tuple[str, bool]:
+        try:
+            text = self.marker_path.read_text(encoding="utf-8")
+        except OSError:
+            return "cancelled", False
+        try:
+            marker = json.loads(text)
+            return marker.get("reason") or "cancelled", bool(marker.get("budget"))
+        except (ValueError, AttributeError):
+            # Plain-text marker from an older run
+            return text or "cancelled", False
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self.marker_path is not None and self.marker_path.exists():
+            # Cancelled by another process working on the same topic
+            reason, budget = self._read_marker()
+            with self._lock:
+                self.reason = reason
+                self.budget_exceeded = budget
+                self._event.set()
+            return True
+        return False
+
+    def check(self):
+        """Checkpoint: raise TaskCancelled (or BudgetExceeded) when the token is cancelled"""
+        if self.cancelled:
+            raise (BudgetExceeded if self.budget_exceeded else TaskCancelled)(self.reason)
+
+    def close(self):
+        """Stop the budget timer once the task is over"""
+        if self._timer is not None:
+            self._timer.cancel()
+
+
+def terminate_process_tree(proc: subprocess.Popen, grace: float = TERMINATE_GRACE_SECONDS):
+    """SIGTERM a process and its descendants (manim spawns ffmpeg), SIGKILL whatever outlives the grace period"""
+    try:
+        root = psutil.Process(proc.pid)
+        processes: List[psutil.Process] = [root, *root.children(recursive=True)]
+    except psutil.NoSuchProcess:
+        proc.kill()  # already on its way out; make sure communicate() returns
+        return
+    for p in processes:
+        try:
+            p.terminate()
+        except psutil.NoSuchProcess:
+            pass
+    _, alive = psutil.wait_procs(processes, timeout=grace)
+    for p in alive:
+        try:
+            p.kill()
+        except psutil.NoSuchProcess:
+            pass
+
+
+def communicate_cancellable(
+    proc: subprocess.Popen, timeout: Optional[float] = None, token: Optional[CancellationToken] = None
+):
+    """proc.communicate(timeout) that also kills the process tree and raises once the token is cancelled"""
+    if token is None:
+        return proc.communicate(timeout=timeout)
+    deadline = time.time() + timeout if timeout else None
+    while True:
+        wait = POLL_SECONDS if deadline is None else max(0.0, min(POLL_SECONDS, deadline - time.time()))
+        try:
+            return proc.communicate(timeout=wait)
+        except subprocess.TimeoutExpired:
+            if token.cancelled:
+                terminate_process_tree(proc)
+                proc.communicate()
+                token.check()
+            if deadline is not None and time.time() >= deadline:
+                raise subprocess.TimeoutExpired(proc.args, timeout)
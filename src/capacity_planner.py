@@ -0,0 +1,252 @@
+"""
+Render Capacity Planner for Code2Video
+Profiles the peak RSS of real manim renders (including their ffmpeg/cairo children),
+keeps a rolling footprint per quality tier and sizes worker pools from CPU, available
+memory and the container's cgroup limits.
+"""
+
+import json
+import time
+import threading
+import subprocess
+import multiprocessing
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import psutil
+
+from cancellation import CancellationToken, communicate_cancellable
+from content_cache import DEFAULT_CACHE_ROOT
+from run_manifest import atomic_write_json
+from tracing import span
+
+
+FOOTPRINT_FILE = DEFAULT_CACHE_ROOT / "render_footprint.json"
+
+# Peaks kept per tier; the estimate is a high percentile of this window
+FOOTPRINT_WINDOW = 20
+FOOTPRINT_PERCENTILE = 0.9
+
+# Used until a tier has been measured on this machine
+DEFAULT_FOOTPRINT_MB = {
+    "draft": 300,
+    "low": 400,
+    "medium": 600,
+    "high": 900,
+    "production": 1200,
+    "4k": 1800,
+}
+
+SAMPLE_INTERVAL_SECONDS = 0.05
+
+# Hard upper bound kept from the original CPU-only heuristic
+MAX_WORKERS = 16
+
+_FOOTPRINT_LOCK = threading.Lock()
+
+
+def _process_tree_rss(proc: psutil.Process) -> int:
+    total = 0
+    for p in [proc, *proc.children(recursive=True)]:
+        try:
+            total += p.memory_info().rss
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+    return total
+
+
+class PeakRssSampler:
+    """Background thread tracking the peak combined RSS of a process and all its descendants"""
+
+    def __init__(self, pid: int, interval: float = SAMPLE_INTERVAL_SECONDS):
+        self.pid = pid
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        try:
+            proc = psutil.Process(self.pid)
+        except psutil.NoSuchProcess:
+            return
+        while not self._stop.is_set():
+            try:
+                self.peak_bytes = max(self.peak_bytes, _process_tree_rss(proc))
+            except psutil.NoSuchProcess:
+                return
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_profiled(
+    cmd: List[str], quality: str, timeout: Optional[float] = None, cancel_token: Optional[CancellationToken] = None, **kwargs
+) -> subprocess.CompletedProcess:
+    """
+    subprocess.run(cmd, capture_output=True, text=True) that also records the render's peak RSS for its tier.
+    A cancelled cancel_token kills the process tree and raises TaskCancelled.
+    """
+    with span("manim", quality=quality, scene=cmd[-1]), subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, **kwargs
+    ) as proc:
+        with PeakRssSampler(proc.pid) as sampler:
+            try:
+                stdout, stderr = communicate_cancellable(proc, timeout, cancel_token)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.communicate()
+                raise
+    if proc.returncode == 0 and sampler.peak_bytes:
+        record_footprint(quality, sampler.peak_bytes / (1024 * 1024))
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+
+def load_footprints() -> Dict[str, Dict]:
+    try:
+        with open(FOOTPRINT_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def record_footprint(quality: str, peak_mb: float):
+    """Add one measured peak to the tier's rolling window (last writer wins across processes; samples may drop)"""
+    with _FOOTPRINT_LOCK:
+        data = load_footprints()
+        entry = data.setdefault(quality, {"peaks_mb": []})
+        entry["peaks_mb"] = (entry.get("peaks_mb", []) + [round(peak_mb, 1)])[-FOOTPRINT_WINDOW:]
+        entry["updated"] = time.time()
+        try:
+            FOOTPRINT_FILE.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_json(FOOTPRINT_FILE, data)
+        except OSError:
+            pass
+
+
+def estimate_footprint_mb(quality: str) -> float:
+    peaks = sorted(load_footprints().get(quality, {}).get("peaks_mb", []))
+    if not peaks:
+        return float(DEFAULT_FOOTPRINT_MB.get(quality, max(DEFAULT_FOOTPRINT_MB.values())))
+    return peaks[min(len(peaks) - 1, int(len(peaks) * FOOTPRINT_PERCENTILE))]
+
+
+def _read_cgroup(*paths: str) -> Optional[str]:
+    for path in paths:
+        try:
+            return Path(path).read_text().strip()
+        except OSError:
+            continue
+    return None
+
+
+def cgroup_memory_limit_mb() -> Optional[float]:
+    """Memory limit of this container (cgroup v2, then v1); None when unlimited"""
+    raw = _read_cgroup("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes")
+    if not raw or raw == "max":
+        return None
+    try:
+        limit = int(raw)
+    except ValueError:
+        return None
+    # cgroup v1 reports "unlimited" as a huge page-aligned number
+    if limit >= 1 << 60:
+        return None
+    return limit / (1024 * 1024)
+
+
+def cgroup_memory_usage_mb() -> Optional[float]:
+    raw = _read_cgroup("/sys/fs/cgroup/memory.current", "/sys/fs/cgroup/memory/memory.usage_in_bytes")
+    try:
+        return int(raw) / (1024 * 1024) if raw else None
+    except ValueError:
+        return None
+
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """CPU quota of this container in cores (cgroup v2 cpu.max, then v1 cfs quota); None when unlimited"""
+    raw = _read_cgroup("/sys/fs/cgroup/cpu.max")
+    if raw:
+        quota, _, period = raw.partition(" ")
+        if quota != "max":
+            try:
+                return int(quota) / int(period or 100000)
+            except ValueError:
+                return None
+        return None
+    quota = _read_cgroup("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+    period = _read_cgroup("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    try:
+        if quota and period and int(quota) > 0:
+            return int(quota) / int(period)
+    except ValueError:
+        pass
+    return None
+
+
+@dataclass
+class CapacityPlan:
+    quality: str
+    workers: int
+    cpu_workers: int
+    memory_workers: int
+    cpu_count: int
+    cgroup_cpu_limit: Optional[float]
+    available_mb: float
+    cgroup_memory_limit_mb: Optional[float]
+    footprint_mb: float
+    footprint_samples: int
+    reason: str
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def plan_capacity(quality: str = "draft", memory_headroom: float = 0.8, max_workers: int = MAX_WORKERS) -> CapacityPlan:
+    """Number of concurrent renders of the given tier this machine (or container) can sustain"""
+    try:
+        cpu_count = multiprocessing.cpu_count()
+    except NotImplementedError:
+        cpu_count = 6
+    cpu_limit = cgroup_cpu_limit()
+    effective_cpus = min(cpu_count, cpu_limit) if cpu_limit else cpu_count
+    # Manim rendering is CPU-intensive; reserve 1 core for system/other processes
+    cpu_workers = max(1, int(effective_cpus) - 1)
+
+    available_mb = psutil.virtual_memory().available / (1024 * 1024)
+    memory_limit = cgroup_memory_limit_mb()
+    if memory_limit:
+        available_mb = min(available_mb, memory_limit - (cgroup_memory_usage_mb() or 0))
+    footprint_mb = estimate_footprint_mb(quality)
+    memory_workers = max(1, int(max(0.0, available_mb) * memory_headroom / footprint_mb))
+
+    workers = min(cpu_workers, memory_workers, max_workers)
+    if max_workers < min(cpu_workers, memory_workers):
+        reason = f"capped at {max_workers}"
+    elif memory_workers < cpu_workers:
+        reason = f"memory-bound: {available_mb:.0f} MB available / {footprint_mb:.0f} MB per {quality} render"
+    else:
+        reason = f"CPU-bound: {effective_cpus:g} usable cores, one reserved"
+
+    samples = len(load_footprints().get(quality, {}).get("peaks_mb", []))
+    return CapacityPlan(
+        quality=quality,
+        workers=workers,
+        cpu_workers=cpu_workers,
+        memory_workers=memory_workers,
+        cpu_count=cpu_count,
+        cgroup_cpu_limit=cpu_limit,
+        available_mb=round(available_mb, 1),
+        cgroup_memory_limit_mb=round(memory_limit, 1) if memory_limit else None,
+        footprint_mb=footprint_mb,
+        footprint_samples=samples,
+        reason=reason,
+    )
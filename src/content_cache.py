@@ -0,0 +1,142 @@
+"""
+Content-Addressed File Cache for Code2Video
+Stores generated artifacts under a hash of everything that determines them, shared
+across topics and CASES folders, with size-based LRU eviction.
+"""
+
+import os
+import re
+import uuid
+import shutil
+import hashlib
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from functools import lru_cache
+
+
+DEFAULT_CACHE_ROOT = Path(os.getenv("CODE2VIDEO_CACHE_DIR", Path(__file__).resolve().parent / "CACHE"))
+
+ASSET_PATH_PATTERN = re.compile(r'["\']([^"\'\n]+\.(?:png|jpe?g|svg|gif))["\']', re.IGNORECASE)
+
+# (path, mtime_ns, size) -> sha256, so unchanged assets are hashed once per process
+_FILE_DIGESTS: Dict[Tuple[str, int, int], str] = {}
+
+
+def hash_parts(*parts) -> str:
+    """Stable sha256 over an ordered sequence of values"""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def file_digest(path: Path) -> str:
+    path = Path(path)
+    stat = path.stat()
+    key = (str(path.resolve()), stat.st_mtime_ns, stat.st_size)
+    digest = _FILE_DIGESTS.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = _FILE_DIGESTS[key] = h.hexdigest()
+    return digest
+
+
+def asset_digests(code: str, base_dir: Path) -> str:
+    """Digest of every image asset referenced from the code, resolved relative to base_dir"""
+    entries = []
+    for ref in sorted(set(ASSET_PATH_PATTERN.findall(code))):
+        path = Path(ref) if Path(ref).is_absolute() else Path(base_dir) / ref
+        try:
+            entries.append(f"{ref}={file_digest(path)}")
+        except OSError:
+            entries.append(f"{ref}=missing")
+    return hash_parts(*entries)
+
+
+@lru_cache(maxsize=1)
+def get_manim_version() -> str:
+    try:
+        from importlib.metadata import version
+
+        return version("manim")
+    except Exception:
+        return "unknown"
+
+
+class ContentCache:
+    """Flat directory of files named by content key, evicted least-recently-used first"""
+
+    def __init__(self, cache_dir: Path, max_bytes: int, suffix: str = ""):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+
+    def _entry(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{self.suffix}"
+
+    def get(self, key: str) -> Optional[Path]:
+        entry = self._entry(key)
+        if not entry.exists():
+            return None
+        try:
+            os.utime(entry)  # mark as recently used
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key: str, src_path: Path) -> Path:
+        """Copy src_path into the cache atomically (concurrent writers of one key are harmless)"""
+        entry = self._entry(key)
+        if entry.exists():
+            return entry
+        tmp = self.cache_dir / f".{key}.{uuid.uuid4().hex}.tmp"
+        try:
+            shutil.copyfile(src_path, tmp)
+            os.replace(tmp, entry)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        self.evict()
+        return entry
+
+    def link_into(self, key: str, dest: Path) -> bool:
+        """Hard-link a cached entry to dest, copying when linking is not possible (e.g. across devices)"""
+        entry = self.get(key)
+        if entry is None:
+            return False
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        # Never write through an existing name: it may itself be a link into the cache
+        dest.unlink(missing_ok=True)
+        try:
+            os.link(entry, dest)
+        except OSError:
+            shutil.copyfile(entry, dest)
+        return True
+
+    def evict(self):
+        """Remove least-recently-used entries until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        for entry in self.cache_dir.iterdir():
+            if not entry.is_file() or entry.name.startswith("."):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+            total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+        for _, size, entry in sorted(entries):
+            entry.unlink(missing_ok=True)
+            total -= size
+            if total <= self.max_bytes:
+                break
@@ -8,6 +8,8 @@ import time
 import json
 import pathlib
 
+from metrics import instrument_llm
+
 
 # Read and cache once
 _CFG_PATH = pathlib.Path(__file__).with_name("api_config.json")
@@ -24,6 +26,7 @@ def generate_log_id():
     return f"tkb{int(time.time() * 1000)}"
 
 
+@instrument_llm("claude")
 def request_claude(prompt, log_id=None, max_tokens=16384, max_retries=3):
     base_url = cfg("claude", "base_url")
     api_key = cfg("claude", "api_key")
@@ -71,6 +74,7 @@ def request_claude(prompt, log_id=None, max_tokens=16384, max_retries=3):
             time.sleep(delay)
 
 
+@instrument_llm("claude")
 def request_claude_token(prompt, log_id=None, max_tokens=10000, max_retries=3):
     base_url = cfg("claude", "base_url")
     api_key = cfg("claude", "api_key")
@@ -125,6 +129,7 @@ def request_claude_token(prompt, log_id=None, max_tokens=10000, max_retries=3):
     return None, usage_info
 
 
+@instrument_llm("gemini")
 def request_gemini_with_video(prompt: str, video_path: str, log_id=None, max_tokens: int = 10000, max_retries: int = 3):
     """
     Makes a multimodal request to the Gemini-2.5 model using video + text.
@@ -193,6 +198,7 @@ def request_gemini_with_video(prompt: str, video_path: str, log_id=None, max_tok
             time.sleep(delay)
 
 
+@instrument_llm("gemini")
 def request_gemini_video_img(
     prompt: str, video_path: str, image_path: str, log_id=None, max_tokens: int = 10000, max_retries: int = 3
 ):
@@ -277,6 +283,7 @@ def request_gemini_video_img(
     return None
 
 
+@instrument_llm("gemini")
 def request_gemini_video_img_token(
     prompt: str, video_path: str, image_path: str, log_id=None, max_tokens: int = 10000, max_retries: int = 3
 ):
@@ -369,6 +376,7 @@ def request_gemini_video_img_token(
     return None, usage_info
 
 
+@instrument_llm("gemini")
 def request_gemini(prompt, log_id=None, max_tokens=8000, max_retries=3):
     """
     Makes a request to the gemini-2.5-pro-preview-03-25 model with retry functionality.
@@ -421,6 +429,7 @@ def request_gemini(prompt, log_id=None, max_tokens=8000, max_retries=3):
             time.sleep(delay)
 
 
+@instrument_llm("gemini")
 def request_gemini_token(prompt, log_id=None, max_tokens=8000, max_retries=3):
     """
     Makes a request to the gemini-2.5-pro-preview-03-25 model with retry functionality.
@@ -483,6 +492,7 @@ def request_gemini_token(prompt, log_id=None, max_tokens=8000, max_retries=3):
     return None, usage_info
 
 
+@instrument_llm("gpt4o")
 def request_gpt4o(prompt, log_id=None, max_tokens=8000, max_retries=3):
     """
     Makes a request to the gpt-4o-2024-11-20 model with retry functionality.
@@ -562,6 +572,7 @@ def request_gpt4o(prompt, log_id=None, max_tokens=8000, max_retries=3):
             time.sleep(delay)
 
 
+@instrument_llm("gpt4o")
 def request_gpt4o_token(prompt, log_id=None, max_tokens=8000, max_retries=3):
     """
     Makes a request to the gpt-4o-2024-11-20 model with retry functionality.
@@ -637,6 +648,7 @@ def request_gpt4o_token(prompt, log_id=None, max_tokens=8000, max_retries=3):
     return None, usage_info
 
 
+@instrument_llm("o4mini")
 def request_o4mini(prompt, log_id=None, max_tokens=8000, max_retries=3, thinking=False):
     """
     Makes a request to the o4-mini-2025-04-16 model with retry functionality.
@@ -696,6 +708,7 @@ def request_o4mini(prompt, log_id=None, max_tokens=8000, max_retries=3, thinking
             time.sleep(delay)
 
 
+@instrument_llm("o4mini")
 def request_o4mini_token(prompt, log_id=None, max_tokens=8000, max_retries=3, thinking=False):
     """
     Makes a request to the o4-mini-2025-04-16 model with retry functionality.
@@ -764,6 +777,7 @@ def request_o4mini_token(prompt, log_id=None, max_tokens=8000, max_retries=3, th
     return None, usage_info
 
 
+@instrument_llm("gpt5")
 def request_gpt5(prompt, log_id=None, max_tokens=1000, max_retries=3):
     """
     Makes a request to the GPT-5.2 model with retry functionality.
@@ -828,6 +842,7 @@ def request_gpt5(prompt, log_id=None, max_tokens=1000, max_retries=3):
             time.sleep(delay)
 
 
+@instrument_llm("gpt5")
 def request_gpt5_token(prompt, log_id=None, max_tokens=1000, max_retries=3):
     """
     Makes a request to the GPT-5.2 model with retry functionality.
@@ -916,6 +931,7 @@ def request_gpt5_token(prompt, log_id=None, max_tokens=1000, max_retries=3):
     return None, usage_info
 
 
+@instrument_llm("gpt41")
 def request_gpt41(prompt, log_id=None, max_tokens=1000, max_retries=3):
     """
     Makes a request to the gpt-4.1-2025-04-14 model with retry functionality.
@@ -972,6 +988,7 @@ def request_gpt41(prompt, log_id=None, max_tokens=1000, max_retries=3):
             time.sleep(delay)
 
 
+@instrument_llm("gpt41")
 def request_gpt41_token(prompt, log_id=None, max_tokens=1000, max_retries=3):
     """
     Makes a request to the gpt-4.1-2025-04-14 model with retry functionality.
@@ -1038,6 +1055,7 @@ def request_gpt41_token(prompt, log_id=None, max_tokens=1000, max_retries=3):
     return None, usage_info
 
 
+@instrument_llm("gpt41")
 def request_gpt41_img(prompt, image_path=None, log_id=None, max_tokens=1000, max_retries=3):
     """
     Makes a request to the gpt-4.1-2025-04-14 model with optional image input and retry functionality.
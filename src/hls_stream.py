@@ -0,0 +1,137 @@
+"""
+HLS / fMP4 Streaming Output for Code2Video
+Each finished section clip is remuxed (stream copy, no re-encode) into fragmented MP4
+segments and appended, in section order, to an EVENT playlist, so a player can start on
+section 1 while later sections are still being produced. finish() ends the playlist.
+"""
+
+import math
+import subprocess
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from run_manifest import atomic_write_text
+from tracing import span
+
+HLS_DIRNAME = "hls"
+PLAYLIST_NAME = "index.m3u8"
+SEGMENT_SECONDS = 4
+
+
+def segment_clip(
+    clip_path: str, out_dir: Path, prefix: str, segment_seconds: int = SEGMENT_SECONDS
+) -> Optional[Tuple[str, List[Tuple[float, str]]]]:
+    """
+    Cut one MP4 into fMP4 segments inside out_dir.
+    Returns (init segment name, [(duration, segment name), ...]) or None on failure.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    init_name = f"{prefix}_init.mp4"
+    clip_playlist = out_dir / f"{prefix}.m3u8"
+    cmd = [
+        "ffmpeg", "-y", "-i", str(clip_path),
+        "-c", "copy",
+        "-f", "hls",
+        "-hls_time", str(segment_seconds),
+        "-hls_playlist_type", "vod",
+        "-hls_segment_type", "fmp4",
+        "-hls_fmp4_init_filename", init_name,
+        "-hls_segment_filename", str(out_dir / f"{prefix}_%03d.m4s"),
+        str(clip_playlist),
+    ]
+    try:
+        with span("ffmpeg:hls", clip=prefix):
+            result = subprocess.run(cmd, capture_output=True, text=True)
+    except Exception as e:
+        print(f"⚠️ HLS segmenting failed for {prefix}: {e}")
+        return None
+    if result.returncode != 0 or not clip_playlist.exists():
+        print(f"⚠️ HLS segmenting failed for {prefix}: {result.stderr[-500:]}")
+        return None
+
+    segments = []
+    duration = None
+    for line in clip_playlist.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line.startswith("#EXTINF:"):
+            duration = float(line[len("#EXTINF:"):].split(",", 1)[0])
+        elif line and not line.startswith("#") and duration is not None:
+            segments.append((duration, line))
+            duration = None
+    return (init_name, segments) if segments else None
+
+
+class HlsPlaylist:
+    """
+    Thread-safe EVENT playlist assembled from per-section clips. Clips may arrive out of
+    order; a clip is only published once every earlier index was added or skipped.
+    """
+
+    def __init__(self, out_dir: Path, segment_seconds: int = SEGMENT_SECONDS):
+        self.out_dir = Path(out_dir)
+        self.segment_seconds = segment_seconds
+        self.playlist_path = self.out_dir / PLAYLIST_NAME
+        self._lock = threading.Lock()
+        self._waiting: Dict[int, Optional[Tuple[str, List[Tuple[float, str]]]]] = {}
+        self._published: List[Tuple[str, List[Tuple[float, str]]]] = []
+        self._next_index = 0
+        self.finished = False
+
+    def add_clip(self, index: int, section_id: str, clip_path: str) -> bool:
+        """Segment a section clip; returns True when the playlist gained segments"""
+        segmented = segment_clip(clip_path, self.out_dir, section_id, self.segment_seconds)
+        with self._lock:
+            self._waiting[index] = segmented
+            return self._flush()
+
+    def skip(self, index: int) -> bool:
+        """Mark a section that will never produce a clip so later ones are not held back"""
+        with self._lock:
+            self._waiting.setdefault(index, None)
+            return self._flush()
+
+    def finish(self):
+        """Publish whatever is left (gaps included) and close the playlist"""
+        with self._lock:
+            for index in sorted(self._waiting):
+                if self._waiting[index] is not None:
+                    self._published.append(self._waiting[index])
+            self._waiting.clear()
+            self.finished = True
+            self._write()
+
+    def _flush(self) -> bool:
+        published = False
+        while self._next_index in self._waiting:
+            segmented = self._waiting.pop(self._next_index)
+            self._next_index += 1
+            if segmented is not None:
+                self._published.append(segmented)
+                published = True
+        if published:
+            self._write()
+        return published
+
+    def _write(self):
+        durations = [duration for _, segments in self._published for duration, _ in segments]
+        target = max([self.segment_seconds] + [math.ceil(d) for d in durations])
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:7",
+            f"#EXT-X-TARGETDURATION:{target}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+            "#EXT-X-INDEPENDENT-SEGMENTS",
+        ]
+        for i, (init_name, segments) in enumerate(self._published):
+            # Every section is a separate encode with its own init segment and timestamps
+            if i > 0:
+                lines.append("#EXT-X-DISCONTINUITY")
+            lines.append(f'#EXT-X-MAP:URI="{init_name}"')
+            for duration, name in segments:
+                lines.append(f"#EXTINF:{duration:.3f},")
+                lines.append(name)
+        if self.finished:
+            lines.append("#EXT-X-ENDLIST")
+        atomic_write_text(self.playlist_path, "\n".join(lines) + "\n")
@@ -0,0 +1,426 @@
+"""
+Incremental Rendering for Code2Video
+Maps "# === Animation for Lecture Line N ===" blocks onto Manim sections so that
+only the blocks from the first changed one onward are re-encoded.
+"""
+
+import re
+import json
+import shutil
+import hashlib
+import subprocess
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from capacity_planner import run_profiled
+from cancellation import CancellationToken
+from content_cache import ContentCache, asset_digests, get_manim_version, hash_parts
+from render_scheduler import render_slot
+from tracing import span
+
+
+BLOCK_MARKER_PATTERN = re.compile(r"^(?P<indent>[ \t]*)# === Animation for Lecture Line (?P<line>\d+) ===[ \t]*$")
+CONSTRUCT_PATTERN = re.compile(r"^(?P<indent>[ \t]*)def construct\(self\)\s*:")
+
+PRELUDE_SECTION = "prelude"
+
+
+# Per-section cap on cached block files (older chains are evicted first)
+MAX_CACHED_BLOCKS = 64
+
+
+@dataclass(frozen=True)
+class RenderQuality:
+    """A render quality tier: manim CLI flags plus where manim writes the result"""
+
+    name: str
+    flags: Tuple[str, ...]
+    quality_dir: str
+    timeout_scale: float = 1.0
+    max_wait: Optional[float] = None  # cap on self.wait() durations, draft previews only
+
+
+# Iteration (fix loops, MLLM feedback) runs on a draft tier; accepted code is re-rendered once at delivery quality.
+# Final renders happen exactly once, so manim's partial-movie hashing is pure overhead there.
+QUALITY_TIERS = {
+    "draft": RenderQuality("draft", ("--resolution", "426,240", "--frame_rate", "10"), "240p10", 1.0, max_wait=0.25),
+    "low": RenderQuality("low", ("-ql",), "480p15"),
+    "medium": RenderQuality("medium", ("-qm", "--disable_caching"), "720p30", 2.0),
+    "high": RenderQuality("high", ("-qh", "--disable_caching"), "1080p60", 4.0),
+    "production": RenderQuality("production", ("-qp", "--disable_caching"), "1440p60", 6.0),
+    "4k": RenderQuality("4k", ("-qk", "--disable_caching"), "2160p60", 8.0),
+}
+
+
+def get_render_quality(name: str) -> RenderQuality:
+    try:
+        return QUALITY_TIERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown render quality '{name}', choose from {list(QUALITY_TIERS)}")
+
+
+@dataclass
+class RenderBlock:
+    """One "# === Animation for Lecture Line N ===" block of a scene"""
+
+    name: str
+    marker_line: Optional[int]  # 0-indexed line of the marker, None for the prelude
+    text: str
+    digest: str = ""
+
+
+@dataclass
+class RenderOutcome:
+    """Result of an (incremental) render, mirrors the fields of subprocess.CompletedProcess we rely on"""
+
+    returncode: int
+    stdout: str
+    stderr: str
+    video_path: Optional[str] = None
+    reused_blocks: List[str] = field(default_factory=list)
+    rendered_blocks: List[str] = field(default_factory=list)
+    # The render never ran (render farm unreachable, lease failures, ...): stderr is not a scene error
+    infrastructure_error: bool = False
+
+
+def _sha256(*parts: str) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def split_into_blocks(code: str, salt: str = "") -> Optional[List[RenderBlock]]:
+    """
+    Split scene code into a prelude block plus one block per lecture-line marker.
+
+    Each block digest chains the digest of the block before it, so a block's hash
+    covers its own code together with all state built up by the preceding blocks.
+    Everything outside construct() (imports, base class, helper methods) is hashed
+    into the prelude. Returns None if the code cannot be rendered incrementally.
+    """
+    lines = code.split("\n")
+
+    construct_idx = None
+    construct_indent = ""
+    for i, line in enumerate(lines):
+        match = CONSTRUCT_PATTERN.match(line)
+        if match:
+            construct_idx = i
+            construct_indent = match.group("indent")
+            break
+    if construct_idx is None:
+        return None
+
+    # construct() ends at the first non-empty line indented at or above the def
+    construct_end = len(lines)
+    for j in range(construct_idx + 1, len(lines)):
+        stripped = lines[j].strip()
+        if stripped and len(lines[j]) - len(lines[j].lstrip()) <= len(construct_indent):
+            construct_end = j
+            break
+
+    markers = []
+    for i in range(construct_idx + 1, construct_end):
+        match = BLOCK_MARKER_PATTERN.match(lines[i])
+        if match:
+            markers.append((i, match.group("indent"), match.group("line")))
+    if not markers:
+        return None
+
+    # Markers nested inside loops/branches would open a section per iteration
+    if len({indent for _, indent, _ in markers}) != 1 or len(markers[0][1]) <= len(construct_indent):
+        return None
+
+    epilogue = "\n".join(lines[construct_end:])
+    prelude_text = "\n".join(lines[: markers[0][0]])
+    blocks = [RenderBlock(name=PRELUDE_SECTION, marker_line=None, text=prelude_text)]
+    for k, (line_idx, _, line_no) in enumerate(markers):
+        end = markers[k + 1][0] if k + 1 < len(markers) else construct_end
+        blocks.append(
+            RenderBlock(name=f"line_{line_no}_{k + 1}", marker_line=line_idx, text="\n".join(lines[line_idx:end]))
+        )
+
+    previous = _sha256(salt, epilogue)
+    for block in blocks:
+        block.digest = _sha256(previous, block.text)
+        previous = block.digest
+    return blocks
+
+
+def build_render_hooks(scene_name: str, prelude_skip: Optional[bool] = None, max_wait: Optional[float] = None) -> List[str]:
+    """Lines appended after the scene code; appending keeps traceback line numbers intact"""
+    hooks = ["", "", "# --- render hooks (generated) ---"]
+    if prelude_skip is not None:
+        hooks += [
+            f"_render_original_setup = {scene_name}.setup",
+            "",
+            "",
+            "def _render_setup(self):",
+            f'    self.next_section("{PRELUDE_SECTION}", skip_animations={prelude_skip})',
+            "    _render_original_setup(self)",
+            "",
+            "",
+            f"{scene_name}.setup = _render_setup",
+        ]
+    if max_wait is not None:
+        hooks += [
+            f"_render_original_wait = {scene_name}.wait",
+            "",
+            "",
+            "def _render_wait(self, duration=1.0, *args, **kwargs):",
+            f"    return _render_original_wait(self, min(duration, {max_wait}), *args, **kwargs)",
+            "",
+            "",
+            f"{scene_name}.wait = _render_wait",
+        ]
+    return hooks + [""]
+
+
+def build_sectioned_code(
+    code: str, scene_name: str, blocks: List[RenderBlock], first_dirty: int, max_wait: Optional[float] = None
+) -> str:
+    """
+    Rewrite code so each marker opens a Manim section; blocks before first_dirty are skipped.
+
+    Markers are replaced in place and the prelude section is opened from an appended
+    setup() hook, so line numbers in tracebacks still match the original file.
+    """
+    lines = code.split("\n")
+    for k, block in enumerate(blocks):
+        if block.marker_line is None:
+            continue
+        original = lines[block.marker_line]
+        indent = original[: len(original) - len(original.lstrip())]
+        lines[block.marker_line] = (
+            f'{indent}self.next_section("{block.name}", skip_animations={k < first_dirty})  {original.strip()}'
+        )
+    return "\n".join(lines + build_render_hooks(scene_name, prelude_skip=0 < first_dirty, max_wait=max_wait))
+
+
+def concat_videos(video_files: List[Path], output_path: Path, list_file: Path) -> bool:
+    """Concatenate mp4 files that share encoding settings without re-encoding"""
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if len(video_files) == 1:
+        shutil.copyfile(video_files[0], output_path)
+        return True
+
+    with open(list_file, "w", encoding="utf-8") as f:
+        for video in video_files:
+            f.write(f"file '{Path(video).resolve().as_posix()}'\n")
+    with span("ffmpeg:concat", inputs=len(video_files)):
+        result = subprocess.run(
+            ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", str(list_file), "-c", "copy", str(output_path)],
+            capture_output=True,
+            text=True,
+        )
+    list_file.unlink(missing_ok=True)
+    if result.returncode != 0:
+        print(f"⚠️ Failed to concatenate block videos: {result.stderr}")
+    return result.returncode == 0
+
+
+class IncrementalRenderer:
+    """Render a section scene, reusing cached per-block videos for unchanged leading blocks"""
+
+    def __init__(
+        self,
+        manim_path: str,
+        output_dir: Path,
+        quality: RenderQuality = QUALITY_TIERS["low"],
+        timeout: int = 180,
+        render_cache: Optional[ContentCache] = None,
+        topic: str = "",
+        cancel_token: Optional[CancellationToken] = None,
+    ):
+        self.manim_path = manim_path
+        self.output_dir = Path(output_dir)
+        self.quality = quality
+        self.timeout = int(timeout * quality.timeout_scale)
+        self.render_cache = render_cache
+        # Fair-share key of the node-wide render scheduler
+        self.topic = topic or self.output_dir.name
+        self.cancel_token = cancel_token
+
+    def _block_cache_dir(self, section_id: str) -> Path:
+        return self.output_dir / "block_cache" / section_id / self.quality.quality_dir
+
+    def _cached_entry(self, cache_dir: Path, block: RenderBlock) -> Optional[Path]:
+        """Cached video of a block; an ".empty" entry means the block produced no frames"""
+        for suffix in (".mp4", ".empty"):
+            entry = cache_dir / f"{block.digest}{suffix}"
+            if entry.exists():
+                return entry
+        return None
+
+    def _evict(self, cache_dir: Path, keep: set):
+        """Drop the oldest block files beyond MAX_CACHED_BLOCKS, never touching the current chain"""
+        entries = [e for e in cache_dir.iterdir() if e.is_file() and e.stem not in keep]
+        excess = len(entries) + len(keep) - MAX_CACHED_BLOCKS
+        if excess <= 0:
+            return
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime)[:excess]:
+            entry.unlink(missing_ok=True)
+
+    def final_video_path(self, section_id: str, scene_name: str) -> Path:
+        """Same location a plain `manim <section_id>.py` render would write to"""
+        return self.output_dir / "media" / "videos" / section_id / self.quality.quality_dir / f"{scene_name}.mp4"
+
+    def _video_dir(self, stem: str) -> Path:
+        """Directory manim wrote into; custom resolutions may not match quality_dir exactly"""
+        expected = self.output_dir / "media" / "videos" / stem / self.quality.quality_dir
+        if expected.exists():
+            return expected
+        candidates = sorted(
+            (d for d in (self.output_dir / "media" / "videos" / stem).glob("*") if d.is_dir()),
+            key=lambda d: d.stat().st_mtime,
+            reverse=True,
+        )
+        return candidates[0] if candidates else expected
+
+    def _run_manim(
+        self,
+        section_id: str,
+        scene_name: str,
+        render_code: Optional[str],
+        extra_args: Tuple[str, ...] = (),
+        code_lines: int = 1,
+    ) -> Tuple[subprocess.CompletedProcess, str]:
+        """
+        Run manim on <section_id>.py, or on a hooked copy of it when render_code is given.
+        Waits for a node-wide render slot; code_lines (lines to encode) ranks longer renders first.
+        """
+        stem = section_id
+        if render_code is not None:
+            stem = f"{section_id}_render"
+            with open(self.output_dir / f"{stem}.py", "w", encoding="utf-8") as f:
+                f.write(render_code)
+
+        cmd = [self.manim_path, *self.quality.flags, *extra_args, f"{stem}.py", scene_name]
+        with render_slot(self.topic, section_id, cost=code_lines * self.quality.timeout_scale):
+            if self.cancel_token is not None:
+                # The task may have been cancelled while this render waited for a slot
+                self.cancel_token.check()
+            result = run_profiled(
+                cmd, self.quality.name, cwd=self.output_dir, timeout=self.timeout, cancel_token=self.cancel_token
+            )
+        if stem != section_id:
+            # Report errors against the real section file, line numbers are preserved
+            result.stdout = result.stdout.replace(f"{stem}.py", f"{section_id}.py")
+            result.stderr = result.stderr.replace(f"{stem}.py", f"{section_id}.py")
+        return result, stem
+
+    def render_full(self, section_id: str, code: str, scene_name: str) -> RenderOutcome:
+        """Non-incremental render of the whole scene"""
+        render_code = None
+        if self.quality.max_wait is not None:
+            render_code = code + "\n".join(build_render_hooks(scene_name, max_wait=self.quality.max_wait))
+        result, stem = self._run_manim(section_id, scene_name, render_code, code_lines=code.count("\n") + 1)
+
+        video_path = None
+        rendered = self._video_dir(stem) / f"{scene_name}.mp4"
+        if result.returncode == 0 and rendered.exists():
+            final_path = self.final_video_path(section_id, scene_name)
+            if rendered != final_path:
+                final_path.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(rendered, final_path)
+            video_path = str(final_path)
+        return RenderOutcome(result.returncode, result.stdout, result.stderr, video_path)
+
+    def render(self, section_id: str, code: str, scene_name: str) -> RenderOutcome:
+        """Render a section, served from the cross-run render cache when the exact same scene was rendered before"""
+        final_path = self.final_video_path(section_id, scene_name)
+        # The previous video may be a hard link into the shared cache: never let manim/ffmpeg write through it
+        final_path.unlink(missing_ok=True)
+
+        if self.render_cache is None:
+            return self._render_blocks(section_id, code, scene_name)
+
+        cache_key = hash_parts(
+            code, scene_name, get_manim_version(), self.quality, asset_digests(code, self.output_dir)
+        )
+        if self.render_cache.link_into(cache_key, final_path):
+            print(f"♻️ {section_id}: identical scene found in render cache, skipping manim")
+            return RenderOutcome(0, "", "", str(final_path))
+
+        outcome = self._render_blocks(section_id, code, scene_name)
+        if outcome.returncode == 0 and outcome.video_path:
+            try:
+                self.render_cache.put(cache_key, Path(outcome.video_path))
+                self.render_cache.link_into(cache_key, Path(outcome.video_path))
+            except OSError as e:
+                print(f"⚠️ {section_id} could not be stored in render cache: {e}")
+        return outcome
+
+    def _render_blocks(self, section_id: str, code: str, scene_name: str) -> RenderOutcome:
+        """Render a section, re-encoding only from the first block whose chained hash is not cached"""
+        blocks = split_into_blocks(code, salt=f"{self.quality}|{scene_name}")
+        if not blocks:
+            return self.render_full(section_id, code, scene_name)
+
+        cache_dir = self._block_cache_dir(section_id)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+
+        first_dirty = len(blocks)
+        for k, block in enumerate(blocks):
+            if self._cached_entry(cache_dir, block) is None:
+                first_dirty = k
+                break
+
+        reused = [b.name for b in blocks[:first_dirty]]
+        rendered = [b.name for b in blocks[first_dirty:]]
+        stdout, stderr = "", ""
+
+        if first_dirty < len(blocks):
+            sectioned_code = build_sectioned_code(code, scene_name, blocks, first_dirty, self.quality.max_wait)
+            try:
+                compile(sectioned_code, "<sectioned>", "exec")
+            except SyntaxError:
+                # Broken code or a marker inside a multi-line expression: let manim report on the real file
+                return self.render_full(section_id, code, scene_name)
+
+            dirty_lines = sum(block.text.count("\n") + 1 for block in blocks[first_dirty:])
+            result, stem = self._run_manim(
+                section_id, scene_name, sectioned_code, ("--save_sections",), code_lines=dirty_lines
+            )
+            stdout, stderr = result.stdout, result.stderr
+            if result.returncode != 0:
+                return RenderOutcome(result.returncode, stdout, stderr, None, reused, rendered)
+
+            sections_dir = self._video_dir(stem) / "sections"
+            index_file = sections_dir / f"{scene_name}.json"
+            try:
+                with open(index_file, "r", encoding="utf-8") as f:
+                    section_videos = {entry["name"]: sections_dir / entry["video"] for entry in json.load(f)}
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ {section_id} section index unreadable ({e}), falling back to full render")
+                return self.render_full(section_id, code, scene_name)
+
+            for block in blocks[first_dirty:]:
+                video = section_videos.get(block.name)
+                if video is not None and video.exists():
+                    shutil.copyfile(video, cache_dir / f"{block.digest}.mp4")
+                else:
+                    (cache_dir / f"{block.digest}.empty").touch()
+            self._evict(cache_dir, keep={b.digest for b in blocks})
+
+        block_videos = []
+        for block in blocks:
+            entry = self._cached_entry(cache_dir, block)
+            if entry is None:
+                return RenderOutcome(1, stdout, f"{stderr}\nMissing cached video for block {block.name}", None, reused, rendered)
+            if entry.suffix == ".mp4":
+                block_videos.append(entry)
+
+        if not block_videos:
+            return RenderOutcome(1, stdout, f"{stderr}\nScene {scene_name} produced no frames", None, reused, rendered)
+
+        final_path = self.final_video_path(section_id, scene_name)
+        if not concat_videos(block_videos, final_path, cache_dir.parent / f"{scene_name}_blocks.txt"):
+            return self.render_full(section_id, code, scene_name)
+
+        if reused:
+            print(f"♻️ {section_id}: reused {len(reused)} cached block(s), re-rendered {len(rendered)}")
+        return RenderOutcome(0, stdout, stderr, str(final_path), reused, rendered)
@@ -0,0 +1,121 @@
+"""
+Bounded Job Queue for the Code2Video API server
+A fixed pool of worker threads runs generation pipelines; requests beyond the pool
+wait in a bounded FIFO queue and are rejected once it is full.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, List, Optional, Set, Tuple
+
+
+class QueueFull(Exception):
+    """Raised by submit() when the waiting queue is at capacity"""
+
+
+class QueueClosed(Exception):
+    """Raised by submit() once shutdown has started"""
+
+
+class JobQueue:
+    def __init__(self, handler: Callable[..., None], workers: int = 2, max_queued: int = 20):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_queued = max(0, max_queued)
+        self._pending: Deque[Tuple[str, tuple]] = deque()
+        self._running: Set[str] = set()
+        self._cond = threading.Condition()
+        self._accepting = True
+        self._stopping = False
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"generation-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, task_id: str, *args) -> int:
+        """Enqueue a job; returns its 1-based position among waiting jobs (0 = starts right away)"""
+        with self._cond:
+            if not self._accepting:
+                raise QueueClosed("server is shutting down")
+            if len(self._pending) >= self._free_workers() + self.max_queued:
+                raise QueueFull(f"{self._waiting()} jobs already waiting")
+            self._pending.append((task_id, args))
+            self._cond.notify()
+            return self._position(len(self._pending) - 1)
+
+    def _free_workers(self) -> int:
+        return self.workers - len(self._running)
+
+    def _waiting(self) -> int:
+        """Pending jobs that no idle worker is about to pick up"""
+        return max(0, len(self._pending) - self._free_workers())
+
+    def _position(self, index: int) -> int:
+        return max(0, index + 1 - self._free_workers())
+
+    def position(self, task_id: str) -> Optional[int]:
+        """1-based position of a waiting job (0 = being picked up), None when it is running or unknown"""
+        with self._cond:
+            for i, (pending_id, _) in enumerate(self._pending):
+                if pending_id == task_id:
+                    return self._position(i)
+        return None
+
+    def cancel(self, task_id: str) -> bool:
+        """Drop a job that has not started yet; False when it is running or unknown"""
+        with self._cond:
+            for i, (pending_id, _) in enumerate(self._pending):
+                if pending_id == task_id:
+                    del self._pending[i]
+                    return True
+        return False
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "running": len(self._running),
+                "queued": self._waiting(),
+                "max_queued": self.max_queued,
+                "accepting": self._accepting,
+            }
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                task_id, args = self._pending.popleft()
+                self._running.add(task_id)
+            try:
+                self.handler(task_id, *args)
+            except Exception as e:
+                print(f"❌ Job {task_id} crashed in worker: {e}")
+            finally:
+                with self._cond:
+                    self._running.discard(task_id)
+                    self._cond.notify_all()
+
+    def shutdown(self, drain_timeout: float = 0.0) -> Tuple[List[str], List[str]]:
+        """
+        Stop accepting jobs, drop the waiting ones and give running jobs up to
+        drain_timeout seconds to finish. Returns (never started, still running).
+        """
+        with self._cond:
+            self._accepting = False
+            dropped = [task_id for task_id, _ in self._pending]
+            self._pending.clear()
+            self._stopping = True
+            self._cond.notify_all()
+
+            deadline = time.time() + drain_timeout
+            while self._running and time.time() < deadline:
+                self._cond.wait(min(1.0, max(0.0, deadline - time.time())))
+            unfinished = sorted(self._running)
+        return dropped, unfinished
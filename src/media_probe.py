@@ -0,0 +1,293 @@
+"""
+Media Duration Probing for Code2Video
+Reads durations from file headers instead of decoding or spawning a process per file:
+MP3 frame headers with Xing/Info or VBRI tags (CBR streams by bitrate), and MP4/M4A
+mvhd/mdhd boxes. Results are memoized by (path, mtime, size); files the parsers cannot
+handle are probed together in a single ffmpeg call.
+"""
+
+import re
+import struct
+import subprocess
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from tracing import span
+
+
+@dataclass
+class MediaInfo:
+    duration: float  # seconds
+    container: str  # "mp3", "mp4" or "ffmpeg" (fallback)
+    # Per-track durations by handler type ("vide", "soun", ...), MP4 only
+    tracks: Dict[str, float] = field(default_factory=dict)
+
+
+# (path, mtime_ns, size) -> MediaInfo, so unchanged files are parsed once per process
+_INFO_CACHE: Dict[Tuple[str, int, int], MediaInfo] = {}
+_CACHE_LOCK = threading.Lock()
+
+# Give up looking for the first MP3 frame (after any ID3v2 tag) this far into the file
+_MP3_SYNC_SEARCH_BYTES = 64 * 1024
+
+# kbps by [MPEG-1 / MPEG-2(.5)][layer I, II, III][bitrate index]; index 0 (free) and 15 are invalid
+_MP3_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Hz by version bits (0 = MPEG-2.5, 2 = MPEG-2, 3 = MPEG-1) and sample rate index
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+_FFMPEG_INPUT_RE = re.compile(r"^Input #(\d+),", re.MULTILINE)
+_FFMPEG_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+
+
+# ---------------------------------------------------------------- MP3
+
+
+def _mp3_frame_header(header: bytes) -> Optional[Tuple[int, int, int, int, int, bool]]:
+    """(MPEG version bits, layer, bitrate bps, sample rate, samples per frame, mono) of a valid frame header"""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version_bits = (header[1] >> 3) & 0x3
+    layer = 4 - ((header[1] >> 1) & 0x3)
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x3
+    if version_bits == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version_bits == 3
+    bitrate = _MP3_BITRATES[(1 if mpeg1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version_bits][rate_index]
+    samples = 384 if layer == 1 else 1152 if layer == 2 or mpeg1 else 576
+    mono = header[3] >> 6 == 3
+    return version_bits, layer, bitrate, sample_rate, samples, mono
+
+
+def _id3v2_size(head: bytes) -> int:
+    """Bytes taken by a leading ID3v2 tag (0 without one)"""
+    if len(head) < 10 or head[:3] != b"ID3":
+        return 0
+    size = (head[6] & 0x7F) << 21 | (head[7] & 0x7F) << 14 | (head[8] & 0x7F) << 7 | (head[9] & 0x7F)
+    footer = 10 if head[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def parse_mp3(f: BinaryIO, file_size: int) -> Optional[MediaInfo]:
+    audio_start = _id3v2_size(f.read(10))
+    f.seek(audio_start)
+    data = f.read(_MP3_SYNC_SEARCH_BYTES)
+    pos = data.find(b"\xff")
+    while pos != -1 and pos + 4 <= len(data):
+        frame = _mp3_frame_header(data[pos : pos + 4])
+        if frame is not None:
+            break
+        pos = data.find(b"\xff", pos + 1)
+    else:
+        return None
+    version_bits, layer, bitrate, sample_rate, samples, mono = frame
+
+    # Xing/Info (LAME) tag sits after the side information of the first frame; VBRI at a fixed offset
+    side_info = (17 if mono else 32) if version_bits == 3 else (9 if mono else 17)
+    xing = pos + 4 + side_info
+    if data[xing : xing + 4] in (b"Xing", b"Info"):
+        (flags,) = struct.unpack(">I", data[xing + 4 : xing + 8])
+        if flags & 0x1:
+            (frames,) = struct.unpack(">I", data[xing + 8 : xing + 12])
+            return MediaInfo(frames * samples / sample_rate, "mp3")
+    vbri = pos + 4 + 32
+    if data[vbri : vbri + 4] == b"VBRI":
+        (frames,) = struct.unpack(">I", data[vbri + 14 : vbri + 18])
+        return MediaInfo(frames * samples / sample_rate, "mp3")
+
+    # Constant bitrate: audio bytes over the bitrate (minus a trailing ID3v1 tag)
+    f.seek(max(0, file_size - 128))
+    tail = f.read(3) if file_size >= 128 else b""
+    audio_bytes = file_size - (audio_start + pos) - (128 if tail == b"TAG" else 0)
+    return MediaInfo(max(0, audio_bytes) * 8 / bitrate, "mp3")
+
+
+# ---------------------------------------------------------------- MP4
+
+
+def _boxes(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[bytes, int, int]]:
+    """(type, payload start, box end) of the boxes in data[start:end]"""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack(">I4s", data[pos : pos + 8])
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            (size,) = struct.unpack(">Q", data[pos + 8 : pos + 16])
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield box_type, pos + header, pos + size
+        pos += size
+
+
+def _header_duration(data: bytes, start: int) -> Optional[float]:
+    """Duration of an mvhd/mdhd payload (version 0: 32-bit times, version 1: 64-bit)"""
+    if data[start] == 1:
+        timescale, duration = struct.unpack(">IQ", data[start + 20 : start + 32])
+    else:
+        timescale, duration = struct.unpack(">II", data[start + 12 : start + 20])
+    return duration / timescale if timescale else None
+
+
+def _read_moov(f: BinaryIO, file_size: int) -> Optional[bytes]:
+    """The moov box, found by skipping top-level boxes (mdat is never read)"""
+    pos = 0
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        header = f.read(16)
+        if len(header) < 8:
+            return None
+        size, box_type = struct.unpack(">I4s", header[:8])
+        if size == 1 and len(header) == 16:
+            (size,) = struct.unpack(">Q", header[8:16])
+        elif size == 0:
+            size = file_size - pos
+        if size < 8:
+            return None
+        if box_type == b"moov":
+            f.seek(pos)
+            return f.read(size)
+        pos += size
+    return None
+
+
+def parse_mp4(f: BinaryIO, file_size: int) -> Optional[MediaInfo]:
+    moov = _read_moov(f, file_size)
+    if moov is None:
+        return None
+    movie_duration = None
+    tracks: Dict[str, float] = {}
+    for box_type, start, end in _boxes(moov, 16 if moov[:4] == b"\x00\x00\x00\x01" else 8):
+        if box_type == b"mvhd":
+            movie_duration = _header_duration(moov, start)
+        elif box_type == b"trak":
+            handler, track_duration = None, None
+            for mdia_type, mdia_start, mdia_end in _boxes(moov, start, end):
+                if mdia_type != b"mdia":
+                    continue
+                for sub_type, sub_start, _ in _boxes(moov, mdia_start, mdia_end):
+                    if sub_type == b"mdhd":
+                        track_duration = _header_duration(moov, sub_start)
+                    elif sub_type == b"hdlr":
+                        handler = moov[sub_start + 8 : sub_start + 12].decode("latin-1")
+            if handler and track_duration:
+                tracks[handler] = max(tracks.get(handler, 0.0), track_duration)
+    # Fragmented files carry zero durations here; those go to the ffmpeg fallback
+    duration = movie_duration or max(tracks.values(), default=0.0)
+    if not duration:
+        return None
+    return MediaInfo(duration, "mp4", tracks)
+
+
+# ---------------------------------------------------------------- probing
+
+
+def _parse(path: Path, file_size: int) -> Optional[MediaInfo]:
+    with open(path, "rb") as f:
+        head = f.read(12)
+        f.seek(0)
+        if head[4:8] == b"ftyp":
+            return parse_mp4(f, file_size)
+        if path.suffix.lower() == ".mp3" or head[:3] == b"ID3":
+            return parse_mp3(f, file_size)
+    return None
+
+
+def _cache_key(path: Path) -> Tuple[str, int, int]:
+    stat = path.stat()
+    return str(path.resolve()), stat.st_mtime_ns, stat.st_size
+
+
+def _ffmpeg_durations(paths: List[Path]) -> Dict[Path, Optional[float]]:
+    """Container durations of many files from one ffmpeg process (it prints every input's header)"""
+    cmd = ["ffmpeg", "-hide_banner", "-nostdin"]
+    for path in paths:
+        cmd.extend(["-i", str(path)])
+    with span("ffmpeg:probe", files=len(paths)):
+        # No output file: ffmpeg exits non-zero after describing the inputs, which is all we need
+        stderr = subprocess.run(cmd, capture_output=True, text=True, errors="replace").stderr
+    durations: Dict[Path, Optional[float]] = {path: None for path in paths}
+    starts = [(int(m.group(1)), m.start()) for m in _FFMPEG_INPUT_RE.finditer(stderr)]
+    for n, (index, start) in enumerate(starts):
+        end = starts[n + 1][1] if n + 1 < len(starts) else len(stderr)
+        match = _FFMPEG_DURATION_RE.search(stderr, start, end)
+        if match and index < len(paths):
+            hours, minutes, seconds = match.groups()
+            durations[paths[index]] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    if len(paths) > 1:
+        # ffmpeg stops at the first input it cannot open, leaving every later one undescribed
+        described = {index for index, _ in starts}
+        for index, path in enumerate(paths):
+            if index not in described:
+                durations.update(_ffmpeg_durations([path]))
+    return durations
+
+
+def probe_many(paths: Iterable[str]) -> Dict[str, Optional[MediaInfo]]:
+    """MediaInfo per path (None when unreadable); unparsed files share one ffmpeg fallback call"""
+    results: Dict[str, Optional[MediaInfo]] = {}
+    fallback: Dict[Path, Tuple[str, Tuple[str, int, int]]] = {}
+    for original in paths:
+        path = Path(original)
+        try:
+            key = _cache_key(path)
+        except OSError:
+            results[str(original)] = None
+            continue
+        with _CACHE_LOCK:
+            info = _INFO_CACHE.get(key)
+        if info is None:
+            try:
+                info = _parse(path, key[2])
+            except (OSError, struct.error, IndexError, ValueError):
+                info = None
+            if info is None:
+                fallback[path] = (str(original), key)
+                continue
+            with _CACHE_LOCK:
+                _INFO_CACHE[key] = info
+        results[str(original)] = info
+
+    if fallback:
+        try:
+            durations = _ffmpeg_durations(list(fallback))
+        except OSError as e:
+            print(f"⚠️ ffmpeg probe failed: {e}")
+            durations = {}
+        for path, (original, key) in fallback.items():
+            duration = durations.get(path)
+            info = MediaInfo(duration, "ffmpeg") if duration is not None else None
+            if info is not None:
+                with _CACHE_LOCK:
+                    _INFO_CACHE[key] = info
+            results[original] = info
+    return results
+
+
+def probe(path: str) -> Optional[MediaInfo]:
+    return probe_many([path])[str(path)]
+
+
+def media_durations(paths: Iterable[str]) -> Dict[str, float]:
+    """Duration in seconds per path, 0.0 where it cannot be determined"""
+    return {path: info.duration if info else 0.0 for path, info in probe_many(paths).items()}
+
+
+def media_duration(path: str) -> float:
+    info = probe(path)
+    return info.duration if info else 0.0
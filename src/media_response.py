@@ -0,0 +1,121 @@
+"""
+Media Responses for the Code2Video API server
+Serves files with ETag / Last-Modified validators, Cache-Control and single-range
+HTTP Range support (206 Partial Content, 416 when unsatisfiable), so browsers can seek
+in a video and resume downloads without refetching the whole file.
+"""
+
+import re
+from email.utils import formatdate
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+from fastapi.responses import Response, StreamingResponse
+
+CHUNK_SIZE = 256 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def file_etag(path: Path) -> str:
+    """Validator from size and mtime: changes whenever the file is rewritten"""
+    st = path.stat()
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Inclusive (start, end) for a single "bytes=" range, None to serve the whole file
+    (no header, or several ranges which we are allowed to ignore).
+    """
+    if not header:
+        return None
+    header = header.strip()
+    if "," in header:
+        return None
+    match = _RANGE_RE.match(header)
+    if not match or match.groups() == ("", ""):
+        raise RangeNotSatisfiable(header)
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def _read_range(path: Path, start: int, end: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def media_response(
+    path: Path,
+    media_type: str,
+    headers: Dict[str, Optional[str]],
+    cache_control: str = "private, max-age=3600",
+    filename: Optional[str] = None,
+) -> Response:
+    """
+    headers: the request's "range", "if-range" and "if-none-match" values (None when absent).
+    """
+    path = Path(path)
+    size = path.stat().st_size
+    etag = file_etag(path)
+    response_headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": formatdate(path.stat().st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+    }
+    if filename:
+        response_headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+
+    if _etag_matches(headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=response_headers)
+
+    range_header = headers.get("range")
+    if_range = headers.get("if-range")
+    if if_range and if_range.strip() != etag:
+        # The client's partial copy is stale: send the whole new file
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={**response_headers, "Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+        response_headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response_headers["Content-Length"] = str(end - start + 1 if size else 0)
+
+    return StreamingResponse(
+        _read_range(path, start, end), status_code=status_code, media_type=media_type, headers=response_headers
+    )
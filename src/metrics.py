@@ -0,0 +1,336 @@
+"""
+Pipeline Metrics for Code2Video
+In-process counters, gauges and histograms rendered in the Prometheus text exposition
+format: served at /metrics by the API server and written to a textfile by CLI runs.
+Render worker processes ship their increments back to the parent with each result
+(drain() there, merge() here).
+"""
+
+import time
+import functools
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from run_manifest import atomic_write_text
+from tracing import span
+
+# Seconds: LLM calls and dry runs at the low end, whole render stages at the top
+DEFAULT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+EXPORT_INTERVAL_SECONDS = 15
+
+_INF_LABEL = 'le="+Inf"'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        unknown = set(labels) - set(self.labelnames)
+        if unknown:
+            raise ValueError(f"{self.name}: unknown labels {sorted(unknown)}")
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def snapshot(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        with self._lock:
+            return [(key, _copy(value)) for key, value in self._values.items()]
+
+
+def _copy(value):
+    return [list(value[0]), value[1], value[2]] if isinstance(value, list) else value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in self.snapshot()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in self.snapshot()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in self.snapshot():
+            for bound, bucket_count in zip(self.buckets, counts):
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, _INF_LABEL)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+
+    def histogram(
+        self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def register_collector(self, collector: Callable[[], None]):
+        """collector() runs before every render() to refresh gauges (queue depth, slots in use...)"""
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in list(self._collectors):
+            try:
+                collector()
+            except Exception as e:
+                print(f"⚠️ Metrics collector failed: {e}")
+        lines = []
+        for metric in sorted(self._metrics.values(), key=lambda m: m.name):
+            samples = metric._render()
+            if not samples:
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def drain(self) -> Dict[str, List]:
+        """Take (and reset) this process's counter and histogram values; picklable, for merge() in the parent"""
+        delta = {}
+        for metric in list(self._metrics.values()):
+            if isinstance(metric, Gauge):
+                continue
+            with metric._lock:
+                if metric._values:
+                    delta[metric.name] = [(key, _copy(value)) for key, value in metric._values.items()]
+                    metric._values.clear()
+        return delta
+
+    def merge(self, delta: Dict[str, List]):
+        for name, values in (delta or {}).items():
+            metric = self._metrics.get(name)
+            if metric is None:
+                continue
+            with metric._lock:
+                for key, value in values:
+                    key = tuple(key)
+                    if isinstance(metric, Histogram):
+                        entry = metric._values.setdefault(key, [[0] * len(metric.buckets), 0.0, 0])
+                        entry[0] = [a + b for a, b in zip(entry[0], value[0])]
+                        entry[1] += value[1]
+                        entry[2] += value[2]
+                    else:
+                        metric._values[key] = metric._values.get(key, 0) + value
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "code2video_stage_seconds",
+    "Wall-clock time of pipeline stages (per topic) and per-section steps (fix, feedback, tts)",
+    ("stage",),
+)
+RENDERS = REGISTRY.counter(
+    "code2video_renders_total",
+    "Manim renders by quality tier, outcome and ScopeRefineFixer.classify_error category",
+    ("quality", "result", "category"),
+)
+LLM_REQUESTS = REGISTRY.counter("code2video_llm_requests_total", "LLM requests by outcome", ("provider", "model", "status"))
+LLM_SECONDS = REGISTRY.histogram(
+    "code2video_llm_request_seconds", "LLM request latency including retries", ("provider", "model")
+)
+LLM_TOKENS = REGISTRY.counter("code2video_llm_tokens_total", "LLM tokens used", ("provider", "model", "kind"))
+TTS_SECONDS_SAVED = REGISTRY.counter(
+    "code2video_tts_seconds_saved_total", "Summed TTS request time minus audio stage wall time (concurrent synthesis)"
+)
+QUEUE_DEPTH = REGISTRY.gauge("code2video_queue_depth", "Generation jobs waiting for a worker")
+WORKERS = REGISTRY.gauge("code2video_workers", "Generation workers by state", ("state",))
+WORKER_UTILISATION = REGISTRY.gauge("code2video_worker_utilisation", "Fraction of generation workers busy")
+RENDER_SLOTS = REGISTRY.gauge("code2video_render_slots", "Render scheduler slots by state", ("state",))
+
+
+def record_queue_stats(stats: Dict[str, Any]):
+    """Gauges from JobQueue.stats()"""
+    QUEUE_DEPTH.set(stats["queued"])
+    WORKERS.set(stats["running"], state="busy")
+    WORKERS.set(stats["workers"], state="total")
+    WORKER_UTILISATION.set(stats["running"] / stats["workers"] if stats["workers"] else 0)
+
+
+def _collect_render_scheduler():
+    # Imported here: the scheduler pulls in psutil and the capacity planner
+    from render_scheduler import get_scheduler
+
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return
+    stats = scheduler.stats()
+    RENDER_SLOTS.set(stats["running"], state="running")
+    RENDER_SLOTS.set(stats["pending"], state="pending")
+    RENDER_SLOTS.set(stats["max_slots"], state="max")
+
+
+REGISTRY.register_collector(_collect_render_scheduler)
+
+
+def reset_worker_metrics():
+    """Pool initializer: a forked worker starts from a copy of the parent's values, drop them"""
+    REGISTRY.drain()
+
+
+def _usage_of(result) -> Tuple[Any, Dict[str, int]]:
+    """(completion, usage dict) from either a bare completion or a (completion, usage) tuple"""
+    if isinstance(result, tuple) and len(result) == 2 and isinstance(result[1], dict):
+        return result
+    usage = getattr(result, "usage", None)
+    if usage is None:
+        return result, {}
+    return result, {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+    }
+
+
+def instrument_llm(provider: str):
+    """Decorator for the gpt_request functions: latency, outcome and token counters per provider/model"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            model = "unknown"
+            try:
+                with span(f"llm:{provider}", function=func.__name__):
+                    result = func(*args, **kwargs)
+            except Exception:
+                LLM_REQUESTS.inc(provider=provider, model=model, status="error")
+                LLM_SECONDS.observe(time.perf_counter() - start, provider=provider, model=model)
+                raise
+            completion, usage = _usage_of(result)
+            model = getattr(completion, "model", None) or model
+            LLM_SECONDS.observe(time.perf_counter() - start, provider=provider, model=model)
+            LLM_REQUESTS.inc(provider=provider, model=model, status="ok" if completion is not None else "error")
+            for kind in ("prompt_tokens", "completion_tokens"):
+                if usage.get(kind):
+                    LLM_TOKENS.inc(usage[kind], provider=provider, model=model, kind=kind.split("_")[0])
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def write_metrics_file(path: Union[str, Path]):
+    """Prometheus textfile (e.g. for node_exporter's textfile collector), replaced atomically"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_text(path, REGISTRY.render())
+
+
+class MetricsFileExporter:
+    """Rewrites the metrics file every interval seconds and once more on stop()"""
+
+    def __init__(self, path: Union[str, Path], interval: float = EXPORT_INTERVAL_SECONDS):
+        self.path = Path(path)
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "MetricsFileExporter":
+        self._thread = threading.Thread(target=self._run, name="metrics-exporter", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._write()
+
+    def _write(self):
+        try:
+            write_metrics_file(self.path)
+        except OSError as e:
+            print(f"⚠️ Could not write metrics file {self.path}: {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._write()
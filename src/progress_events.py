@@ -0,0 +1,75 @@
+"""
+Progress Events for Code2Video
+Typed events a TeachingVideoAgent publishes while it runs (stage start/end, section
+rendered, section clip ready, tokens used, streaming playlist updated), delivered synchronously to the subscribers of that agent only.
+"""
+
+import time
+import threading
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, List, Optional
+
+
+STAGE_START = "stage_start"
+STAGE_END = "stage_end"
+SECTION_RENDERED = "section_rendered"
+# A section's deliverable clip (final quality, narration muxed in) is on disk
+SECTION_READY = "section_ready"
+TOKENS_USED = "tokens_used"
+STREAM_UPDATED = "stream_updated"
+
+# Pipeline stages in execution order
+STAGES = ("outline", "storyboard", "audio", "code", "render", "finalize", "audio_retry", "merge")
+
+
+@dataclass
+class ProgressEvent:
+    kind: str
+    stage: Optional[str] = None
+    section_id: Optional[str] = None
+    ok: bool = True
+    done: int = 0
+    total: int = 0
+    eta_seconds: Optional[float] = None
+    duration_seconds: Optional[float] = None
+    tokens: Optional[Dict[str, int]] = None
+    # Playback position and file of a ready section clip
+    index: Optional[int] = None
+    path: Optional[str] = None
+    ts: float = field(default_factory=time.time)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: v for k, v in asdict(self).items() if v is not None}
+
+
+ProgressCallback = Callable[[ProgressEvent], None]
+
+
+class ProgressBus:
+    """Per-agent list of callbacks; a failing subscriber never breaks the pipeline"""
+
+    def __init__(self):
+        self._subscribers: List[ProgressCallback] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback: ProgressCallback) -> Callable[[], None]:
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+
+        return unsubscribe
+
+    def emit(self, event: ProgressEvent):
+        if not self._subscribers:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"⚠️ Progress subscriber failed on {event.kind}: {e}")
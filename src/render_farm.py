@@ -0,0 +1,680 @@
+"""
+Render Farm for Code2Video
+Coordinator/worker mode spreading section renders over several machines. The
+coordinator owns the job queue (code, assets, quality), leases jobs to workers,
+re-queues them when a lease expires (crashed or stuck worker) and stores assets and
+result MP4s by content hash. Workers pull jobs over plain HTTP + JSON. Workers run
+the submitted scene code, so binding anything but loopback requires a shared token.
+
+    python render_farm.py coordinator --host 0.0.0.0 --port 8765 --token <secret>
+    python render_farm.py worker --url http://<coordinator>:8765
+    python agent.py ... --render_farm_url http://<coordinator>:8765
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import socket
+import hashlib
+import argparse
+import ipaddress
+import threading
+import urllib.error
+import urllib.request
+from dataclasses import dataclass, field, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from cancellation import CancellationToken
+from content_cache import ASSET_PATH_PATTERN, DEFAULT_CACHE_ROOT, ContentCache, file_digest, get_manim_version, hash_parts
+from incremental_render import IncrementalRenderer, RenderOutcome, get_render_quality
+
+
+LEASE_SECONDS = 120
+HEARTBEAT_SECONDS = 30
+# Lease expiries / worker errors tolerated per job before it is reported as failed
+MAX_ATTEMPTS = 3
+CHUNK_BYTES = 1 << 20
+# Long-poll length while waiting for a job; bounds how late a cancelled task notices
+FARM_CANCEL_POLL_SECONDS = 10
+# Finished jobs (and their code) are dropped from memory this long after they finish
+FINISHED_JOB_TTL_SECONDS = 3600
+# Submissions retried after a transport error before the render falls back to local (or fails)
+FARM_SUBMIT_RETRIES = 2
+FARM_RETRY_DELAY_SECONDS = 5
+
+
+@dataclass
+class FarmJob:
+    job_id: str
+    key: str  # content hash of everything that determines the video
+    topic: str
+    section_id: str
+    scene_name: str
+    code: str
+    quality: str
+    assets: Dict[str, str]  # reference as written in the code -> blob sha256
+    manim_version: str = "unknown"  # only workers with the same manim version lease the job
+    status: str = "queued"  # queued, leased, done, failed
+    attempts: int = 0
+    lease_id: Optional[str] = None
+    worker_id: Optional[str] = None
+    lease_expires: float = 0.0
+    returncode: Optional[int] = None
+    stdout: str = ""
+    stderr: str = ""
+    video_sha256: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: float = 0.0
+
+    def public(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("code")
+        return data
+
+
+class FarmCoordinator:
+    """In-memory job queue with leases; blobs (assets, result MP4s) live in a content-addressed store"""
+
+    def __init__(
+        self,
+        blob_dir: Path,
+        lease_seconds: int = LEASE_SECONDS,
+        max_attempts: int = MAX_ATTEMPTS,
+        max_blob_mb: int = 20480,
+        job_ttl_seconds: int = FINISHED_JOB_TTL_SECONDS,
+    ):
+        self.blobs = ContentCache(blob_dir, max_bytes=max_blob_mb * 1024 * 1024)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.job_ttl_seconds = job_ttl_seconds
+        self.jobs: Dict[str, FarmJob] = {}
+        self.queue: List[str] = []
+        self.done_by_key: Dict[str, str] = {}
+        self._cond = threading.Condition()
+
+    def submit(self, payload: Dict[str, Any]) -> FarmJob:
+        manim_version = payload.get("manim_version") or get_manim_version()
+        key = hash_parts(
+            payload["code"],
+            payload["scene_name"],
+            payload["quality"],
+            manim_version,
+            *sorted(payload.get("assets", {}).items()),
+        )
+        with self._cond:
+            self._prune_finished()
+            # Identical scene already rendered successfully and its video is still stored
+            done_id = self.done_by_key.get(key)
+            if done_id and self.blobs.get(self.jobs[done_id].video_sha256 or "") is not None:
+                return self.jobs[done_id]
+            job = FarmJob(
+                job_id=uuid.uuid4().hex,
+                key=key,
+                topic=payload.get("topic", ""),
+                section_id=payload["section_id"],
+                scene_name=payload["scene_name"],
+                code=payload["code"],
+                quality=payload["quality"],
+                assets=payload.get("assets", {}),
+                manim_version=manim_version,
+            )
+            self.jobs[job.job_id] = job
+            self.queue.append(job.job_id)
+            self._cond.notify_all()
+        return job
+
+    def _finish(self, job: FarmJob, status: str):
+        job.status = status
+        job.finished_at = time.time()
+
+    def _prune_finished(self):
+        """Forget jobs that finished more than job_ttl_seconds ago (the video itself stays in the blob store)"""
+        cutoff = time.time() - self.job_ttl_seconds
+        expired = [job_id for job_id, job in self.jobs.items() if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            job = self.jobs.pop(job_id)
+            if self.done_by_key.get(job.key) == job_id:
+                del self.done_by_key[job.key]
+
+    def _expire_leases(self):
+        now = time.time()
+        for job in self.jobs.values():
+            if job.status == "leased" and job.lease_expires < now:
+                print(f"⚠️ Lease of {job.section_id} on worker {job.worker_id} expired")
+                self._retry(job, "lease expired")
+
+    def _retry(self, job: FarmJob, error: str):
+        job.lease_id = None
+        job.worker_id = None
+        if job.attempts >= self.max_attempts:
+            self._finish(job, "failed")
+            job.error = f"{error} after {job.attempts} attempts"
+        else:
+            job.status = "queued"
+            self.queue.append(job.job_id)
+        self._cond.notify_all()
+
+    def _next_job(self, manim_version: str) -> Optional[FarmJob]:
+        """Pop the oldest queued job this worker's manim version can render; others stay queued"""
+        self.queue[:] = [job_id for job_id in self.queue if job_id in self.jobs and self.jobs[job_id].status == "queued"]
+        for i, job_id in enumerate(self.queue):
+            job = self.jobs[job_id]
+            if not manim_version or job.manim_version == manim_version:
+                del self.queue[i]
+                return job
+        return None
+
+    def lease(self, worker_id: str, wait: float = 0.0, manim_version: str = "") -> Optional[FarmJob]:
+        deadline = time.time() + wait
+        with self._cond:
+            while True:
+                self._expire_leases()
+                self._prune_finished()
+                job = self._next_job(manim_version)
+                if job is not None:
+                    job.status = "leased"
+                    job.attempts += 1
+                    job.lease_id = uuid.uuid4().hex
+                    job.worker_id = worker_id
+                    job.lease_expires = time.time() + self.lease_seconds
+                    return job
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(min(remaining, 1.0))
+
+    def _leased(self, job_id: str, lease_id: str) -> Optional[FarmJob]:
+        job = self.jobs.get(job_id)
+        if job is None or job.lease_id != lease_id or job.status != "leased":
+            return None
+        return job
+
+    def heartbeat(self, job_id: str, lease_id: str) -> bool:
+        with self._cond:
+            job = self._leased(job_id, lease_id)
+            if job is None:
+                return False
+            job.lease_expires = time.time() + self.lease_seconds
+            return True
+
+    def complete(self, job_id: str, lease_id: str, result: Dict[str, Any]) -> bool:
+        with self._cond:
+            video_sha = result.get("video_sha256")
+            error = result.get("error")
+            if not error and video_sha and self.blobs.get(video_sha) is None:
+                error = "result video was not uploaded"
+
+            job = self._leased(job_id, lease_id)
+            if job is None:
+                # Lease lost, but a render is deterministic: accept its result unless the job finished meanwhile
+                job = self.jobs.get(job_id)
+                if job is None or job.status in ("done", "failed") or error:
+                    return False
+            if error:
+                self._retry(job, error)
+                return True
+            self._finish(job, "done")
+            job.lease_id = None
+            job.returncode = result.get("returncode", 1)
+            job.stdout = result.get("stdout", "")
+            job.stderr = result.get("stderr", "")
+            job.video_sha256 = video_sha
+            if job.returncode == 0 and video_sha:
+                self.done_by_key[job.key] = job.job_id
+            self._cond.notify_all()
+            return True
+
+    def wait_for(self, job_id: str, timeout: float) -> Optional[FarmJob]:
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                self._expire_leases()
+                job = self.jobs.get(job_id)
+                if job is None or job.status in ("done", "failed"):
+                    return job
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return job
+                self._cond.wait(min(remaining, 1.0))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            counts: Dict[str, int] = {}
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            workers = sorted({job.worker_id for job in self.jobs.values() if job.status == "leased"})
+            return {"jobs": counts, "queued": len(self.queue), "active_workers": workers}
+
+
+def make_handler(coordinator: FarmCoordinator, token: str = ""):
+    class FarmHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: Any = None):
+            data = b"" if body is None else json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _authorized(self, body: bool = True) -> bool:
+            if token and self.headers.get("X-Farm-Token") != token:
+                self._send(401, {"error": "invalid farm token"} if body else None)
+                return False
+            return True
+
+        def _json_body(self) -> Dict[str, Any]:
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            if not self._authorized():
+                return
+            url = urlparse(self.path)
+            parts = url.path.strip("/").split("/")
+            if parts == ["stats"]:
+                return self._send(200, coordinator.stats())
+            if len(parts) == 2 and parts[0] == "jobs":
+                wait = float(parse_qs(url.query).get("wait", ["0"])[0])
+                job = coordinator.wait_for(parts[1], min(wait, 60.0))
+                return self._send(200, job.public()) if job else self._send(404, {"error": "unknown job"})
+            if len(parts) == 2 and parts[0] == "blobs":
+                entry = coordinator.blobs.get(parts[1])
+                if entry is None:
+                    return self._send(404, {"error": "unknown blob"})
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(entry.stat().st_size))
+                self.end_headers()
+                with open(entry, "rb") as f:
+                    shutil.copyfileobj(f, self.wfile, CHUNK_BYTES)
+                return
+            self._send(404, {"error": "not found"})
+
+        def do_HEAD(self):
+            if not self._authorized(body=False):
+                return
+            parts = urlparse(self.path).path.strip("/").split("/")
+            exists = len(parts) == 2 and parts[0] == "blobs" and coordinator.blobs.get(parts[1]) is not None
+            self.send_response(200 if exists else 404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_PUT(self):
+            if not self._authorized():
+                return
+            parts = urlparse(self.path).path.strip("/").split("/")
+            if len(parts) != 2 or parts[0] != "blobs":
+                return self._send(404, {"error": "not found"})
+            sha = parts[1]
+            remaining = int(self.headers.get("Content-Length") or 0)
+            tmp = coordinator.blobs.cache_dir / f".upload.{uuid.uuid4().hex}.tmp"
+            h = hashlib.sha256()
+            try:
+                with open(tmp, "wb") as f:
+                    while remaining > 0:
+                        chunk = self.rfile.read(min(CHUNK_BYTES, remaining))
+                        if not chunk:
+                            break
+                        h.update(chunk)
+                        f.write(chunk)
+                        remaining -= len(chunk)
+                if h.hexdigest() != sha:
+                    return self._send(400, {"error": "content does not match hash"})
+                coordinator.blobs.put(sha, tmp)
+            finally:
+                tmp.unlink(missing_ok=True)
+            self._send(201, {"sha256": sha})
+
+        def do_POST(self):
+            if not self._authorized():
+                return
+            parts = urlparse(self.path).path.strip("/").split("/")
+            body = self._json_body()
+            if parts == ["jobs"]:
+                missing = [sha for sha in body.get("assets", {}).values() if coordinator.blobs.get(sha) is None]
+                if missing:
+                    return self._send(400, {"error": "assets not uploaded", "missing": missing})
+                return self._send(200, coordinator.submit(body).public())
+            if parts == ["lease"]:
+                job = coordinator.lease(
+                    body.get("worker_id", "unknown"), min(float(body.get("wait", 0)), 30.0), body.get("manim_version", "")
+                )
+                if job is None:
+                    return self._send(200, {"job": None})
+                return self._send(200, {"job": {**job.public(), "code": job.code}, "lease_seconds": coordinator.lease_seconds})
+            if len(parts) == 3 and parts[0] == "jobs" and parts[2] in ("heartbeat", "complete"):
+                if parts[2] == "heartbeat":
+                    ok = coordinator.heartbeat(parts[1], body.get("lease_id", ""))
+                else:
+                    ok = coordinator.complete(parts[1], body.get("lease_id", ""), body)
+                return self._send(200 if ok else 409, {"ok": ok})
+            self._send(404, {"error": "not found"})
+
+    return FarmHandler
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def serve_coordinator(host: str, port: int, blob_dir: Path, token: str = "", **kwargs) -> Tuple[ThreadingHTTPServer, FarmCoordinator]:
+    """Start the coordinator HTTP server in a background thread (port 0 picks a free port)"""
+    # Workers execute whatever scene code is submitted: never expose an unauthenticated queue
+    if not token and not is_loopback(host):
+        raise ValueError(f"refusing to listen on {host} without a farm token (set --token or CODE2VIDEO_FARM_TOKEN)")
+    coordinator = FarmCoordinator(blob_dir, **kwargs)
+    server = ThreadingHTTPServer((host, port), make_handler(coordinator, token))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, coordinator
+
+
+class FarmConnection:
+    """Minimal JSON/blob HTTP client shared by workers and the agent side"""
+
+    def __init__(self, url: str, token: str = "", timeout: float = 90.0):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+
+    def _request(self, method: str, path: str, data: Optional[bytes] = None, content_type: str = "application/json"):
+        req = urllib.request.Request(f"{self.url}{path}", data=data, method=method)
+        if data is not None:
+            req.add_header("Content-Type", content_type)
+        if self.token:
+            req.add_header("X-Farm-Token", self.token)
+        return urllib.request.urlopen(req, timeout=self.timeout)
+
+    def call(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        try:
+            with self._request(method, path, data) as resp:
+                return json.loads(resp.read() or b"{}")
+        except urllib.error.HTTPError as e:
+            if e.code == 409:
+                return {"ok": False}
+            raise
+
+    def has_blob(self, sha: str) -> bool:
+        try:
+            with self._request("HEAD", f"/blobs/{sha}"):
+                return True
+        except urllib.error.HTTPError:
+            return False
+
+    def upload(self, path: Path, sha: Optional[str] = None) -> str:
+        sha = sha or file_digest(path)
+        if not self.has_blob(sha):
+            with open(path, "rb") as f:
+                data = f.read()
+            with self._request("PUT", f"/blobs/{sha}", data, "application/octet-stream"):
+                pass
+        return sha
+
+    def download(self, sha: str, dest: Path):
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            with self._request("GET", f"/blobs/{sha}") as resp, open(tmp, "wb") as f:
+                shutil.copyfileobj(resp, f, CHUNK_BYTES)
+            os.replace(tmp, dest)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+
+class FarmWorker:
+    """Pulls jobs from a coordinator and renders them locally with the incremental renderer"""
+
+    def __init__(self, url: str, work_dir: Path, manim_path: str = "manim", token: str = "", worker_id: str = ""):
+        self.conn = FarmConnection(url, token)
+        self.work_dir = Path(work_dir)
+        self.manim_path = manim_path
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.render_cache = ContentCache(self.work_dir / "render_cache", max_bytes=5 * 1024 * 1024 * 1024, suffix=".mp4")
+        self.manim_version = get_manim_version()
+        self._stop = threading.Event()
+
+    def _heartbeat(self, job_id: str, lease_id: str, interval: float, done: threading.Event):
+        while not done.wait(interval):
+            try:
+                if not self.conn.call("POST", f"/jobs/{job_id}/heartbeat", {"lease_id": lease_id}).get("ok"):
+                    return
+            except OSError:
+                pass
+
+    def _materialize(self, job: Dict[str, Any]) -> str:
+        """Download the job's assets and point the code at the local copies (line numbers unchanged)"""
+        code = job["code"]
+        for ref, sha in job["assets"].items():
+            local = self.work_dir / "assets" / f"{sha}{Path(ref).suffix}"
+            if not local.exists():
+                self.conn.download(sha, local)
+            code = code.replace(ref, str(local.resolve()))
+        return code
+
+    def run_job(self, job: Dict[str, Any], lease_seconds: int) -> Dict[str, Any]:
+        job_dir = self.work_dir / "jobs" / (job["topic"] or "default")
+        job_dir.mkdir(parents=True, exist_ok=True)
+        done = threading.Event()
+        beat = threading.Thread(
+            target=self._heartbeat,
+            args=(job["job_id"], job["lease_id"], max(1.0, min(HEARTBEAT_SECONDS, lease_seconds / 3)), done),
+            daemon=True,
+        )
+        beat.start()
+        try:
+            code = self._materialize(job)
+            with open(job_dir / f"{job['section_id']}.py", "w", encoding="utf-8") as f:
+                f.write(code)
+            renderer = IncrementalRenderer(
+                self.manim_path, job_dir, get_render_quality(job["quality"]), render_cache=self.render_cache, topic=job["topic"]
+            )
+            outcome = renderer.render(job["section_id"], code, job["scene_name"])
+            result = {
+                "lease_id": job["lease_id"],
+                "returncode": outcome.returncode,
+                "stdout": outcome.stdout[-20000:],
+                "stderr": outcome.stderr[-20000:],
+            }
+            if outcome.returncode == 0 and outcome.video_path:
+                result["video_sha256"] = self.conn.upload(Path(outcome.video_path))
+            return result
+        except Exception as e:
+            return {"lease_id": job["lease_id"], "error": f"worker {self.worker_id}: {e}"}
+        finally:
+            done.set()
+
+    def serve_forever(self, poll_seconds: float = 20.0):
+        print(f"🛠️ Render farm worker {self.worker_id} pulling from {self.conn.url}")
+        while not self._stop.is_set():
+            try:
+                reply = self.conn.call("POST", "/lease", {"worker_id": self.worker_id, "wait": poll_seconds, "manim_version": self.manim_version})
+            except OSError as e:
+                print(f"⚠️ Coordinator unreachable ({e}), retrying")
+                self._stop.wait(5)
+                continue
+            job = reply.get("job")
+            if not job:
+                continue
+            print(f"🎬 {self.worker_id} rendering {job['topic']} {job['section_id']} ({job['quality']})")
+            result = self.run_job(job, reply.get("lease_seconds", LEASE_SECONDS))
+            try:
+                self.conn.call("POST", f"/jobs/{job['job_id']}/complete", result)
+            except OSError as e:
+                print(f"⚠️ Could not report {job['section_id']}, its lease will expire: {e}")
+
+    def stop(self):
+        self._stop.set()
+
+
+class RemoteRenderer:
+    """
+    Drop-in for IncrementalRenderer.render() that renders on the farm and downloads the video.
+    Farm faults (unreachable coordinator, failed leases, timeouts) are retried, then handed to
+    the local fallback renderer when there is one; otherwise they come back as an outcome with
+    infrastructure_error set, which the fix loop must not treat as a scene error.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        output_dir: Path,
+        quality_name: str,
+        token: str = "",
+        timeout: int = 1800,
+        topic: str = "",
+        cancel_token: Optional[CancellationToken] = None,
+        fallback: Optional[IncrementalRenderer] = None,
+    ):
+        self.conn = FarmConnection(url, token)
+        self.fallback = fallback
+        self.cancel_token = cancel_token
+        self.output_dir = Path(output_dir)
+        self.quality = get_render_quality(quality_name)
+        self.timeout = timeout
+        self.topic = topic or self.output_dir.name
+
+    @property
+    def manim_path(self) -> str:
+        # Interface parity with IncrementalRenderer: the agent's manim path fix-up reaches the local fallback
+        return self.fallback.manim_path if self.fallback is not None else "manim"
+
+    @manim_path.setter
+    def manim_path(self, path: str):
+        if self.fallback is not None:
+            self.fallback.manim_path = path
+
+    def final_video_path(self, section_id: str, scene_name: str) -> Path:
+        return self.output_dir / "media" / "videos" / section_id / self.quality.quality_dir / f"{scene_name}.mp4"
+
+    def _upload_assets(self, code: str) -> Dict[str, str]:
+        assets = {}
+        for ref in sorted(set(ASSET_PATH_PATTERN.findall(code))):
+            path = Path(ref) if Path(ref).is_absolute() else self.output_dir / ref
+            if path.exists():
+                assets[ref] = self.conn.upload(path)
+        return assets
+
+    def render(self, section_id: str, code: str, scene_name: str) -> RenderOutcome:
+        for attempt in range(FARM_SUBMIT_RETRIES + 1):
+            outcome = self._render_on_farm(section_id, code, scene_name)
+            if not outcome.infrastructure_error:
+                return outcome
+            # Only transport errors are worth another submission; failed or timed-out jobs are not
+            if attempt < FARM_SUBMIT_RETRIES and outcome.stderr.startswith("Render farm unreachable"):
+                print(f"⚠️ {section_id}: {outcome.stderr}, retrying in {FARM_RETRY_DELAY_SECONDS}s")
+                if self.cancel_token is not None:
+                    self.cancel_token.check()
+                time.sleep(FARM_RETRY_DELAY_SECONDS)
+                continue
+            break
+        if self.fallback is not None:
+            print(f"⚠️ {section_id}: {outcome.stderr.splitlines()[0]}; rendering locally instead")
+            return self.fallback.render(section_id, code, scene_name)
+        return outcome
+
+    def _render_on_farm(self, section_id: str, code: str, scene_name: str) -> RenderOutcome:
+        try:
+            job = self.conn.call(
+                "POST",
+                "/jobs",
+                {
+                    "topic": self.topic,
+                    "section_id": section_id,
+                    "scene_name": scene_name,
+                    "code": code,
+                    "quality": self.quality.name,
+                    "assets": self._upload_assets(code),
+                    "manim_version": get_manim_version(),
+                },
+            )
+            deadline = time.time() + self.timeout
+            while job["status"] not in ("done", "failed") and time.time() < deadline:
+                if self.cancel_token is not None:
+                    # Stop waiting; the farm finishes (and caches) the job for whoever asks next
+                    self.cancel_token.check()
+                job = self.conn.call("GET", f"/jobs/{job['job_id']}?wait={FARM_CANCEL_POLL_SECONDS}")
+        except (OSError, ValueError) as e:
+            return RenderOutcome(1, "", f"Render farm unreachable: {e}", infrastructure_error=True)
+
+        if job["status"] == "failed":
+            return RenderOutcome(1, "", f"Render farm job failed: {job.get('error')}", infrastructure_error=True)
+        if job["status"] != "done":
+            return RenderOutcome(1, "", f"Render farm job timed out after {self.timeout}s", infrastructure_error=True)
+
+        video_path = None
+        if job["returncode"] == 0 and job.get("video_sha256"):
+            final_path = self.final_video_path(section_id, scene_name)
+            try:
+                self.conn.download(job["video_sha256"], final_path)
+                video_path = str(final_path)
+            except OSError as e:
+                return RenderOutcome(1, job["stdout"], f"Render farm unreachable: could not download video: {e}", infrastructure_error=True)
+        return RenderOutcome(job["returncode"], job["stdout"], job["stderr"], video_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Code2Video render farm")
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    coord = sub.add_parser("coordinator")
+    coord.add_argument("--host", type=str, default="127.0.0.1", help="non-loopback hosts require --token")
+    coord.add_argument("--port", type=int, default=8765)
+    coord.add_argument("--blob_dir", type=str, default=str(DEFAULT_CACHE_ROOT / "farm_blobs"))
+    coord.add_argument("--lease_seconds", type=int, default=LEASE_SECONDS)
+    coord.add_argument("--max_attempts", type=int, default=MAX_ATTEMPTS)
+    coord.add_argument("--token", type=str, default=os.getenv("CODE2VIDEO_FARM_TOKEN", ""))
+
+    worker = sub.add_parser("worker")
+    worker.add_argument("--url", type=str, required=True)
+    worker.add_argument("--work_dir", type=str, default=str(DEFAULT_CACHE_ROOT / "farm_worker"))
+    worker.add_argument("--manim_path", type=str, default=shutil.which("manim") or str(Path(sys.executable).parent / "manim"))
+    worker.add_argument("--token", type=str, default=os.getenv("CODE2VIDEO_FARM_TOKEN", ""))
+    worker.add_argument("--worker_id", type=str, default="")
+
+    args = parser.parse_args()
+    if args.mode == "coordinator":
+        try:
+            server, _ = serve_coordinator(
+                args.host,
+                args.port,
+                Path(args.blob_dir),
+                args.token,
+                lease_seconds=args.lease_seconds,
+                max_attempts=args.max_attempts,
+            )
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"🗂️ Render farm coordinator listening on {args.host}:{server.server_address[1]}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+    else:
+        try:
+            FarmWorker(args.url, Path(args.work_dir), args.manim_path, args.token, args.worker_id).serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Node-wide Render Scheduler for Code2Video
+Every manim subprocess on the machine (all topic batches, all render workers) asks one
+scheduler for a slot before starting. Slots are admitted against live CPU load and free
+memory, handed out fair-share across topics and, within a topic, longest job first so
+the section gating the topic's merge starts as early as possible.
+"""
+
+import os
+import time
+import uuid
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from multiprocessing.managers import BaseManager
+from typing import Dict, Iterator, List, Optional
+
+import psutil
+
+from capacity_planner import plan_capacity
+
+
+# "host:port:authkey" of the scheduler server, inherited by every child process
+SCHEDULER_ENV = "CODE2VIDEO_SCHEDULER"
+
+# How often waiting clients re-check admission (load changes without notifications)
+ADMISSION_POLL_SECONDS = 0.5
+
+
+def resource_snapshot(interval: Optional[float] = None) -> Dict[str, float]:
+    """CPU and memory usage of the node; interval=None compares against the previous call and never blocks"""
+    memory = psutil.virtual_memory()
+    return {
+        "cpu_percent": psutil.cpu_percent(interval=interval),
+        "memory_percent": memory.percent,
+        "available_mb": memory.available / (1024 * 1024),
+    }
+
+
+@dataclass
+class SchedulerConfig:
+    # Hard cap on concurrent renders; 0 = capacity plan for quality (CPU, memory, cgroup limits)
+    max_slots: int = 0
+    quality: str = "draft"
+    # New renders are only admitted below this CPU load and above this much free memory,
+    # unless nothing is running at all (progress is always possible)
+    max_cpu_percent: float = 85.0
+    min_free_mb: int = 1024
+
+    def resolved_slots(self) -> int:
+        if self.max_slots > 0:
+            return self.max_slots
+        return plan_capacity(self.quality).workers
+
+
+@dataclass(order=True)
+class _Ticket:
+    sort_key: tuple
+    ticket_id: str = field(compare=False)
+    topic: str = field(compare=False)
+    label: str = field(compare=False)
+    cost: float = field(compare=False)
+    pid: int = field(compare=False)
+    submitted: float = field(compare=False)
+
+
+class RenderScheduler:
+    """Thread-safe slot scheduler; served from a manager process so all processes share one instance"""
+
+    def __init__(self, config: Optional[SchedulerConfig] = None):
+        self.config = config or SchedulerConfig()
+        self.max_slots = self.config.resolved_slots()
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        # topic -> heap of waiting tickets (highest cost first, then FIFO)
+        self._pending: Dict[str, List[_Ticket]] = {}
+        self._running: Dict[str, _Ticket] = {}
+        self._running_per_topic: Dict[str, int] = {}
+        self._granted_per_topic: Dict[str, int] = {}
+        self._waited_seconds = 0.0
+        self._granted_total = 0
+        resource_snapshot()  # prime cpu_percent so the first non-blocking reading is meaningful
+
+    def _reap_dead(self):
+        """Release slots of processes that died while holding them"""
+        for ticket_id, ticket in list(self._running.items()):
+            if not psutil.pid_exists(ticket.pid):
+                print(f"⚠️ Render slot of dead process {ticket.pid} ({ticket.topic} {ticket.label}) reclaimed")
+                self._finish(ticket_id)
+
+    def _finish(self, ticket_id: str) -> Optional[_Ticket]:
+        ticket = self._running.pop(ticket_id, None)
+        if ticket is not None:
+            self._running_per_topic[ticket.topic] -= 1
+            if not self._running_per_topic[ticket.topic]:
+                del self._running_per_topic[ticket.topic]
+        return ticket
+
+    def _next_ticket(self) -> Optional[_Ticket]:
+        """Fair share: the topic with the fewest running renders (then fewest granted) goes next"""
+        best_topic = None
+        best_key = None
+        for topic, heap in self._pending.items():
+            if not heap:
+                continue
+            key = (self._running_per_topic.get(topic, 0), self._granted_per_topic.get(topic, 0), heap[0].sort_key)
+            if best_key is None or key < best_key:
+                best_topic, best_key = topic, key
+        return self._pending[best_topic][0] if best_topic is not None else None
+
+    def _admissible(self) -> bool:
+        if not self._running:
+            return True
+        if len(self._running) >= self.max_slots:
+            return False
+        load = resource_snapshot()
+        return load["cpu_percent"] < self.config.max_cpu_percent and load["available_mb"] > self.config.min_free_mb
+
+    def acquire(self, topic: str, label: str = "", cost: float = 1.0, pid: int = 0) -> str:
+        """Block until admitted; returns a ticket id to pass to release()"""
+        ticket = _Ticket(
+            sort_key=(-cost, next(self._seq)),
+            ticket_id=uuid.uuid4().hex,
+            topic=topic,
+            label=label,
+            cost=cost,
+            pid=pid or os.getpid(),
+            submitted=time.time(),
+        )
+        with self._cond:
+            heapq.heappush(self._pending.setdefault(topic, []), ticket)
+            while True:
+                self._reap_dead()
+                if self._next_ticket() is ticket and self._admissible():
+                    break
+                self._cond.wait(ADMISSION_POLL_SECONDS)
+
+            heapq.heappop(self._pending[topic])
+            if not self._pending[topic]:
+                del self._pending[topic]
+            self._running[ticket.ticket_id] = ticket
+            self._running_per_topic[topic] = self._running_per_topic.get(topic, 0) + 1
+            self._granted_per_topic[topic] = self._granted_per_topic.get(topic, 0) + 1
+            self._granted_total += 1
+            self._waited_seconds += time.time() - ticket.submitted
+            self._cond.notify_all()
+        return ticket.ticket_id
+
+    def release(self, ticket_id: str):
+        with self._cond:
+            self._finish(ticket_id)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "max_slots": self.max_slots,
+                "running": len(self._running),
+                "pending": sum(len(heap) for heap in self._pending.values()),
+                "running_per_topic": dict(self._running_per_topic),
+                "granted_total": self._granted_total,
+                "avg_wait_seconds": self._waited_seconds / self._granted_total if self._granted_total else 0.0,
+                **resource_snapshot(),
+            }
+
+
+class SchedulerManager(BaseManager):
+    pass
+
+
+_SERVER_SCHEDULER: Optional[RenderScheduler] = None
+
+
+def _init_server(config: SchedulerConfig):
+    global _SERVER_SCHEDULER
+    _SERVER_SCHEDULER = RenderScheduler(config)
+
+
+def _get_server_scheduler() -> RenderScheduler:
+    return _SERVER_SCHEDULER
+
+
+SchedulerManager.register("scheduler", callable=_get_server_scheduler)
+
+# Manager owned by this process (if it started the server) and the proxy used by this process
+_MANAGER: Optional[SchedulerManager] = None
+_CLIENT = None
+_CLIENT_PID = 0
+_CLIENT_LOCK = threading.Lock()
+
+
+def start_scheduler(config: Optional[SchedulerConfig] = None) -> bool:
+    """
+    Start the node-wide scheduler unless this process tree already has one. Must run
+    before render/batch pools are created so their workers inherit the address.
+    """
+    global _MANAGER
+    if os.environ.get(SCHEDULER_ENV):
+        return True
+    config = config or SchedulerConfig()
+    authkey = uuid.uuid4().hex
+    try:
+        manager = SchedulerManager(address=("127.0.0.1", 0), authkey=authkey.encode())
+        manager.start(_init_server, (config,))
+    except Exception as e:
+        print(f"⚠️ Render scheduler could not be started, renders are not throttled: {e}")
+        return False
+    _MANAGER = manager
+    host, port = manager.address
+    os.environ[SCHEDULER_ENV] = f"{host}:{port}:{authkey}"
+    print(
+        f"🚦 Render scheduler started: {config.resolved_slots()} slots, "
+        f"admission below {config.max_cpu_percent:.0f}% CPU and above {config.min_free_mb} MB free"
+    )
+    return True
+
+
+def stop_scheduler():
+    global _MANAGER, _CLIENT
+    if _MANAGER is None:
+        return
+    _MANAGER.shutdown()
+    _MANAGER = None
+    _CLIENT = None
+    os.environ.pop(SCHEDULER_ENV, None)
+
+
+def get_scheduler():
+    """Proxy to the shared scheduler, or None when none is running for this process tree"""
+    global _CLIENT, _CLIENT_PID
+    address = os.environ.get(SCHEDULER_ENV)
+    if not address:
+        return None
+    with _CLIENT_LOCK:
+        # Forked children must not reuse the parent's connection
+        if _CLIENT is None or _CLIENT_PID != os.getpid():
+            host, port, authkey = address.rsplit(":", 2)
+            try:
+                manager = SchedulerManager(address=(host, int(port)), authkey=authkey.encode())
+                manager.connect()
+                _CLIENT = manager.scheduler()
+                _CLIENT_PID = os.getpid()
+            except Exception as e:
+                print(f"⚠️ Render scheduler unreachable, rendering unthrottled: {e}")
+                return None
+        return _CLIENT
+
+
+@contextmanager
+def render_slot(topic: str, label: str = "", cost: float = 1.0) -> Iterator[None]:
+    """Hold one node-wide render slot for the duration of the block (no-op without a scheduler)"""
+    scheduler = get_scheduler()
+    ticket_id = None
+    if scheduler is not None:
+        try:
+            ticket_id = scheduler.acquire(topic, label, cost, os.getpid())
+        except Exception as e:
+            print(f"⚠️ Render scheduler unavailable, rendering unthrottled: {e}")
+    try:
+        yield
+    finally:
+        if ticket_id is not None:
+            try:
+                scheduler.release(ticket_id)
+            except Exception:
+                pass  # the server reclaims slots of dead holders
@@ -0,0 +1,84 @@
+"""
+Result Cache for the Code2Video API server
+Finished videos keyed by a normalized request (knowledge point, model, narration
+voice), kept on disk for a TTL and evicted least-recently-used beyond a size cap, so a
+repeated request is answered without running the pipeline again.
+"""
+
+import re
+import time
+import json
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from content_cache import ContentCache, DEFAULT_CACHE_ROOT, hash_parts
+from run_manifest import atomic_write_json
+
+DEFAULT_RESULT_CACHE_DIR = DEFAULT_CACHE_ROOT / "results"
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_topic(knowledge_point: str) -> str:
+    """Case-, width- and whitespace-insensitive form of a knowledge point"""
+    text = unicodedata.normalize("NFKC", knowledge_point)
+    return _WHITESPACE_RE.sub(" ", text).strip().casefold()
+
+
+def request_key(knowledge_point: str, api: str, use_tts: bool, tts_voice: str) -> str:
+    """Requests with the same key produce interchangeable videos"""
+    # The voice only matters when there is narration
+    voice = tts_voice.strip().lower() if use_tts else ""
+    return hash_parts("result", normalize_topic(knowledge_point), api.strip().lower(), int(use_tts), voice)
+
+
+class ResultCache:
+    """ContentCache of final videos plus an index of when each entry was produced"""
+
+    def __init__(self, cache_dir: Path, max_bytes: int, ttl_seconds: float):
+        self.files = ContentCache(cache_dir, max_bytes, suffix=".mp4")
+        # Dot-prefixed so ContentCache.evict never counts or removes it
+        self.index_path = Path(cache_dir) / ".index.json"
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Index metadata plus "path" of a live entry, None when missing or older than the TTL"""
+        with self._lock:
+            index = self._load()
+            meta = index.get(key)
+            if meta is None:
+                return None
+            entry = self.files.get(key)
+            if entry is None or time.time() - meta["created"] > self.ttl_seconds:
+                if entry is not None:
+                    entry.unlink(missing_ok=True)
+                del index[key]
+                atomic_write_json(self.index_path, index)
+                return None
+        return {**meta, "path": str(entry)}
+
+    def put(self, key: str, video_path: Path, **meta) -> Path:
+        with self._lock:
+            # A fresh result replaces whatever an earlier run left under the same key
+            self.files._entry(key).unlink(missing_ok=True)
+            entry = self.files.put(key, video_path)
+            index = self._load()
+            index[key] = {"created": time.time(), **meta}
+            # Drop index rows of entries that eviction (or an operator) removed
+            index = {k: v for k, v in index.items() if self.files._entry(k).exists()}
+            atomic_write_json(self.index_path, index)
+        return entry
+
+    def link_into(self, key: str, dest: Path) -> bool:
+        """Hard-link the cached video to dest; the link survives later eviction of the entry"""
+        return self.files.link_into(key, dest)
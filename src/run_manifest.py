@@ -0,0 +1,182 @@
+"""
+Run Manifest for Code2Video
+Append-only record of every pipeline stage of one topic (inputs hash, outputs,
+status), used to resume interrupted runs. Compacted to the newest record per stage on load.
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+from tracing import span
+
+
+MANIFEST_NAME = "manifest.jsonl"
+
+# Outputs up to this size are verified by content hash, larger ones (videos) by size
+SMALL_FILE_BYTES = 1 << 20
+
+
+def atomic_write_bytes(path: Union[str, Path], data: bytes):
+    """Write via a temp file in the same directory plus rename, so readers never see a partial file"""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with span("write", file=path.name, bytes=len(data)):
+            with open(tmp, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def atomic_write_text(path: Union[str, Path], text: str):
+    atomic_write_bytes(path, text.encode("utf-8"))
+
+
+def atomic_write_json(path: Union[str, Path], data: Any):
+    atomic_write_text(path, json.dumps(data, ensure_ascii=False, indent=2))
+
+
+def _sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class RunManifest:
+    """
+    Per-topic stage log stored as JSON lines in <output_dir>/manifest.jsonl.
+
+    Records are only ever appended; the newest record of a stage wins. Opening a
+    manifest atomically rewrites it without superseded or torn records, so the file
+    stays proportional to the number of stages across reruns. A stage is fresh when
+    its newest record succeeded, was produced from the same inputs hash and all of
+    its outputs are still intact on disk.
+    """
+
+    def __init__(self, output_dir: Path):
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / MANIFEST_NAME
+        # Folders produced before manifests existed: fall back to "file exists" checks
+        self.legacy = not self.path.exists() and (self.output_dir / "outline.json").exists()
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            text = f.read()
+        lines = text.splitlines()
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict) and "stage" in record:
+                # Re-inserted so the compacted file keeps stages in the order they last ran
+                self._latest.pop(record["stage"], None)
+                self._latest[record["stage"]] = record
+        # Superseded or unreadable records, or a torn last line the next append would run into
+        if len(lines) > len(self._latest) or not text.endswith("\n"):
+            atomic_write_text(self.path, "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in self._latest.values()))
+
+    def _relative(self, path: Path) -> str:
+        path = Path(path)
+        try:
+            return path.resolve().relative_to(self.output_dir.resolve()).as_posix()
+        except ValueError:
+            return str(path)
+
+    def _resolve(self, stored: str) -> Path:
+        path = Path(stored)
+        return path if path.is_absolute() else self.output_dir / path
+
+    def describe(self, path: Union[str, Path]) -> Dict[str, Any]:
+        """Fingerprint of an output file"""
+        path = Path(path)
+        size = path.stat().st_size
+        desc = {"path": self._relative(path), "size": size}
+        if size <= SMALL_FILE_BYTES:
+            desc["sha256"] = _sha256_file(path)
+        return desc
+
+    def fingerprint(self, path: Union[str, Path]) -> str:
+        """Compact string form of describe(), usable as part of a downstream inputs hash"""
+        try:
+            desc = self.describe(path)
+        except OSError:
+            return f"{path}:missing"
+        return f"{desc['path']}:{desc['size']}:{desc.get('sha256', '')}"
+
+    def _intact(self, desc: Dict[str, Any]) -> bool:
+        path = self._resolve(desc["path"])
+        try:
+            if path.stat().st_size != desc["size"]:
+                return False
+            return "sha256" not in desc or _sha256_file(path) == desc["sha256"]
+        except OSError:
+            return False
+
+    def latest(self, stage: str) -> Optional[Dict[str, Any]]:
+        return self._latest.get(stage)
+
+    def is_fresh(self, stage: str, inputs_hash: Optional[str] = None) -> bool:
+        record = self._latest.get(stage)
+        if not record or record.get("status") != "done":
+            return False
+        if inputs_hash is not None and record.get("inputs") != inputs_hash:
+            return False
+        return all(self._intact(desc) for desc in record.get("outputs", {}).values())
+
+    def outputs(self, stage: str) -> Dict[str, str]:
+        record = self._latest.get(stage) or {}
+        return {name: str(self._resolve(desc["path"])) for name, desc in record.get("outputs", {}).items()}
+
+    def record(
+        self,
+        stage: str,
+        inputs_hash: str,
+        outputs: Optional[Dict[str, Union[str, Path]]] = None,
+        status: str = "done",
+        **meta,
+    ) -> Dict[str, Any]:
+        """Append a stage record as one JSON line"""
+        described = {}
+        for name, path in (outputs or {}).items():
+            if path and Path(path).exists():
+                described[name] = self.describe(path)
+        record = {"stage": stage, "inputs": inputs_hash, "status": status, "outputs": described, "ts": time.time()}
+        if meta:
+            record["meta"] = meta
+
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock, span("write", file=self.path.name, bytes=len(line)):
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._latest[stage] = record
+        return record
+
+    def is_complete(self, inputs_hash: str, final_stage: str = "merge") -> bool:
+        """
+        True when the final stage matches inputs_hash and every other stage recorded so far is
+        intact. Stages recorded as failed are terminal: the final stage was produced without them
+        (e.g. a section that never rendered is left out of the merge).
+        """
+        if not self.is_fresh(final_stage, inputs_hash):
+            return False
+        return all(record.get("status") == "failed" or self.is_fresh(stage) for stage, record in self._latest.items())
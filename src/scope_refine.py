@@ -4,15 +4,35 @@ import json
 from dataclasses import dataclass
 import subprocess
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional, Any
+from typing import Callable, Dict, List, Tuple, Optional, Any
 import logging
 
+from tracing import span
+
+# Compiled once: these run on every traceback and every generated section.
+# An error type can only start where a word starts; the lookbehind rejects every other
+# position up front instead of re-scanning the rest of the word from it.
+_ERROR_TYPE_RE = re.compile(r"(?<!\w)(\w+Error|\w+Exception)")
+_LINE_NUMBER_RE = re.compile(r"line (\d+)")
+_COLUMN_RE = re.compile(r"column (\d+)")
+_PROBLEM_CODE_RE = re.compile(r'File ".*?", line \d+.*?\n\s*(.*)')
+_UNDEFINED_NAME_RE = re.compile(r"name '(\w+)' is not defined")
+_MISSING_ATTRIBUTE_RE = re.compile(r"'(\w+)' object has no attribute '(\w+)'")
+_ANIMATION_MARKER_RE = re.compile(r"\s*# === Animation for Lecture Line \d+ ===")
+_PLACE_AT_GRID_RE = re.compile(
+    r'self\.place_at_grid\(\s*([^,]+),\s*[\'"]([A-F][1-6])[\'"](?:,\s*scale_factor=([0-9.]+))?\s*\)'
+)
+_PLACE_IN_AREA_RE = re.compile(
+    r'self\.place_in_area\(\s*([^,]+),\s*[\'"]([A-F][1-6])[\'"],\s*[\'"]([A-F][1-6])[\'"](?:,\s*scale_factor=([0-9.]+))?\s*\)'
+)
+
 logger = logging.getLogger(__name__)
 
 
 def get_completion_only(result):
     if isinstance(result, tuple) and len(result) >= 1:
         return result[0]
+    return result
 
 
 class ManimCodeErrorAnalyzer:
@@ -59,22 +79,22 @@ class ManimCodeErrorAnalyzer:
         result = {}
 
         # Extract the error type
-        error_type_match = re.search(r"(\w+Error|\w+Exception)", error_msg)
+        error_type_match = _ERROR_TYPE_RE.search(error_msg)
         if error_type_match:
             result["error_type"] = error_type_match.group(1)
 
         # Extract the line number
-        line_match = re.search(r"line (\d+)", error_msg)
+        line_match = _LINE_NUMBER_RE.search(error_msg)
         if line_match:
             result["line_number"] = int(line_match.group(1))
 
         # Extract the column number
-        column_match = re.search(r"column (\d+)", error_msg)
+        column_match = _COLUMN_RE.search(error_msg)
         if column_match:
             result["column"] = int(column_match.group(1))
 
         # Extract the problematic code
-        code_match = re.search(r'File ".*?", line \d+.*?\n\s*(.*)', error_msg)
+        code_match = _PROBLEM_CODE_RE.search(error_msg)
         if code_match:
             result["problematic_code"] = code_match.group(1).strip()
 
@@ -83,7 +103,7 @@ class ManimCodeErrorAnalyzer:
     def _analyze_name_error(self, code: str, error_msg: str, error_info: Dict) -> Dict:
         """Analyze NameError"""
         # Extract the undefined variable name
-        name_match = re.search(r"name '(\w+)' is not defined", error_msg)
+        name_match = _UNDEFINED_NAME_RE.search(error_msg)
         if name_match:
             undefined_name = name_match.group(1)
 
@@ -101,7 +121,7 @@ class ManimCodeErrorAnalyzer:
     def _analyze_attribute_error(self, code: str, error_msg: str, error_info: Dict) -> Dict:
         """Analyze AttributeError"""
         # Extract the object and attribute
-        attr_match = re.search(r"'(\w+)' object has no attribute '(\w+)'", error_msg)
+        attr_match = _MISSING_ATTRIBUTE_RE.search(error_msg)
         if attr_match:
             obj_type, attr_name = attr_match.groups()
 
@@ -199,7 +219,7 @@ class ManimCodeErrorAnalyzer:
         section_end = None
 
         for i, line in enumerate(lines):
-            if re.match(r"\s*# === Animation for Lecture Line \d+ ===", line):
+            if _ANIMATION_MARKER_RE.match(line):
                 if section_start is None:
                     section_start = i
                 elif i > line_number:
@@ -315,7 +335,7 @@ class ScopeRefineFixer:
         context = {"line_number": None, "error_line": None, "traceback": error_msg, "specific_error": None}
 
         # Extract line number
-        line_match = re.search(r"line (\d+)", error_msg)
+        line_match = _LINE_NUMBER_RE.search(error_msg)
         if line_match:
             context["line_number"] = int(line_match.group(1))
 
@@ -355,7 +375,8 @@ class ScopeRefineFixer:
             scene_name = f"{section_id.title().replace('_', '')}Scene"
             cmd = ["python", "-c", f"from test_{section_id} import {scene_name}; scene = {scene_name}(); print('Syntax OK')"]
 
-            result = subprocess.run(cmd, capture_output=True, text=True, cwd=output_dir, timeout=10)
+            with span("dry_run", section=section_id):
+                result = subprocess.run(cmd, capture_output=True, text=True, cwd=output_dir, timeout=10)
 
             test_file.unlink()  # Clean up test file
 
@@ -374,19 +395,24 @@ class ScopeRefineFixer:
         if not code:
             return None
 
-        # Remove markdown code block markers
-        if "```python" in code:
-            code = code.split("```python")[1].split("```")[0].strip()
-        elif "```" in code:
-            code = code.split("```")[1].strip()
+        # Remove markdown code block markers (slice between fences instead of splitting the whole response)
+        start = code.find("```python")
+        if start != -1:
+            start += len("```python")
+        else:
+            start = code.find("```")
+            if start != -1:
+                start += 3
+        if start != -1:
+            end = code.find("```", start)
+            code = code[start : end if end != -1 else len(code)].strip()
 
         # Remove extra empty lines
-        lines = code.split("\n")
         cleaned_lines = []
         prev_empty = False
 
-        for line in lines:
-            if line.strip():
+        for line in code.split("\n"):
+            if line and not line.isspace():
                 cleaned_lines.append(line)
                 prev_empty = False
             elif not prev_empty:
@@ -480,8 +506,13 @@ class ScopeRefineFixer:
             **Code:**"""
         )
 
-    def fix_code_smart(self, section_id: str, code: str, error_msg: str, output_dir: Path) -> Optional[str]:
-        """Smart fix code, prioritize local fix, fallback to complete rewrite if failed"""
+    def fix_code_smart(
+        self, section_id: str, code: str, error_msg: str, output_dir: Path, request_func: Optional[Callable] = None
+    ) -> Optional[str]:
+        """
+        Smart fix code, prioritize local fix, fallback to complete rewrite if failed.
+        request_func replaces gpt_request_func for this fix, e.g. a caller's cancellation-checked, token-counting wrapper.
+        """
 
         # Analyze error
         error_info = self.analyzer.analyze_error(code, error_msg)
@@ -490,7 +521,7 @@ class ScopeRefineFixer:
 
             relevant_code = error_info.get("relevant_code_block")
             if relevant_code:
-                fixed_block = self._fix_code_block(section_id, relevant_code, error_msg, error_info)
+                fixed_block = self._fix_code_block(section_id, relevant_code, error_msg, error_info, request_func)
                 if fixed_block:
                     merged_code = self._merge_fixed_block(code, relevant_code, fixed_block, error_info)
                     if merged_code:
@@ -513,12 +544,19 @@ class ScopeRefineFixer:
             print("🔄 The error scope is large, directly use complete repair")
 
         print("⚠️ The smart repair failed, fallback to complete repair")
-        return self.fix_code_with_multi_stage_validation(section_id, code, error_msg, output_dir)
+        return self.fix_code_with_multi_stage_validation(section_id, code, error_msg, output_dir, request_func=request_func)
 
     def fix_code_with_multi_stage_validation(
-        self, section_id: str, current_code: str, error_msg: str, output_dir: Path, max_attempts: int = 3
+        self,
+        section_id: str,
+        current_code: str,
+        error_msg: str,
+        output_dir: Path,
+        max_attempts: int = 3,
+        request_func: Optional[Callable] = None,
     ) -> Optional[str]:
         """Multi-stage validation code repair"""
+        request = request_func or self.request_gpt
         logger.info(f"Start fixing the code errors for {section_id}")
 
         for attempt in range(1, max_attempts + 1):
@@ -526,7 +564,7 @@ class ScopeRefineFixer:
 
             try:
                 fix_prompt = self.generate_fix_prompt(section_id, current_code, error_msg, attempt)
-                response = self.request_gpt(fix_prompt, max_tokens=self.MAX_CODE_TOKEN_LENGTH)
+                response = request(fix_prompt, max_tokens=self.MAX_CODE_TOKEN_LENGTH)
                 response = get_completion_only(response)
 
                 if hasattr(response, "choices") and response.choices:
@@ -571,8 +609,11 @@ class ScopeRefineFixer:
         logger.error(f"{section_id} fix failed - Reached maximum attempts")
         return None
 
-    def _fix_code_block(self, section_id: str, code_block: str, error_msg: str, error_info: Dict) -> Optional[str]:
+    def _fix_code_block(
+        self, section_id: str, code_block: str, error_msg: str, error_info: Dict, request_func: Optional[Callable] = None
+    ) -> Optional[str]:
         """Fix the code block"""
+        request = request_func or self.request_gpt
         # Enhanced error analysis information
         error_type, error_category, suggestions = self.classify_error(error_msg)
         error_context = self.extract_error_context(error_msg)
@@ -613,7 +654,7 @@ class ScopeRefineFixer:
         """
 
         try:
-            response = self.request_gpt(prompt, max_tokens=self.MAX_CODE_TOKEN_LENGTH)
+            response = request(prompt, max_tokens=self.MAX_CODE_TOKEN_LENGTH)
             response = get_completion_only(response)
             if hasattr(response, "choices") and response.choices:
                 fixed_code = response.choices[0].message.content
@@ -685,10 +726,7 @@ class GridPositionExtractor:
 
     def __init__(self):
         # Match place_at_grid and place_in_area methods
-        self.grid_patterns = [
-            r'self\.place_at_grid\(\s*([^,]+),\s*[\'"]([A-F][1-6])[\'"](?:,\s*scale_factor=([0-9.]+))?\s*\)',
-            r'self\.place_in_area\(\s*([^,]+),\s*[\'"]([A-F][1-6])[\'"],\s*[\'"]([A-F][1-6])[\'"](?:,\s*scale_factor=([0-9.]+))?\s*\)',
-        ]
+        self.grid_patterns = [_PLACE_AT_GRID_RE, _PLACE_IN_AREA_RE]
 
     def extract_grid_positions(self, code: str) -> List[GridPosition]:
         """Extract all grid position information from the code"""
@@ -696,8 +734,12 @@ class GridPositionExtractor:
         lines = code.split("\n")
 
         for line_num, line in enumerate(lines, 1):
+            # Most lines place nothing: one substring test instead of two regex searches
+            if "self.place_" not in line:
+                continue
+
             # Check place_at_grid
-            match = re.search(self.grid_patterns[0], line)
+            match = self.grid_patterns[0].search(line)
             if match:
                 obj_name = match.group(1).strip()
                 grid_pos = match.group(2)
@@ -715,7 +757,7 @@ class GridPositionExtractor:
                 )
 
             # Check place_in_area
-            match = re.search(self.grid_patterns[1], line)
+            match = self.grid_patterns[1].search(line)
             if match:
                 obj_name = match.group(1).strip()
                 start_pos = match.group(2)
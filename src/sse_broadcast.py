@@ -0,0 +1,89 @@
+"""
+Progress Broadcast Channels for the Code2Video API server
+One asyncio-native channel per task: any number of SSE subscribers, a replay buffer of
+the last events for late joiners and Last-Event-ID resume, bounded per-subscriber
+buffers. Producers may publish from worker threads.
+"""
+
+import asyncio
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Set, Tuple
+
+# Events kept for replay to late joiners / reconnecting clients
+REPLAY_EVENTS = 100
+# Events buffered per subscriber before its oldest pending ones are dropped
+SUBSCRIBER_BUFFER = 256
+HEARTBEAT_SECONDS = 30
+
+_CLOSED = object()
+
+
+class BroadcastChannel:
+    def __init__(self, loop: asyncio.AbstractEventLoop, replay: int = REPLAY_EVENTS, buffer: int = SUBSCRIBER_BUFFER):
+        self.loop = loop
+        self.buffer = buffer
+        self.history: Deque[Tuple[int, Dict[str, Any]]] = deque(maxlen=replay)
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.next_id = 1
+        self.closed = False
+
+    def _call(self, callback, *args):
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            pass  # event loop already closed (server shutting down): nobody is listening
+
+    def publish(self, data: Dict[str, Any]):
+        """Thread-safe: may be called from generation worker threads"""
+        self._call(self._publish, data)
+
+    def close(self):
+        """Thread-safe: ends every subscriber's stream after the already published events"""
+        self._call(self._close)
+
+    def _offer(self, subscriber: asyncio.Queue, item):
+        if subscriber.full():
+            # Slow client: drop its oldest pending event rather than grow without bound
+            subscriber.get_nowait()
+        subscriber.put_nowait(item)
+
+    def _publish(self, data: Dict[str, Any]):
+        if self.closed:
+            return
+        event = (self.next_id, data)
+        self.next_id += 1
+        self.history.append(event)
+        for subscriber in self.subscribers:
+            self._offer(subscriber, event)
+
+    def _close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for subscriber in self.subscribers:
+            self._offer(subscriber, _CLOSED)
+
+    async def subscribe(self, last_event_id: Optional[int] = None) -> AsyncIterator[Optional[Tuple[int, Dict[str, Any]]]]:
+        """
+        Yield (event_id, data) pairs: buffered history newer than last_event_id (all of it
+        when None) then live events. Yields None as a heartbeat after HEARTBEAT_SECONDS of silence.
+        """
+        subscriber: asyncio.Queue = asyncio.Queue(maxsize=self.buffer)
+        replay = [event for event in self.history if last_event_id is None or event[0] > last_event_id]
+        self.subscribers.add(subscriber)
+        try:
+            for event in replay:
+                yield event
+            if self.closed:
+                return
+            while True:
+                try:
+                    item = await asyncio.wait_for(subscriber.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if item is _CLOSED:
+                    return
+                yield item
+        finally:
+            self.subscribers.discard(subscriber)
@@ -0,0 +1,155 @@
+"""
+Durable Task Store for the Code2Video API server
+SQLite (WAL mode) table of generation tasks that survives restarts, with indexed
+status/created_at lookups, pagination and TTL expiry.
+"""
+
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+
+TERMINAL_STATUSES = ("completed", "failed", "interrupted", "cancelled")
+ACTIVE_STATUSES = ("pending", "running")
+
+_COLUMNS = {
+    "task_id": "TEXT PRIMARY KEY",
+    "status": "TEXT NOT NULL",
+    "progress": "INTEGER NOT NULL DEFAULT 0",
+    "message": "TEXT NOT NULL DEFAULT ''",
+    "knowledge_point": "TEXT NOT NULL",
+    "api": "TEXT NOT NULL DEFAULT ''",
+    "use_tts": "INTEGER NOT NULL DEFAULT 1",
+    "tts_voice": "TEXT NOT NULL DEFAULT ''",
+    "created_at": "TEXT NOT NULL",
+    "created_ts": "REAL NOT NULL",
+    "updated_ts": "REAL NOT NULL",
+    "folder_path": "TEXT",
+    "video_path": "TEXT",
+    "video_url": "TEXT",
+    "error": "TEXT",
+    "sections_done": "INTEGER NOT NULL DEFAULT 0",
+    "total_sections": "INTEGER NOT NULL DEFAULT 7",
+    "prompt_tokens": "INTEGER NOT NULL DEFAULT 0",
+    "completion_tokens": "INTEGER NOT NULL DEFAULT 0",
+    "total_tokens": "INTEGER NOT NULL DEFAULT 0",
+    "attempts": "INTEGER NOT NULL DEFAULT 0",
+    "hls": "INTEGER NOT NULL DEFAULT 0",
+    "hls_url": "TEXT",
+    # JSON {section_id: {"index": playback position, "path": clip file}} of sections ready to watch
+    "clips": "TEXT NOT NULL DEFAULT '{}'",
+    # Normalized request (see result_cache.request_key): identical requests share one task
+    "request_key": "TEXT",
+    # Answered from the result cache instead of running the pipeline
+    "cached": "INTEGER NOT NULL DEFAULT 0",
+    # JSON list of attachment ids of the clients sharing this task (coalesced requests add theirs)
+    "subscribers": "TEXT NOT NULL DEFAULT '[]'",
+}
+
+
+class TaskStore:
+    """Thread-safe; one connection shared by the server's threads, serialized by a lock"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            columns = ", ".join(f"{name} {spec}" for name, spec in _COLUMNS.items())
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS tasks ({columns})")
+            # Databases created by an older server lack the newer columns
+            existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(tasks)")}
+            for name, spec in _COLUMNS.items():
+                if name not in existing:
+                    self._conn.execute(f"ALTER TABLE tasks ADD COLUMN {name} {spec}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_created ON tasks(created_ts)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_request_key ON tasks(request_key)")
+
+    def create(self, **fields) -> Dict[str, Any]:
+        now = time.time()
+        fields.setdefault("created_ts", now)
+        fields.setdefault("updated_ts", now)
+        names = ", ".join(fields)
+        placeholders = ", ".join("?" for _ in fields)
+        with self._lock:
+            self._conn.execute(f"INSERT INTO tasks ({names}) VALUES ({placeholders})", tuple(fields.values()))
+        return self.get(fields["task_id"])
+
+    def update(self, task_id: str, **fields):
+        unknown = set(fields) - set(_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown task fields: {sorted(unknown)}")
+        fields["updated_ts"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE tasks SET {assignments} WHERE task_id = ?", (*fields.values(), task_id))
+
+    def increment(self, task_id: str, field: str, amount: int = 1) -> int:
+        if field not in _COLUMNS:
+            raise ValueError(f"Unknown task field: {field}")
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE tasks SET {field} = {field} + ?, updated_ts = ? WHERE task_id = ?", (amount, time.time(), task_id)
+            )
+            row = self._conn.execute(f"SELECT {field} FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return row[0] if row else 0
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list(self, limit: int = 50, offset: int = 0, status: Optional[str] = None) -> Tuple[int, List[Dict[str, Any]]]:
+        """Newest first; returns (total matching, page)"""
+        where, params = ("WHERE status = ?", (status,)) if status else ("", ())
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM tasks {where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT * FROM tasks {where} ORDER BY created_ts DESC LIMIT ? OFFSET ?", (*params, limit, offset)
+            ).fetchall()
+        return total, [dict(row) for row in rows]
+
+    def with_status(self, *statuses: str) -> List[Dict[str, Any]]:
+        placeholders = ", ".join("?" for _ in statuses)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM tasks WHERE status IN ({placeholders}) ORDER BY created_ts", statuses
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def find_by_request(self, request_key: str, *statuses: str) -> Optional[Dict[str, Any]]:
+        """Newest task for a request key in one of the given statuses"""
+        placeholders = ", ".join("?" for _ in statuses)
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT * FROM tasks WHERE request_key = ? AND status IN ({placeholders}) ORDER BY created_ts DESC LIMIT 1",
+                (request_key, *statuses),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def expired(self, ttl_seconds: float) -> List[Dict[str, Any]]:
+        """Finished tasks created more than ttl_seconds ago"""
+        placeholders = ", ".join("?" for _ in TERMINAL_STATUSES)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM tasks WHERE status IN ({placeholders}) AND created_ts < ?",
+                (*TERMINAL_STATUSES, time.time() - ttl_seconds),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def delete(self, task_ids: List[str]):
+        if not task_ids:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM tasks WHERE task_id = ?", [(task_id,) for task_id in task_ids])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,166 @@
+"""
+Span Tracing for Code2Video
+Nested timing spans (LLM calls, manim and ffmpeg subprocesses, dry runs, TTS, file writes)
+collected per topic and written as a Chrome trace file (chrome://tracing, Perfetto).
+The active trace and parent span travel in a context variable: propagate() carries them
+into thread pools, remote_parent()/collect() into render worker processes, whose events
+come back with the job result. With no active trace, span() returns a shared no-op.
+"""
+
+import os
+import json
+import time
+import itertools
+import functools
+import threading
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+TRACE_FILENAME = "trace.json"
+
+# (span id, pid, tid) of a span, picklable so a worker process can parent its spans to it
+SpanRef = Tuple[str, int, int]
+
+_CURRENT: ContextVar[Optional[Tuple["Trace", Optional[SpanRef]]]] = ContextVar("code2video_trace", default=None)
+_NOOP = nullcontext()
+_SPAN_IDS = itertools.count(1)
+
+
+def _now_us() -> float:
+    # Wall clock so that spans from different processes line up on one timeline
+    return time.time_ns() / 1000
+
+
+class Trace:
+    """Thread-safe list of Chrome trace events for one topic"""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else None
+        self.events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._threads = set()
+
+    def add(self, event: Dict[str, Any]):
+        with self._lock:
+            key = (event["pid"], event["tid"])
+            if key not in self._threads:
+                self._threads.add(key)
+                self.events.append(
+                    {"ph": "M", "name": "thread_name", "pid": key[0], "tid": key[1], "args": {"name": threading.current_thread().name}}
+                )
+            self.events.append(event)
+
+    def extend(self, events: List[Dict[str, Any]]):
+        with self._lock:
+            self.events.extend(events)
+
+    def write(self) -> Optional[Path]:
+        if self.path is None:
+            return None
+        # Imported here: run_manifest's own writes are traced
+        from run_manifest import atomic_write_text
+
+        with self._lock:
+            data = {"traceEvents": list(self.events), "displayTimeUnit": "ms"}
+        atomic_write_text(self.path, json.dumps(data, ensure_ascii=False))
+        return self.path
+
+
+class _Span:
+    __slots__ = ("trace", "parent", "name", "args", "ref", "start", "token")
+
+    def __init__(self, trace: Trace, parent: Optional[SpanRef], name: str, args: Dict[str, Any]):
+        self.trace = trace
+        self.parent = parent
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        pid, tid = os.getpid(), threading.get_ident()
+        self.ref = (f"{pid:x}.{next(_SPAN_IDS)}", pid, tid)
+        self.token = _CURRENT.set((self.trace, self.ref))
+        self.start = _now_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = _now_us()
+        _CURRENT.reset(self.token)
+        span_id, pid, tid = self.ref
+        args = {k: str(v) for k, v in self.args.items()}
+        args["span_id"] = span_id
+        if self.parent is not None:
+            args["parent_id"] = self.parent[0]
+        if exc_type is not None:
+            args["error"] = exc_type.__name__
+        self.trace.add(
+            {"ph": "X", "name": self.name, "pid": pid, "tid": tid, "ts": self.start, "dur": end - self.start, "args": args}
+        )
+        if self.parent is not None and self.parent[1:] != (pid, tid):
+            # Parent lives on another thread or process: draw an arrow from it to this span
+            parent_id, parent_pid, parent_tid = self.parent
+            flow = {"name": "spawn", "cat": "flow", "id": span_id, "ts": self.start}
+            self.trace.extend(
+                [
+                    {**flow, "ph": "s", "pid": parent_pid, "tid": parent_tid},
+                    {**flow, "ph": "f", "bp": "e", "pid": pid, "tid": tid},
+                ]
+            )
+        return False
+
+
+def span(name: str, **args):
+    """Context manager timing a block as a child of the current span; a no-op when tracing is off"""
+    current = _CURRENT.get()
+    if current is None:
+        return _NOOP
+    return _Span(current[0], current[1], name, args)
+
+
+@contextmanager
+def activate(trace: Optional[Trace], parent: Optional[SpanRef] = None) -> Iterator[Optional[Trace]]:
+    """Make trace the current trace (and parent the current span) for the block; trace None does nothing"""
+    if trace is None:
+        yield None
+        return
+    token = _CURRENT.set((trace, parent))
+    try:
+        yield trace
+    finally:
+        _CURRENT.reset(token)
+
+
+def propagate(func: Callable) -> Callable:
+    """Bind func to the caller's trace and span, for running it on a pool thread"""
+    current = _CURRENT.get()
+    if current is None:
+        return func
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        token = _CURRENT.set(current)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _CURRENT.reset(token)
+
+    return run
+
+
+def remote_parent() -> Optional[SpanRef]:
+    """Current span for a job sent to another process (None when tracing is off)"""
+    current = _CURRENT.get()
+    return current[1] if current is not None and current[1] is not None else None
+
+
+def collect(parent: Optional[SpanRef]):
+    """In a worker process: gather spans under a remote parent into an in-memory Trace"""
+    return activate(Trace() if parent is not None else None, parent)
+
+
+def merge(events: List[Dict[str, Any]]):
+    """Add events collected by a worker process to the current trace"""
+    current = _CURRENT.get()
+    if current is not None and events:
+        current[0].extend(events)
@@ -5,12 +5,22 @@ Uses OpenAI TTS API to generate narration audio from lecture lines
 
 import os
 import json
+import time
+import shutil
+import unicodedata
+import asyncio
+import threading
 import subprocess
 import pathlib
-from typing import List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
-from openai import OpenAI
-from pydub import AudioSegment
+from openai import AsyncOpenAI, OpenAI
+
+import tracing
+from tracing import span
+from content_cache import ContentCache, hash_parts
+from media_probe import media_duration, media_durations
 
 
 # Load config
@@ -24,11 +34,54 @@ def get_tts_config(key: str, default=None):
     return os.getenv(f"TTS_{key}".upper(), _CFG.get("tts", {}).get(key, default))
 
 
+# Section narration is encoded once, straight into the codec the muxer copies into the MP4
+SECTION_AUDIO_SUFFIX = ".m4a"
+AUDIO_CODEC_ARGS = ["-c:a", "aac", "-b:a", "192k"]
+LINE_PAUSE_SECONDS = 0.5
+
+
+def normalize_tts_text(text: str) -> str:
+    """The text actually sent for synthesis: NFC-normalized, whitespace collapsed"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class RateLimiter:
+    """Spaces request starts at least 60 / requests_per_minute seconds apart, across threads (0 = unlimited)"""
+
+    def __init__(self, requests_per_minute: float = 0):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute and requests_per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Claim the next start slot; returns how long the caller has to wait for it"""
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+            return start - now
+
+    def wait(self):
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self):
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
 class TTSGenerator:
     """OpenAI TTS audio generator"""
     
     # Available voices: alloy, echo, fable, onyx, nova, shimmer
     VOICES = ["alloy", "echo", "fable", "onyx", "nova", "shimmer"]
+
+    # Shared line audio by content (None = every line is synthesized)
+    audio_cache: Optional[ContentCache] = None
     
     def __init__(
         self,
@@ -37,6 +90,10 @@ class TTSGenerator:
         model: str = "tts-1",
         voice: str = "nova",
         speed: float = 1.0,
+        max_concurrency: Optional[int] = None,
+        requests_per_minute: Optional[float] = None,
+        use_async: bool = False,
+        audio_cache: Optional[ContentCache] = None,
     ):
         """
         Initialize TTS generator
@@ -47,6 +104,10 @@ class TTSGenerator:
             model: TTS model ("tts-1" for standard, "tts-1-hd" for high quality)
             voice: Voice name (alloy, echo, fable, onyx, nova, shimmer)
             speed: Speech speed (0.25 to 4.0)
+            max_concurrency: Max TTS requests in flight across all sections (falls back to config or 4)
+            requests_per_minute: Max TTS request starts per minute, 0 = unlimited (falls back to config)
+            use_async: Synthesize a section's lines with the asyncio client instead of the thread pool
+            audio_cache: Cache of line audio keyed by text, voice, model and speed
         """
         self.api_key = api_key or get_tts_config("api_key") or _CFG.get("gpt41", {}).get("api_key")
         self.base_url = base_url or get_tts_config("base_url") or "https://api.openai.com/v1"
@@ -56,6 +117,104 @@ class TTSGenerator:
         
         # Initialize OpenAI client
         self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        self.use_async = use_async
+        self.async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url) if use_async else None
+        self._init_concurrency(max_concurrency, requests_per_minute)
+        self.audio_cache = audio_cache
+
+    def audio_cache_key(self, text: str, voice: Optional[str] = None) -> str:
+        """Everything that determines the synthesized audio of one line"""
+        return hash_parts("tts", normalize_tts_text(text), voice or self.voice, self.model, f"{float(self.speed):g}")
+
+    def _init_concurrency(self, max_concurrency: Optional[int] = None, requests_per_minute: Optional[float] = None):
+        """Request limits shared by every section synthesized with this generator"""
+        self.max_concurrency = max(1, int(max_concurrency or get_tts_config("max_concurrency", 4)))
+        self.rate_limiter = RateLimiter(float(requests_per_minute or get_tts_config("requests_per_minute", 0)))
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        # Sum of individual request durations: what the same requests would have taken one after another
+        self.synthesis_seconds = 0.0
+        self.requests = 0
+
+    def _line_pool(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="tts")
+            return self._pool
+
+    def _record_request(self, seconds: float):
+        with self._stats_lock:
+            self.synthesis_seconds += seconds
+            self.requests += 1
+
+    def _synthesize_line(self, text: str, output_path: str, voice: Optional[str]) -> str:
+        """One rate-limited request holding one of the max_concurrency slots"""
+        self.rate_limiter.wait()
+        with self._slots:
+            start = time.perf_counter()
+            try:
+                return self.generate_audio(text=text, output_path=output_path, voice=voice)
+            finally:
+                self._record_request(time.perf_counter() - start)
+
+    async def _synthesize_line_async(self, text: str, output_path: str, voice: Optional[str]) -> str:
+        voice = voice or self.voice
+        await self.rate_limiter.wait_async()
+        # The slots are shared with other sections' threads, so acquire off the event loop
+        await asyncio.to_thread(self._slots.acquire)
+        start = time.perf_counter()
+        try:
+            with span("tts", model=self.model, voice=voice, chars=len(text)):
+                response = await self.async_client.audio.speech.create(
+                    model=self.model,
+                    voice=voice,
+                    input=text,
+                    speed=self.speed,
+                    response_format="mp3",
+                )
+                await response.astream_to_file(output_path)
+            print(f"🔊 Audio generated: {output_path}")
+            return output_path
+        except Exception as e:
+            print(f"❌ TTS generation failed: {e}")
+            raise
+        finally:
+            self._slots.release()
+            self._record_request(time.perf_counter() - start)
+
+    async def _synthesize_lines_async(self, jobs: List[Tuple[str, str]], voice: Optional[str]) -> List[str]:
+        # Let every request finish (a cancelled slot acquire would leak the slot), then raise the first failure
+        results = await asyncio.gather(
+            *(self._synthesize_line_async(text, path, voice) for text, path in jobs), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return list(results)
+
+    def synthesize_lines(self, jobs: List[Tuple[str, str]], voice: Optional[str] = None) -> List[str]:
+        """
+        Synthesize (text, output_path) jobs concurrently, bounded by max_concurrency and the
+        rate limit; returns the output paths in job order and raises the first failure
+        """
+        if not jobs:
+            return []
+        if self.use_async and self.async_client is not None:
+            return asyncio.run(self._synthesize_lines_async(jobs, voice))
+        if len(jobs) == 1:
+            return [self._synthesize_line(jobs[0][0], jobs[0][1], voice)]
+        pool = self._line_pool()
+        futures = [pool.submit(tracing.propagate(self._synthesize_line), text, path, voice) for text, path in jobs]
+        return [future.result() for future in futures]
+
+    def close(self):
+        """Shut the line pool down (it is recreated on next use)"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
         
     def generate_audio(
         self,
@@ -80,15 +239,15 @@ class TTSGenerator:
         speed = speed or self.speed
         
         try:
-            response = self.client.audio.speech.create(
-                model=self.model,
-                voice=voice,
-                input=text,
-                speed=speed,
-                response_format="mp3",
-            )
-            
-            response.stream_to_file(output_path)
+            with span("tts", model=self.model, voice=voice, chars=len(text)):
+                response = self.client.audio.speech.create(
+                    model=self.model,
+                    voice=voice,
+                    input=text,
+                    speed=speed,
+                    response_format="mp3",
+                )
+                response.stream_to_file(output_path)
             print(f"🔊 Audio generated: {output_path}")
             return output_path
             
@@ -125,74 +284,80 @@ class TTSGenerator:
         audio_dir = output_dir / "audio"
         audio_dir.mkdir(exist_ok=True)
         
-        # Generate audio for each line
+        # Line audio comes from the cache by content (so edited lines are never reused stale);
+        # the rest is synthesized concurrently, each distinct text once, in line order
         line_audio_files = []
+        jobs = []
+        waiting: Dict[str, List[Path]] = {}
         for i, line in enumerate(lecture_lines):
+            text = normalize_tts_text(line)
             line_audio_path = audio_dir / f"{section_id}_line_{i+1}.mp3"
-            
-            if line_audio_path.exists():
-                print(f"📂 Found existing audio: {line_audio_path.name}")
-            else:
-                self.generate_audio(
-                    text=line.strip(),
-                    output_path=str(line_audio_path),
-                    voice=voice,
-                )
             line_audio_files.append(str(line_audio_path))
-        
-        # Combine line audios into section audio
-        section_audio_path = audio_dir / f"{section_id}_audio.mp3"
-        
-        if len(line_audio_files) == 1:
-            # Only one line, just copy/use it
-            import shutil
-            shutil.copy(line_audio_files[0], section_audio_path)
-        else:
-            # Combine multiple line audios with optional pauses
-            combined = AudioSegment.empty()
-            pause_duration = 500  # 500ms pause between lines
-            
-            for i, audio_file in enumerate(line_audio_files):
-                segment = AudioSegment.from_mp3(audio_file)
-                combined += segment
-                
-                # Add pause between lines (except after the last one)
-                if add_pauses and i < len(line_audio_files) - 1:
-                    combined += AudioSegment.silent(duration=pause_duration)
-            
-            combined.export(str(section_audio_path), format="mp3")
+            if self.audio_cache is None:
+                jobs.append((text, str(line_audio_path)))
+                continue
+            key = self.audio_cache_key(text, voice)
+            if key in waiting:
+                waiting[key].append(line_audio_path)
+            elif self.audio_cache.link_into(key, line_audio_path):
+                print(f"📂 Cached audio: {line_audio_path.name}")
+            else:
+                waiting[key] = [line_audio_path]
+                jobs.append((text, str(line_audio_path)))
+
+        for _, path in jobs:
+            # A previous run's file may be a hard link into the cache: never write through it
+            Path(path).unlink(missing_ok=True)
+        self.synthesize_lines(jobs, voice=voice)
+
+        for key, paths in waiting.items():
+            self.audio_cache.put(key, paths[0])
+            for path in paths:
+                if path != paths[0] and not self.audio_cache.link_into(key, path):
+                    # Evicted straight away (cache smaller than the file): keep a private copy
+                    shutil.copyfile(paths[0], path)
+            self.audio_cache.link_into(key, paths[0])
+
+        # Combine line audios into section audio: one ffmpeg pass (decode, pad, concat, one AAC encode)
+        section_audio_path = audio_dir / f"{section_id}_audio{SECTION_AUDIO_SUFFIX}"
+        with span("ffmpeg:audio_concat", section=section_id, lines=len(line_audio_files)):
+            concat_line_audio(line_audio_files, section_audio_path, LINE_PAUSE_SECONDS if add_pauses else 0)
         
         print(f"🎵 Section audio created: {section_audio_path}")
         return str(section_audio_path)
 
 
+def concat_line_audio(line_audio_files: List[str], output_path: Path, pause_seconds: float = LINE_PAUSE_SECONDS):
+    """
+    Concatenate line audio files with pause_seconds of silence between lines and encode the
+    result once as AAC, without intermediate PCM buffers or a second lossy encode
+    """
+    cmd = ["ffmpeg", "-y"]
+    for audio_file in line_audio_files:
+        cmd.extend(["-i", str(audio_file)])
+    last = len(line_audio_files) - 1
+    # Silence is appended to every line but the last; concat picks a common sample format/rate/layout
+    parts = [
+        f"[{i}:a]apad=pad_dur={pause_seconds}[a{i}]" if pause_seconds > 0 and i < last else f"[{i}:a]anull[a{i}]"
+        for i in range(len(line_audio_files))
+    ]
+    inputs = "".join(f"[a{i}]" for i in range(len(line_audio_files)))
+    parts.append(f"{inputs}concat=n={len(line_audio_files)}:v=0:a=1[out]")
+    cmd.extend(["-filter_complex", ";".join(parts), "-map", "[out]", *AUDIO_CODEC_ARGS, "-vn", str(output_path)])
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg audio concat failed: {result.stderr[-500:]}")
+    return str(output_path)
+
+
 def get_audio_duration(audio_path: str) -> float:
-    """Get duration of audio file in seconds"""
-    try:
-        audio = AudioSegment.from_mp3(audio_path)
-        return len(audio) / 1000.0  # Convert ms to seconds
-    except Exception as e:
-        print(f"⚠️ Failed to get audio duration: {e}")
-        return 0.0
+    """Get duration of audio file in seconds (from the MP3/M4A headers, no decode)"""
+    return media_duration(audio_path)
 
 
 def get_video_duration(video_path: str) -> float:
-    """Get duration of video file in seconds using ffprobe"""
-    try:
-        result = subprocess.run(
-            [
-                "ffprobe", "-v", "error",
-                "-show_entries", "format=duration",
-                "-of", "default=noprint_wrappers=1:nokey=1",
-                video_path
-            ],
-            capture_output=True,
-            text=True,
-        )
-        return float(result.stdout.strip())
-    except Exception as e:
-        print(f"⚠️ Failed to get video duration: {e}")
-        return 0.0
+    """Get duration of video file in seconds (from the MP4 headers, no ffprobe process)"""
+    return media_duration(video_path)
 
 
 def merge_video_audio(
@@ -215,10 +380,14 @@ def merge_video_audio(
     Returns:
         Path to output video file
     """
-    video_duration = get_video_duration(video_path)
-    audio_duration = get_audio_duration(audio_path)
+    # Both from file headers; anything unparsable shares one ffmpeg probe
+    durations = media_durations([video_path, audio_path])
+    video_duration, audio_duration = durations[str(video_path)], durations[str(audio_path)]
     
     print(f"📹 Video duration: {video_duration:.2f}s, Audio duration: {audio_duration:.2f}s")
+    if video_duration and audio_duration and abs(video_duration - audio_duration) > LINE_PAUSE_SECONDS:
+        # Scenes timed with sync_to_line match their narration; a gap means the code ignored the timing
+        print(f"⚠️ Narration and animation differ by {audio_duration - video_duration:+.2f}s (-shortest trims the longer one)")
     
     # Build ffmpeg command
     cmd = ["ffmpeg", "-y", "-i", video_path, "-i", audio_path]
@@ -250,17 +419,19 @@ def merge_video_audio(
     else:
         cmd.extend(["-map", "0:v", "-map", "1:a"])
     
-    # Output settings
+    # Output settings: section narration is already AAC, so it is copied unless filtered
+    audio_codec = ["-c:a", "copy"] if not filter_complex and Path(audio_path).suffix == SECTION_AUDIO_SUFFIX else AUDIO_CODEC_ARGS
     cmd.extend([
         "-c:v", "copy",  # Copy video stream without re-encoding
-        "-c:a", "aac",   # Encode audio as AAC
-        "-b:a", "192k",  # Audio bitrate
+        *audio_codec,
         "-shortest",     # End when shortest stream ends
+        "-movflags", "+faststart",  # moov atom first so playback can start while downloading
         output_path
     ])
     
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        with span("ffmpeg:mux", file=Path(output_path).name):
+            result = subprocess.run(cmd, capture_output=True, text=True)
         
         if result.returncode == 0:
             print(f"✅ Video with audio created: {output_path}")
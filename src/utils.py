@@ -2,17 +2,45 @@ import os
 import subprocess
 from typing import List
 from manim import *
-import multiprocessing
 import re
-import psutil
 from pathlib import Path
+from render_scheduler import resource_snapshot
+from capacity_planner import plan_capacity
+
+FENCE = "```"
+_PNG_PATH_RE = re.compile(r'["\']([^"\']+\.png)["\']')
+_TEACHING_SCENE_RE = re.compile(r"\s*class\s+TeachingScene\s*\(Scene\)\s*:")
+_CLASS_RE = re.compile(r"\s*class\s+\w+")
+_UNSAFE_NAME_RE = re.compile(r"[^A-Za-z0-9 _\-\{\}\[\]\+&=\u03C0]")
+_WHITESPACE_RUN_RE = re.compile(r"\s+")
+_LINE_DURATIONS_RE = re.compile(r"^LINE_DURATIONS = \[([^\]\n]*)\]\n\n?", re.MULTILINE)
+_TOP_LEVEL_CLASS_RE = re.compile(r"^class\s", re.MULTILINE)
 
 
 def extract_json_from_markdown(text):
-    # Match ```json ... ``` or ``` ... ```
-    match = re.search(r"```(?:json)?\s*(\{.*?\})\s*```", text, re.DOTALL)
-    if match:
-        return match.group(1)
+    """
+    The first fenced block (```json or ```) whose content is a {...} object, else text unchanged.
+    Scans fences with str.find instead of a lazy DOTALL regex, which backtracked over every "}"
+    of a long response.
+    """
+    start = text.find(FENCE)
+    while start != -1:
+        pos = start + 3
+        if text.startswith("json", pos):
+            pos += 4
+        while pos < len(text) and text[pos].isspace():
+            pos += 1
+        if pos < len(text) and text[pos] == "{":
+            # Shortest object: the first later fence preceded (modulo whitespace) by "}"
+            close = text.find(FENCE, pos + 1)
+            while close != -1:
+                end = close
+                while end > pos + 1 and text[end - 1].isspace():
+                    end -= 1
+                if text[end - 1] == "}" and end - 1 > pos:
+                    return text[pos:end]
+                close = text.find(FENCE, close + 1)
+        start = text.find(FENCE, start + 1)
     return text
 
 
@@ -29,15 +57,18 @@ def extract_answer_from_response(response):
 
 
 def fix_png_path(code_str: str, assets_dir: Path) -> str:
+    if ".png" not in code_str:
+        return code_str
     assets_dir = Path(assets_dir).resolve()
+    assets_root = str(assets_dir)
 
     def replacer(match):
         original_path = match.group(1)  # matched XXX.png
-        path_obj = Path(original_path)
-        # not an absolute path and is not under assets_dir
-        if not path_obj.is_absolute():
+        # not an absolute path and is not under assets_dir (the common case: plain string ops, no Path objects)
+        if not os.path.isabs(original_path):
             # concat to absolute path
-            return f'"{assets_dir / path_obj.name}"'
+            return f'"{os.path.join(assets_root, os.path.basename(original_path))}"'
+        path_obj = Path(original_path)
         # absolute path but not under assets_dir
         try:
             if assets_dir not in path_obj.parents:
@@ -46,41 +77,28 @@ def fix_png_path(code_str: str, assets_dir: Path) -> str:
             return f'"{assets_dir / path_obj.name}"'
         return match.group(0)  # keep original
 
-    pattern = r'["\']([^"\']+\.png)["\']'
-    return re.sub(pattern, replacer, code_str)
-
-
-def get_optimal_workers():
-    """Calculate the optimal number of parallel processes adaptively based on # CPU cores and load"""
-    try:
-        cpu_count = multiprocessing.cpu_count()
-    except NotImplementedError:
-        cpu_count = 6  # default
-
-    # Manim rendering is CPU-intensive; usually set workers to CPU cores or cores minus one
-    # reserve 1 core for system/other processes
-    optimal = max(1, cpu_count - 1)
+    return _PNG_PATH_RE.sub(replacer, code_str)
 
-    # If the machine is high-performance multicore (>16 cores),
-    # it's appropriate to limit the number of workers to avoid memory overflow
-    if optimal > 16:
-        optimal = 16
 
-    print(f"⚙️ Detected {cpu_count} cores, using {optimal} parallel processes")
-    return optimal
+def get_optimal_workers(quality: str = "draft"):
+    """Calculate the optimal number of parallel processes from CPU cores, available memory and cgroup limits"""
+    plan = plan_capacity(quality)
+    print(f"⚙️ Detected {plan.cpu_count} cores, using {plan.workers} parallel processes ({plan.reason})")
+    return plan.workers
 
 
 def monitor_system_resources():
     """Monitor system resource usage"""
     try:
-        cpu_percent = psutil.cpu_percent(interval=0.1)
-        memory = psutil.virtual_memory()
+        load = resource_snapshot(interval=0.1)
+        cpu_percent = load["cpu_percent"]
+        memory_percent = load["memory_percent"]
 
-        print(f"📊 Resource usage: CPU {cpu_percent:.1f}% | Memory {memory.percent:.1f}%")
+        print(f"📊 Resource usage: CPU {cpu_percent:.1f}% | Memory {memory_percent:.1f}%")
 
         if cpu_percent > 95:
             print("⚠️ CPU usage is high")
-        if memory.percent > 90:
+        if memory_percent > 90:
             print("⚠️ Memory usage is high")
 
         return True
@@ -95,7 +113,7 @@ def replace_base_class(code: str, new_class_def: str) -> str:
 
     # Find the start line of class TeachingScene(Scene):
     for i, line in enumerate(lines):
-        if re.match(r"^\s*class\s+TeachingScene\s*\(Scene\)\s*:", line):
+        if "TeachingScene" in line and _TEACHING_SCENE_RE.match(line):
             class_start = i
             break
 
@@ -118,7 +136,7 @@ def replace_base_class(code: str, new_class_def: str) -> str:
     else:
         # If TeachingScene does not exist, it should be inserted before the first class definition
         for i, line in enumerate(lines):
-            if re.match(r"^\s*class\s+\w+", line):
+            if "class" in line and _CLASS_RE.match(line):
                 insert_pos = i
                 break
         else:
@@ -160,6 +178,28 @@ def run_manim_script(filename: str, scene_name: str, output_dir: str = "videos")
     return output_path
 
 
+def read_line_timing(code: str) -> List[float]:
+    """The LINE_DURATIONS pinned into scene code by apply_line_timing (empty when absent)"""
+    match = _LINE_DURATIONS_RE.search(code)
+    if not match or not match.group(1).strip():
+        return []
+    return [float(value) for value in match.group(1).split(",")]
+
+
+def apply_line_timing(code: str, line_durations: List[float]) -> str:
+    """
+    Pin the narration time of each lecture line into the scene code as LINE_DURATIONS,
+    before the first class; TeachingScene.sync_to_line pads each block up to it
+    """
+    code = _LINE_DURATIONS_RE.sub("", code)
+    if not line_durations:
+        return code
+    constant = "LINE_DURATIONS = [" + ", ".join(f"{seconds:.2f}" for seconds in line_durations) + "]\n\n"
+    match = _TOP_LEVEL_CLASS_RE.search(code)
+    pos = match.start() if match else 0
+    return code[:pos] + constant + code[pos:]
+
+
 # Use ffmpeg to concatenate multiple mp4 files
 def stitch_videos(video_files: List[str], output_path: str = "final_output.mp4"):
     list_file = "video_list.txt"
@@ -175,11 +215,9 @@ def stitch_videos(video_files: List[str], output_path: str = "final_output.mp4")
 
 def topic_to_safe_name(knowledge_point):
     # Allowed: alphanumeric Spaces _ - { } [ ] . , + & ' =
-    SAFE_PATTERN = r"[^A-Za-z0-9 _\-\{\}\[\]\+&=\u03C0]"
-    safe_name = re.sub(SAFE_PATTERN, "", knowledge_point)
+    safe_name = _UNSAFE_NAME_RE.sub("", knowledge_point)
     # Replace consecutive spaces with a single underscore
-    safe_name = re.sub(r"\s+", "_", safe_name.strip())
-    return safe_name
+    return _WHITESPACE_RUN_RE.sub("_", safe_name.strip())
 
 
 def get_output_dir(idx, knowledge_point, base_dir, get_safe_name=False):